@@ -2,8 +2,29 @@ from .vagrant import Vagrant
 from .vagrant import default_machines_dir
 from .machine import Machine
 from .machine_factory import MachineFactory
+from .machine_pool import MachinePool
+from .box_prefetcher import BoxPrefetcher
+from .boot_scheduler import BootScheduler
+from .checkpoint import checkpoint_fixture
+from .machine_data import MachineData
+from .machine_index import MachineIndex
+from .machine_index import default_machine_index_path
+from .prune_policy import PrunePolicy
+from .lifecycle_policy import LifecyclePolicy
 from .shell import Shell
+from .file_lock import FileLock
 from .ssh import SSH
+from .async_shell import AsyncShell
+from .async_machine import AsyncMachine
+from .async_ssh import AsyncSSH
+from .async_vagrant import AsyncVagrant
+from .ssh_config_cache import SSHConfigCache
+from .status_index import StatusIndex
+from .ssh_pool import SSHPool
 from .runresult import RunResult
+from .transfer import TransferStats
+from .timing_report import TimingReport
 from .errors import RunResultError
 from .errors import MatchError
+from .errors import FromBoxesError
+from .errors import ShellError
@@ -0,0 +1,140 @@
+from . import async_ssh
+from . import parse
+
+
+class AsyncMachine(object):
+    """Asyncio wrapper for a Machine.
+
+    The wrapped Machine's caches are shared, so the two can be used
+    interchangeably.
+    """
+
+    def __init__(self, machine, shell):
+        """Create a new instance
+
+        :param machine: The Machine to wrap
+        :param shell: An AsyncShell for running commands
+        """
+        self.machine = machine
+        self.shell = shell
+
+    @property
+    def cwd(self):
+        return self.machine.cwd
+
+    async def status(self, timeout=None):
+        """Return the status of the Vagrant machine."""
+        status = self.machine._cached_status()
+
+        if status is None:
+            output = await self.shell.run(
+                cmd="vagrant status --machine-readable",
+                cwd=self.machine.cwd,
+                timeout=timeout,
+            )
+            status = self.machine._store_status(parse.to_status(output=output))
+
+        return status
+
+    async def snapshot_list(self, timeout=None):
+        """Return a list of snapshots for the Vagrant machine."""
+        if (await self.status(timeout=timeout)).not_created:
+            raise RuntimeError("Vagrant machine not created")
+
+        output = await self.shell.run(
+            cmd="vagrant snapshot list --machine-readable",
+            cwd=self.machine.cwd,
+            timeout=timeout,
+        )
+
+        return parse.to_snapshot_list(output=output)
+
+    async def snapshot_save(self, snapshot, timeout=None):
+        """Save a snapshot of the virtual machine"""
+        if not (await self.status(timeout=timeout)).running:
+            raise RuntimeError("Vagrant machine not running")
+
+        try:
+            await self.shell.run(
+                cmd="vagrant snapshot save {}".format(snapshot),
+                cwd=self.machine.cwd,
+                timeout=timeout,
+            )
+        finally:
+            self.machine.refresh()
+
+        self.machine.mark_clean(snapshot)
+
+    async def snapshot_restore(self, snapshot, timeout=None):
+        """Restore the machine to a saved snapshot"""
+        if not (await self.status(timeout=timeout)).running:
+            raise RuntimeError("Vagrant machine not running")
+
+        self.machine.mark_dirty()
+
+        try:
+            await self.shell.run(
+                cmd="vagrant snapshot restore {}".format(snapshot),
+                cwd=self.machine.cwd,
+                timeout=timeout,
+            )
+        finally:
+            self.machine.refresh()
+            self.machine._invalidate_ssh_config()
+
+        self.machine.mark_clean(snapshot)
+
+    async def ssh_config(self, timeout=None):
+        """Return the ssh-config of the vagrant machine."""
+        status = await self.status(timeout=timeout)
+
+        if status.not_created:
+            raise RuntimeError("Vagrant machine not created")
+        if not status.running:
+            raise RuntimeError("Vagrant machine not running")
+
+        ssh_config = self.machine._cached_ssh_config()
+
+        if ssh_config is None:
+            output = await self.shell.run(
+                cmd="vagrant ssh-config", cwd=self.machine.cwd, timeout=timeout
+            )
+            ssh_config = self.machine._store_ssh_config(
+                parse.to_ssh_config(output=output)
+            )
+
+        return ssh_config
+
+    async def ssh(self, timeout=None):
+        """Provide ssh access to the Vagrant machine.
+
+        :return: An AsyncSSH object
+        """
+        ssh_config = await self.ssh_config(timeout=timeout)
+
+        return async_ssh.AsyncSSH(ssh=self.machine._make_ssh(ssh_config=ssh_config))
+
+    async def up(self, timeout=None):
+        """Start the underlying vagrant machine."""
+        self.machine.mark_dirty()
+        await self._lifecycle(cmd="vagrant up", timeout=timeout)
+
+    async def resume(self, timeout=None):
+        """Resume a suspended vagrant machine."""
+        await self._lifecycle(cmd="vagrant resume", timeout=timeout)
+
+    async def suspend(self, timeout=None):
+        """Suspend the underlying vagrant machine."""
+        await self._lifecycle(cmd="vagrant suspend", timeout=timeout)
+
+    async def halt(self, timeout=None):
+        """Shut down the underlying vagrant machine."""
+        self.machine.mark_dirty()
+        await self._lifecycle(cmd="vagrant halt", timeout=timeout)
+
+    async def _lifecycle(self, cmd, timeout):
+        try:
+            await self.shell.run(cmd=cmd, cwd=self.machine.cwd, timeout=timeout)
+        finally:
+            self.machine.refresh()
+            self.machine._invalidate_ssh_config()
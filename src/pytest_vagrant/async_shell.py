@@ -0,0 +1,62 @@
+import asyncio
+import shlex
+import time
+
+from . import errors
+from . import runresult
+from . import shell
+from . import timing
+
+
+class AsyncShell(object):
+    """A shell object for running commands from an asyncio event loop.
+
+    Like Shell, commands are split into arguments and run without an
+    intermediate shell.
+    """
+
+    async def run(self, cmd, cwd, timeout=None):
+        """Run a command.
+
+        If the command times out or the calling task is cancelled, the
+        command and all its child processes are killed.
+
+        :param cmd: The command to run
+        :param cwd: The current working directory i.e. where the command will
+            run
+        :param timeout: Optional timeout in seconds
+        :return: The stdout of the command
+        :raises ShellError: If the command returns a non-zero return code
+        """
+        start = time.perf_counter()
+        process = await asyncio.create_subprocess_exec(
+            *shlex.split(cmd),
+            cwd=cwd,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            stdin=asyncio.subprocess.DEVNULL,
+            start_new_session=True,
+        )
+
+        try:
+            stdout, stderr = await asyncio.wait_for(process.communicate(), timeout)
+        except BaseException:
+            if process.returncode is None:
+                shell.kill_process(process)
+                await process.wait()
+            raise
+        finally:
+            timing.record(timing.shell_operation(cmd), time.perf_counter() - start)
+
+        result = runresult.RunResult(
+            command=cmd,
+            cwd=cwd,
+            stdout=stdout.decode("utf-8"),
+            stderr=stderr.decode("utf-8"),
+            returncode=process.returncode,
+        )
+
+        if result.returncode:
+            raise errors.ShellError(runresult=result)
+
+        return result.stdout
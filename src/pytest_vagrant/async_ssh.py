@@ -0,0 +1,104 @@
+import asyncio
+
+from . import errors
+
+
+class AsyncSSH(object):
+    """Asyncio wrapper for an SSH object.
+
+    Blocking work such as the SSH handshake runs in the event loop's
+    default executor, commands are awaited without blocking the loop.
+    """
+
+    def __init__(self, ssh):
+        """Create a new instance
+
+        :param ssh: The SSH object to wrap
+        """
+        self.ssh = ssh
+
+    async def open(self):
+        """Open the SSH connection."""
+        await asyncio.get_running_loop().run_in_executor(None, self.ssh.open)
+
+    async def close(self):
+        """Close the SSH connection."""
+        await asyncio.get_running_loop().run_in_executor(None, self.ssh.close)
+
+    def getcwd(self):
+        """Return the current working directory (cwd)."""
+        return self.ssh.getcwd()
+
+    async def run(self, command, cwd=None, timeout=None, check=True, read_only=False):
+        """Run command on remote.
+
+        If the command times out or the calling task is cancelled, the
+        remote command is killed and its channel closed.
+
+        :param command: The command to run
+        :param cwd: The working directory, defaults to the current working
+            directory
+        :param timeout: Optional timeout in seconds
+        :param check: If true raise RunResultError on a non-zero return code
+        :param read_only: Set to true for commands which do not change the
+            machine, see SSH.run()
+        :return: The RunResult of the command
+        """
+        loop = asyncio.get_running_loop()
+
+        process = await loop.run_in_executor(
+            None,
+            lambda: self.ssh.start(command=command, cwd=cwd, read_only=read_only),
+        )
+
+        try:
+            await asyncio.wait_for(self._wait(process), timeout)
+        except BaseException:
+            try:
+                await loop.run_in_executor(None, process.kill)
+            finally:
+                process.channel.close()
+            raise
+
+        result = process.result()
+
+        if check and result.returncode:
+            raise errors.RunResultError(runresult=result)
+
+        return result
+
+    async def _wait(self, process):
+        """Wait for a RemoteProcess without blocking the event loop"""
+        loop = asyncio.get_running_loop()
+        readable = asyncio.Event()
+
+        fd = process.channel.fileno()
+        loop.add_reader(fd, readable.set)
+
+        try:
+            while process.poll() is None:
+                readable.clear()
+
+                if process.channel.eof_received:
+                    # The channel stays readable after EOF while we wait
+                    # for the exit status
+                    await asyncio.sleep(0.01)
+                    continue
+
+                try:
+                    # The timeout covers the exit status which does not
+                    # make the channel readable
+                    await asyncio.wait_for(readable.wait(), 0.1)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            loop.remove_reader(fd)
+
+    async def __aenter__(self):
+        """Use AsyncSSH with the async with statement."""
+        await self.open()
+        return self
+
+    async def __aexit__(self, type, value, traceback):
+        """Use AsyncSSH with the async with statement."""
+        await self.close()
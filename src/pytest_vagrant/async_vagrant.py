@@ -0,0 +1,117 @@
+import asyncio
+import functools
+import subprocess
+
+from . import async_machine
+
+
+class AsyncVagrant(object):
+    """Asyncio wrapper for Vagrant.
+
+    Makes it possible to bring up several machines concurrently from one
+    event loop e.g.:
+
+        machines = await asyncio.gather(
+            async_vagrant.from_box(box="hashicorp/bionic64", name="server"),
+            async_vagrant.from_box(box="hashicorp/bionic64", name="client"),
+        )
+    """
+
+    def __init__(self, vagrant, shell):
+        """Create a new instance
+
+        :param vagrant: The Vagrant object to wrap
+        :param shell: An AsyncShell for running commands
+        """
+        self.vagrant = vagrant
+        self.shell = shell
+
+    async def from_box(self, box, name, box_version=None, reset=False, timeout=None):
+        """Create a machine from the specified box.
+
+        See Vagrant.from_box(...) for the parameters.
+
+        :param timeout: Optional timeout in seconds for each vagrant command
+        :return: An AsyncMachine object
+        """
+        if self.vagrant.lease_clones:
+            name = self.vagrant._lease(box=box, name=name, box_version=box_version)
+
+        if self.vagrant.box_prefetcher is not None:
+            await asyncio.get_running_loop().run_in_executor(
+                None,
+                functools.partial(
+                    self.vagrant.box_prefetcher.wait, box=box, version=box_version
+                ),
+            )
+
+        if self.vagrant._should_prune():
+            await self.prune(timeout=timeout)
+
+        try:
+            return await self._from_box(
+                box=box,
+                name=name,
+                box_version=box_version,
+                reset=reset,
+                timeout=timeout,
+            )
+        except subprocess.CalledProcessError as error:
+            if not self.vagrant._retry_on_error(error):
+                raise
+
+            await self.prune(timeout=timeout)
+
+            return await self._from_box(
+                box=box,
+                name=name,
+                box_version=box_version,
+                reset=reset,
+                timeout=timeout,
+            )
+
+    async def prune(self, timeout=None):
+        """Prune Vagrant's global state to ensure we have no stale info"""
+        await self.shell.run(
+            cmd="vagrant global-status --prune", cwd=None, timeout=timeout
+        )
+        self.vagrant.pruned = True
+
+    async def _from_box(self, box, name, box_version, reset, timeout):
+        machine = self.vagrant.machine_factory(box=box, name=name, version=box_version)
+
+        lock = self.vagrant._lock(machine)
+        await asyncio.get_running_loop().run_in_executor(None, lock.acquire)
+
+        try:
+            wrapped = await self._setup_machine(
+                machine=machine, reset=reset, timeout=timeout
+            )
+        finally:
+            lock.release()
+
+        with self.vagrant.machines_lock:
+            self.vagrant.machines[machine.cwd] = machine
+
+        return wrapped
+
+    async def _setup_machine(self, machine, reset, timeout):
+        self.vagrant._create_machine_dir(machine)
+
+        machine = async_machine.AsyncMachine(machine=machine, shell=self.shell)
+
+        status = await machine.status(timeout=timeout)
+
+        if status.saved or status.frozen:
+            await machine.resume(timeout=timeout)
+        elif not status.running:
+            await machine.up(timeout=timeout)
+
+        snapshots = await machine.snapshot_list(timeout=timeout)
+
+        if "reset" not in snapshots:
+            await machine.snapshot_save("reset", timeout=timeout)
+        elif reset and machine.machine.clean_snapshot() != "reset":
+            await machine.snapshot_restore("reset", timeout=timeout)
+
+        return machine
@@ -0,0 +1,144 @@
+import concurrent.futures
+import os
+import threading
+import warnings
+
+
+class BootScheduler(object):
+    """Prepares machines in the background before the tests need them.
+
+    While a test runs, the machine of the next test is booted (or restored
+    to its 'reset' snapshot) by calling Vagrant.from_box in a background
+    thread. When the next test calls from_box itself, it waits on the
+    machine's lock for the preparation to finish and finds the machine
+    ready.
+
+    The machines keep running until they are halted, suspended or
+    destroyed e.g. by the vagrant_pool or the lifecycle policy, so every
+    machine prepared or used counts against the memory and CPU budget and
+    a new machine is only prepared if it fits. When it does not fit, the
+    machines handed out by from_box which are no longer running are
+    released from the budget first. If it still does not fit a warning is
+    issued and only the machines already counted are prepared again.
+    """
+
+    def __init__(self, vagrant, max_memory=None, max_cpus=None):
+        """Create a new instance
+
+        :param vagrant: The Vagrant object used to prepare the machines
+        :param max_memory: Memory budget in MB for all machines of the
+            session, None for no limit
+        :param max_cpus: CPU budget for all machines of the session, None
+            defaults to the number of CPUs of this machine
+        """
+        if max_cpus is None:
+            max_cpus = os.cpu_count() or 1
+
+        self.vagrant = vagrant
+        self.max_memory = max_memory
+        self.max_cpus = max_cpus
+
+        # Per machine (box, name, version): (memory, cpus) of the machines
+        # prepared or in use
+        self.machines = {}
+        # Per machine: the future of the preparation
+        self.preparing = {}
+        # True once a machine was not prepared because of the budget
+        self.exhausted = False
+        self.lock = threading.Lock()
+
+        self.executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="boot_scheduler"
+        )
+
+    def use(self, box, name, box_version=None, memory=1024, cpus=1):
+        """Account for a machine used by the running test.
+
+        The test boots the machine itself, so it is counted even if it
+        exceeds the budget.
+        """
+        with self.lock:
+            self.machines[(box, name, box_version)] = (memory, cpus)
+
+    def prepare(self, box, name, box_version=None, reset=False, memory=1024, cpus=1):
+        """Prepare a machine in the background if it fits the budget.
+
+        See Vagrant.from_box for the parameters.
+
+        :param memory: Memory in MB used by the machine
+        :param cpus: Number of CPUs used by the machine
+        :return: A future completing when the machine is ready or None if
+            the machine is not prepared
+        """
+        key = (box, name, box_version)
+
+        with self.lock:
+            if key in self.preparing and not self.preparing[key].done():
+                return self.preparing[key]
+
+            if key not in self.machines and not self._fits(memory, cpus):
+                self._release_stopped()
+
+                if not self._fits(memory, cpus):
+                    self._warn_exhausted()
+                    return None
+
+            self.machines[key] = (memory, cpus)
+            self.preparing[key] = self.executor.submit(
+                self._prepare, box, name, box_version, reset
+            )
+
+            return self.preparing[key]
+
+    def close(self):
+        """Cancel the preparations which have not started and wait for the
+        others to finish.
+        """
+        with self.lock:
+            for preparing in self.preparing.values():
+                preparing.cancel()
+
+        self.executor.shutdown(wait=True)
+
+    def _fits(self, memory, cpus):
+        used_memory = sum(memory for memory, _ in self.machines.values())
+        used_cpus = sum(cpus for _, cpus in self.machines.values())
+
+        if self.max_memory is not None and used_memory + memory > self.max_memory:
+            return False
+
+        return used_cpus + cpus <= self.max_cpus
+
+    def _release_stopped(self):
+        """Remove the machines which are no longer running from the budget"""
+        for key in list(self.machines):
+            if key in self.preparing and not self.preparing[key].done():
+                continue
+
+            box, name, box_version = key
+            machine = self.vagrant.handed_out(
+                box=box, name=name, box_version=box_version
+            )
+
+            if machine is not None and not machine.status.running:
+                del self.machines[key]
+
+    def _warn_exhausted(self):
+        if self.exhausted:
+            return
+
+        self.exhausted = True
+        warnings.warn(
+            "The machine budget of the lookahead is exhausted, new machines "
+            "are no longer prepared in the background (max memory: {} MB, "
+            "max cpus: {})".format(self.max_memory, self.max_cpus)
+        )
+
+    def _prepare(self, box, name, box_version, reset):
+        try:
+            self.vagrant.from_box(
+                box=box, name=name, box_version=box_version, reset=reset
+            )
+        except Exception:
+            # The test calls from_box itself, which reports the error
+            pass
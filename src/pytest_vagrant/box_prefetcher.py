@@ -0,0 +1,129 @@
+import concurrent.futures
+import os
+import threading
+
+import slugify
+
+from . import file_lock
+from . import parse
+
+
+class BoxPrefetcher(object):
+    """Downloads Vagrant boxes in the background.
+
+    The first 'vagrant up' of a box blocks while Vagrant downloads it. The
+    prefetcher starts 'vagrant box add' for the boxes the tests need before
+    they run, and from_box only waits for the box it needs. Example:
+
+        prefetcher.prefetch([("hashicorp/bionic64", None)])
+        ...
+        prefetcher.wait(box="hashicorp/bionic64")
+    """
+
+    # The provider used by the Vagrantfiles we write
+    PROVIDER = "virtualbox"
+
+    def __init__(self, shell, lock_dir, workers=2):
+        """Create a new instance
+
+        :param shell: A Shell object for running commands, the commands
+            still running are killed by close()
+        :param lock_dir: Directory for the lock files preventing several
+            processes e.g. pytest-xdist workers from adding the same box
+        :param workers: Maximum number of boxes downloaded at the same time
+        """
+        self.shell = shell
+        self.lock_dir = lock_dir
+
+        # Per (box, version): the future of the download
+        self.downloads = {}
+        self.lock = threading.Lock()
+
+        self.executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="box_prefetcher"
+        )
+
+    def prefetch(self, boxes):
+        """Start downloading the boxes which are not installed.
+
+        :param boxes: Iterable of (box, version) tuples, version may be
+            None for any version
+        """
+        with self.lock:
+            boxes = set(boxes) - set(self.downloads)
+
+        if not boxes:
+            return
+
+        installed = self.installed()
+
+        with self.lock:
+            for box, version in sorted(boxes, key=str):
+                if _is_installed(box=box, version=version, installed=installed):
+                    continue
+
+                self.downloads[(box, version)] = self.executor.submit(
+                    self._add, box, version
+                )
+
+    def wait(self, box, version=None):
+        """Wait until the box is downloaded, if it is being prefetched.
+
+        :raises: The error of 'vagrant box add' if the download failed
+        """
+        with self.lock:
+            download = self.downloads.get((box, version))
+
+            # Any version of the box will do if no version was prefetched
+            if download is None and version is not None:
+                download = self.downloads.get((box, None))
+
+        if download is not None:
+            download.result()
+
+    def installed(self):
+        """Return the set of (box, version) tuples installed for PROVIDER"""
+        output = self.shell.run(cmd="vagrant box list --machine-readable", cwd=None)
+
+        return {
+            (box, version)
+            for box, provider, version in parse.to_box_list(output=output)
+            if provider == BoxPrefetcher.PROVIDER
+        }
+
+    def close(self):
+        """Cancel the downloads which have not started and kill the running
+        ones, the tests needing them are done.
+        """
+        with self.lock:
+            for download in self.downloads.values():
+                download.cancel()
+
+        self.shell.kill()
+        self.executor.shutdown(wait=False)
+
+    def _add(self, box, version):
+        """Add the box unless another process added it while we waited"""
+        os.makedirs(self.lock_dir, exist_ok=True)
+
+        text = box if version is None else box + "_" + version
+        path = os.path.join(
+            self.lock_dir, slugify.slugify(text=text, separator="_") + ".box.lock"
+        )
+
+        with file_lock.FileLock(path=path):
+            if _is_installed(box=box, version=version, installed=self.installed()):
+                return
+
+            cmd = "vagrant box add {} --provider {}".format(box, BoxPrefetcher.PROVIDER)
+            if version is not None:
+                cmd += " --box-version {}".format(version)
+
+            self.shell.run(cmd=cmd, cwd=None)
+
+
+def _is_installed(box, version, installed):
+    if version is None:
+        return any(name == box for name, _ in installed)
+
+    return (box, version) in installed
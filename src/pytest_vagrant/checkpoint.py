@@ -0,0 +1,40 @@
+import pytest
+
+
+def checkpoint_fixture(
+    name, setup=None, base="reset", machine="machine", scope="module"
+):
+    """Create a pytest fixture restoring a machine to a checkpoint.
+
+    The fixture scope decides how often the checkpoint is restored e.g.
+    once per module or before every test. Since resetting a clean machine
+    is a no-op, tests which only read from the machine share the restore.
+    Example for a conftest.py:
+
+        @pytest.fixture(scope="session")
+        def machine(vagrant):
+            return vagrant.from_box(box="hashicorp/bionic64", name="build")
+
+        toolchain = pytest_vagrant.checkpoint_fixture(
+            "toolchain", setup=install_toolchain, scope="module")
+
+        def test_build(toolchain):
+            with toolchain.ssh() as ssh:
+                ssh.run("make")
+
+    :param name: The name of the checkpoint
+    :param setup: Callable invoked with the machine to set up the checkpoint
+    :param base: The checkpoint the new one builds on, see Machine.checkpoint()
+    :param machine: Name of the fixture providing the Machine, this can also
+        be another checkpoint fixture
+    :param scope: The scope of the fixture
+    :return: The fixture function, it provides the Machine
+    """
+
+    @pytest.fixture(scope=scope)
+    def fixture(request):
+        checkpoint_machine = request.getfixturevalue(machine)
+        checkpoint_machine.checkpoint(name=name, setup=setup, base=base)
+        return checkpoint_machine
+
+    return fixture
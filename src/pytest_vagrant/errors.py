@@ -1,3 +1,6 @@
+import subprocess
+
+
 class RunResultError(Exception):
     """Exception thrown when running a command fails"""
 
@@ -16,3 +19,47 @@ class MatchError(Exception):
         message += " in:\n" + output
 
         super(MatchError, self).__init__(message)
+
+
+class FromBoxesError(Exception):
+    """Exception thrown when some machines in Vagrant.from_boxes(...) fail"""
+
+    def __init__(self, machines, failures):
+        """Create a new instance
+
+        :param machines: List with the created machines, None where the
+            machine failed
+        :param failures: List of (index, exception) tuples for the machines
+            that failed
+        """
+
+        message = "Failed to create {} of {} machines:".format(
+            len(failures), len(machines)
+        )
+
+        for index, error in failures:
+            message += "\n  [{}] {}".format(index, error)
+
+        super(FromBoxesError, self).__init__(message)
+        self.machines = machines
+        self.failures = failures
+
+
+class ShellError(subprocess.CalledProcessError):
+    """Exception thrown when a local command fails.
+
+    A subprocess.CalledProcessError, so existing handlers keep working,
+    which also carries the RunResult with the captured stderr.
+    """
+
+    def __init__(self, runresult):
+        super(ShellError, self).__init__(
+            returncode=runresult.returncode,
+            cmd=runresult.command,
+            output=runresult.stdout,
+            stderr=runresult.stderr,
+        )
+        self.runresult = runresult
+
+    def __str__(self):
+        return str(self.runresult)
@@ -0,0 +1,95 @@
+import os
+import time
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None
+    import msvcrt
+
+
+class FileLock(object):
+    """An exclusive lock on a file shared between processes.
+
+    Used to coordinate e.g. pytest-xdist workers operating on the same
+    machines directory. The lock is released automatically by the
+    operating system if the process dies.
+    """
+
+    def __init__(self, path):
+        """Create a new instance
+
+        :param path: Path to the lock file, it is created if needed
+        """
+        self.path = path
+        self.fd = None
+
+    def acquire(self, blocking=True):
+        """Acquire the lock
+
+        :param blocking: If false return immediately if the lock is held
+            by someone else
+        :return: True if the lock was acquired
+        """
+        assert self.fd is None
+
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+
+        try:
+            locked = self._lock(fd=fd, blocking=blocking)
+        except Exception:
+            os.close(fd)
+            raise
+
+        if not locked:
+            os.close(fd)
+            return False
+
+        self.fd = fd
+        return True
+
+    def release(self):
+        """Release the lock"""
+        assert self.fd is not None
+
+        try:
+            if fcntl is not None:
+                fcntl.flock(self.fd, fcntl.LOCK_UN)
+            else:
+                os.lseek(self.fd, 0, os.SEEK_SET)
+                msvcrt.locking(self.fd, msvcrt.LK_UNLCK, 1)
+        finally:
+            os.close(self.fd)
+            self.fd = None
+
+    @property
+    def locked(self):
+        """True if we hold the lock"""
+        return self.fd is not None
+
+    def _lock(self, fd, blocking):
+        if fcntl is not None:
+            flags = fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB
+            try:
+                fcntl.flock(fd, flags)
+            except (BlockingIOError, PermissionError):
+                return False
+            return True
+
+        while True:
+            try:
+                msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+                return True
+            except OSError:
+                if not blocking:
+                    return False
+                time.sleep(0.1)
+
+    def __enter__(self):
+        """Use FileLock with the with statement."""
+        self.acquire()
+        return self
+
+    def __exit__(self, type, value, traceback):
+        """Use FileLock with the with statement."""
+        self.release()
@@ -1,5 +1,363 @@
+import subprocess
+import warnings
+
 import pytest
 import pytest_vagrant
+from pytest_vagrant import machine_affinity
+
+# Key used to store the MachinePool statistics for the terminal summary
+POOL_STATS = pytest.StashKey()
+
+# Key used to store the TimingReport collecting the operation timings
+TIMING_REPORT = pytest.StashKey()
+
+# Key used to store the BoxPrefetcher downloading the boxes of the marked
+# tests
+BOX_PREFETCHER = pytest.StashKey()
+
+# Key used to store the BootScheduler preparing the machine of the next test
+BOOT_SCHEDULER = pytest.StashKey()
+
+# Key used to store the next test on a test, for the lookahead once the test
+# is set up
+NEXT_ITEM = pytest.StashKey()
+
+# Key used to store the estimated snapshot restores before and after
+# grouping the tests by machine
+AFFINITY_STATS = pytest.StashKey()
+
+
+def pytest_addoption(parser):
+    group = parser.getgroup("vagrant")
+    group.addoption(
+        "--vagrant-disk-state",
+        action="store_true",
+        default=False,
+        help="Read machine state from Vagrant's on-disk data when possible "
+        "instead of running the vagrant command line",
+    )
+    group.addoption(
+        "--vagrant-global-status",
+        action="store_true",
+        default=False,
+        help="Look up the status of all machines with a single 'vagrant "
+        "global-status' instead of running 'vagrant status' per machine",
+    )
+    group.addoption(
+        "--vagrant-prune",
+        action="store",
+        default=pytest_vagrant.PrunePolicy.ONCE,
+        choices=pytest_vagrant.PrunePolicy.POLICIES,
+        help="When to run 'vagrant global-status --prune' (default: once)",
+    )
+    group.addoption(
+        "--vagrant-lease-clones",
+        action="store_true",
+        default=False,
+        help="Give each test session (e.g. each pytest-xdist worker) its own "
+        "numbered clone of every machine instead of sharing it",
+    )
+    group.addoption(
+        "--vagrant-lifecycle",
+        action="store",
+        default=pytest_vagrant.LifecyclePolicy.KEEP,
+        choices=pytest_vagrant.LifecyclePolicy.POLICIES,
+        help="What to do with the machines at the end of the session "
+        "(default: keep)",
+    )
+    group.addoption(
+        "--vagrant-pool-size",
+        action="store",
+        type=int,
+        default=1,
+        help="Number of machines per box kept by the vagrant_pool fixture",
+    )
+    group.addoption(
+        "--vagrant-pool-idle-timeout",
+        action="store",
+        type=float,
+        default=None,
+        help="Seconds after which idle machines in the vagrant_pool are halted",
+    )
+    group.addoption(
+        "--vagrant-command-timeout",
+        action="store",
+        type=float,
+        default=None,
+        help="Seconds after which a vagrant command is killed e.g. a hung "
+        "'vagrant up' (default: no timeout)",
+    )
+    group.addoption(
+        "--vagrant-prefetch-workers",
+        action="store",
+        type=int,
+        default=2,
+        help="Number of boxes of @pytest.mark.vagrant tests downloaded at the "
+        "same time before the tests run, 0 disables prefetching (default: 2)",
+    )
+    group.addoption(
+        "--vagrant-lookahead",
+        action="store_true",
+        default=False,
+        help="Boot the machine of the next @pytest.mark.vagrant test in the "
+        "background while the current test runs, if it has not been handed "
+        "out yet",
+    )
+    group.addoption(
+        "--vagrant-max-memory",
+        action="store",
+        type=int,
+        default=None,
+        metavar="MB",
+        help="Memory budget for the machines prepared by --vagrant-lookahead, "
+        "counting the machines running in the session (default: no limit)",
+    )
+    group.addoption(
+        "--vagrant-max-cpus",
+        action="store",
+        type=int,
+        default=None,
+        help="CPU budget for the machines prepared by --vagrant-lookahead, "
+        "counting the machines running in the session (default: the number "
+        "of CPUs)",
+    )
+    group.addoption(
+        "--vagrant-group-machines",
+        action="store_true",
+        default=False,
+        help="Reorder the @pytest.mark.vagrant tests within their module or "
+        "class so tests using the same machine run back to back, the ones "
+        "asking for a reset first. Reports the estimated snapshot restores "
+        "saved, not the boots",
+    )
+    group.addoption(
+        "--vagrant-timings",
+        action="store_true",
+        default=False,
+        help="Print a summary of the time spent in vagrant and ssh operations",
+    )
+    group.addoption(
+        "--vagrant-timings-report",
+        action="store",
+        default=None,
+        metavar="PATH",
+        help="Write the timing of every vagrant and ssh operation to a JSON "
+        "file (or CSV if PATH ends with .csv)",
+    )
+
+
+def pytest_configure(config):
+    config.addinivalue_line(
+        "markers",
+        "vagrant(box, version=None, name='pytest_vagrant', reset=False, "
+        "memory=1024, cpus=1): the test uses this machine, boxes which are "
+        "not installed are downloaded before the tests run and with "
+        "--vagrant-lookahead the machine is prepared while the previous test "
+        "runs",
+    )
+
+    if not (
+        config.getoption("vagrant_timings")
+        or config.getoption("vagrant_timings_report")
+    ):
+        return
+
+    report = pytest_vagrant.TimingReport()
+    pytest_vagrant.timing.add_listener(report)
+    config.stash[TIMING_REPORT] = report
+
+
+def pytest_unconfigure(config):
+    box_prefetcher = config.stash.get(BOX_PREFETCHER, None)
+
+    if box_prefetcher is not None:
+        box_prefetcher.close()
+
+    report = config.stash.get(TIMING_REPORT, None)
+
+    if report is None:
+        return
+
+    pytest_vagrant.timing.remove_listener(report)
+
+    path = config.getoption("vagrant_timings_report")
+    if path:
+        report.write(path)
+
+
+# Run after the tests deselected by e.g. -k or -m are removed
+@pytest.hookimpl(trylast=True)
+def pytest_collection_modifyitems(session, config, items):
+    if config.getoption("vagrant_group_machines"):
+        before = machine_affinity.estimate(
+            items=items, requirements=machine_requirements
+        )
+        # Grouped within the module or class of the tests, so their
+        # fixtures are not set up again
+        items[:] = machine_affinity.group_by_machine(
+            items=items,
+            requirements=machine_requirements,
+            scope=lambda item: item.parent,
+        )
+        after = machine_affinity.estimate(
+            items=items, requirements=machine_requirements
+        )
+        config.stash[AFFINITY_STATS] = (before, after)
+
+    workers = config.getoption("vagrant_prefetch_workers")
+
+    if not workers or config.getoption("collectonly"):
+        return
+
+    boxes = marked_boxes(items)
+
+    if not boxes:
+        return
+
+    box_prefetcher = pytest_vagrant.BoxPrefetcher(
+        shell=pytest_vagrant.Shell(),
+        lock_dir=pytest_vagrant.default_machines_dir(),
+        workers=workers,
+    )
+    config.stash[BOX_PREFETCHER] = box_prefetcher
+
+    try:
+        box_prefetcher.prefetch(boxes)
+    except (OSError, subprocess.CalledProcessError) as error:
+        # The tests fail with a better error if vagrant is not usable
+        warnings.warn(
+            pytest.PytestWarning("Prefetching vagrant boxes failed: {}".format(error))
+        )
+
+
+def marked_boxes(items):
+    """Return the set of (box, version) tuples of the vagrant markers"""
+    return {
+        (requirement["box"], requirement["box_version"])
+        for item in items
+        for requirement in machine_requirements(item)
+    }
+
+
+def machine_requirements(item):
+    """Return the machines declared by the vagrant markers of a test.
+
+    :return: A list of dicts with the box, name, box_version, reset, memory
+        and cpus of each machine
+    """
+    requirements = []
+
+    for marker in item.iter_markers(name="vagrant"):
+        box = marker.kwargs.get("box", marker.args[0] if marker.args else None)
+
+        if box is None:
+            raise pytest.UsageError(
+                "{}: the vagrant marker needs a box".format(item.nodeid)
+            )
+
+        requirements.append(
+            {
+                "box": box,
+                "name": marker.kwargs.get("name", "pytest_vagrant"),
+                "box_version": marker.kwargs.get("version"),
+                "reset": marker.kwargs.get("reset", False),
+                "memory": marker.kwargs.get("memory", 1024),
+                "cpus": marker.kwargs.get("cpus", 1),
+            }
+        )
+
+    return requirements
+
+
+def _machine(requirement):
+    return (requirement["box"], requirement["name"], requirement["box_version"])
+
+
+def _lookahead(item, nextitem):
+    """Prepare the machines of the next test while this one runs"""
+    boot_scheduler = item.config.stash.get(BOOT_SCHEDULER, None)
+
+    if boot_scheduler is None:
+        return
+
+    current = machine_requirements(item)
+
+    for requirement in current:
+        boot_scheduler.use(
+            box=requirement["box"],
+            name=requirement["name"],
+            box_version=requirement["box_version"],
+            memory=requirement["memory"],
+            cpus=requirement["cpus"],
+        )
+
+    if nextitem is None:
+        return
+
+    # The machines of the running test are busy. The test may also use
+    # machines it does not declare, so the machines handed out so far are
+    # left alone as well.
+    busy = {_machine(requirement) for requirement in current}
+
+    for requirement in machine_requirements(nextitem):
+        if _machine(requirement) in busy:
+            continue
+
+        handed_out = boot_scheduler.vagrant.handed_out(
+            box=requirement["box"],
+            name=requirement["name"],
+            box_version=requirement["box_version"],
+        )
+
+        if handed_out is not None:
+            continue
+
+        boot_scheduler.prepare(**requirement)
+
+
+@pytest.hookimpl(hookwrapper=True)
+def pytest_runtest_protocol(item, nextitem):
+    report = item.config.stash.get(TIMING_REPORT, None)
+
+    if report is not None:
+        report.test = item.nodeid
+
+    item.stash[NEXT_ITEM] = nextitem
+
+    yield
+
+    if report is not None:
+        report.test = None
+        report.when = None
+
+
+@pytest.hookimpl(hookwrapper=True)
+def pytest_runtest_setup(item):
+    _set_timing_phase(item, "setup")
+    yield
+
+    # After the setup the vagrant fixture, and with it the BootScheduler,
+    # exists and the test's own machines are handed out
+    _lookahead(item=item, nextitem=item.stash.get(NEXT_ITEM, None))
+
+
+@pytest.hookimpl(hookwrapper=True)
+def pytest_runtest_call(item):
+    _set_timing_phase(item, "call")
+    yield
+
+
+@pytest.hookimpl(hookwrapper=True)
+def pytest_runtest_teardown(item, nextitem):
+    _set_timing_phase(item, "teardown")
+    yield
+
+
+def _set_timing_phase(item, when):
+    report = item.config.stash.get(TIMING_REPORT, None)
+
+    if report is not None:
+        report.when = when
 
 
 @pytest.fixture(scope="session")
@@ -8,11 +366,134 @@ def vagrant(request):
     tests. See the Vagrant class for more information.
     """
 
-    shell = pytest_vagrant.Shell()
+    shell = pytest_vagrant.Shell(
+        timeout=request.config.getoption("vagrant_command_timeout")
+    )
     machines_dir = pytest_vagrant.default_machines_dir()
 
+    machine_index = None
+    if request.config.getoption("vagrant_disk_state"):
+        machine_index = pytest_vagrant.MachineIndex(
+            path=pytest_vagrant.default_machine_index_path()
+        )
+
+    status_index = None
+    if request.config.getoption("vagrant_global_status"):
+        status_index = pytest_vagrant.StatusIndex(shell=shell)
+
+    ssh_pool = pytest_vagrant.SSHPool()
+
     machine_factory = pytest_vagrant.MachineFactory(
-        shell=shell, machines_dir=machines_dir, ssh_factory=pytest_vagrant.SSH
+        shell=shell,
+        machines_dir=machines_dir,
+        ssh_factory=pytest_vagrant.SSH,
+        machine_index=machine_index,
+        ssh_pool=ssh_pool,
+        status_index=status_index,
     )
 
-    return pytest_vagrant.Vagrant(machine_factory=machine_factory, shell=shell)
+    lease_clones = request.config.getoption("vagrant_lease_clones")
+    lifecycle_policy = request.config.getoption("vagrant_lifecycle")
+
+    # pytest-xdist workers share the machines unless they lease clones, so
+    # a worker must not shut them down while others are using them
+    if hasattr(request.config, "workerinput") and not lease_clones:
+        lifecycle_policy = pytest_vagrant.LifecyclePolicy.KEEP
+
+    vagrant = pytest_vagrant.Vagrant(
+        machine_factory=machine_factory,
+        shell=shell,
+        machine_index=machine_index,
+        prune_policy=request.config.getoption("vagrant_prune"),
+        lease_clones=lease_clones,
+        lifecycle_policy=lifecycle_policy,
+        status_index=status_index,
+        box_prefetcher=request.config.stash.get(BOX_PREFETCHER, None),
+    )
+
+    boot_scheduler = None
+    if request.config.getoption("vagrant_lookahead"):
+        boot_scheduler = pytest_vagrant.BootScheduler(
+            vagrant=vagrant,
+            max_memory=request.config.getoption("vagrant_max_memory"),
+            max_cpus=request.config.getoption("vagrant_max_cpus"),
+        )
+        request.config.stash[BOOT_SCHEDULER] = boot_scheduler
+
+    yield vagrant
+
+    if boot_scheduler is not None:
+        del request.config.stash[BOOT_SCHEDULER]
+        boot_scheduler.close()
+
+    ssh_pool.close()
+
+    try:
+        vagrant.shutdown()
+    finally:
+        vagrant.release()
+        shell.close()
+
+
+@pytest.fixture(scope="session")
+def async_vagrant(vagrant):
+    """Creates an AsyncVagrant object sharing the state of the vagrant
+    fixture. See the AsyncVagrant class for more information.
+    """
+
+    return pytest_vagrant.AsyncVagrant(
+        vagrant=vagrant, shell=pytest_vagrant.AsyncShell()
+    )
+
+
+@pytest.fixture(scope="session")
+def vagrant_pool(request, vagrant):
+    """Creates a MachinePool sharing the state of the vagrant fixture. See
+    the MachinePool class for more information.
+    """
+
+    pool = pytest_vagrant.MachinePool(
+        vagrant=vagrant,
+        size=request.config.getoption("vagrant_pool_size"),
+        idle_timeout=request.config.getoption("vagrant_pool_idle_timeout"),
+    )
+
+    yield pool
+
+    pool.close()
+    request.config.stash[POOL_STATS] = pool.stats()
+
+
+def pytest_terminal_summary(terminalreporter, exitstatus, config):
+    stats = config.stash.get(POOL_STATS, None)
+
+    if stats is not None and stats["leases"]:
+        terminalreporter.write_sep("=", "vagrant pool")
+        terminalreporter.write_line(
+            "{leases} leases, waited {total:.1f} s in total "
+            "(mean {mean:.2f} s, max {max:.2f} s)".format(**stats)
+        )
+
+        if stats["restore_failures"]:
+            terminalreporter.write_line(
+                "{restore_failures} background restores failed, the machines "
+                "were set up again".format(**stats)
+            )
+
+    affinity = config.stash.get(AFFINITY_STATS, None)
+
+    if affinity is not None:
+        before, after = affinity
+        terminalreporter.write_sep("=", "vagrant machine grouping")
+        terminalreporter.write_line(
+            "estimated snapshot restores {} -> {} (saved {} restores)".format(
+                before, after, before - after
+            )
+        )
+
+    report = config.stash.get(TIMING_REPORT, None)
+
+    if report is not None and config.getoption("vagrant_timings"):
+        terminalreporter.write_sep("=", "vagrant timings")
+        for line in report.summary():
+            terminalreporter.write_line(line)
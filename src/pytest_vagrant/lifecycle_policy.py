@@ -0,0 +1,13 @@
+class LifecyclePolicy(object):
+    """Controls what happens to the machines at the end of a session.
+
+    Suspending a machine is much faster to undo than a cold boot, while
+    halting or destroying frees the host's resources.
+    """
+
+    KEEP = "keep"  # Leave the machines running
+    SUSPEND = "suspend"  # vagrant suspend
+    HALT = "halt"  # vagrant halt
+    DESTROY = "destroy"  # vagrant destroy
+
+    POLICIES = [KEEP, SUSPEND, HALT, DESTROY]
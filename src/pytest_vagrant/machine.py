@@ -1,10 +1,29 @@
+import os
+import time
+
 from . import parse
+from . import sync
+from .timing import timed
 
 
 class Machine(object):
     """The virtual machine instance."""
 
-    def __init__(self, box, name, version, slug, cwd, shell, ssh_factory):
+    def __init__(
+        self,
+        box,
+        name,
+        version,
+        slug,
+        cwd,
+        shell,
+        ssh_factory,
+        status_ttl=None,
+        machine_data=None,
+        ssh_config_cache=None,
+        ssh_pool=None,
+        status_index=None,
+    ):
         """Create a new instance
 
         :param box: The Vagrant box to use
@@ -13,7 +32,19 @@ class Machine(object):
         :param slug: A readable identifier for the virtual machine
         :param cwd: The working directory for this machine
         :param shell: A Shell() instance for running commands
-        :param ssh_factory: A factory object for creating SSH objects
+        :param ssh_factory: A factory object for creating SSH objects,
+            called with the keyword arguments of SSH.__init__
+        :param status_ttl: Number of seconds a cached status is considered
+            valid. If None the status is cached until invalidated by a
+            lifecycle call or refresh().
+        :param machine_data: Optional MachineData object used to read the
+            status from Vagrant's on-disk data before falling back to the
+            Vagrant command line
+        :param ssh_config_cache: Optional SSHConfigCache object used to
+            avoid running 'vagrant ssh-config'
+        :param ssh_pool: Optional SSHPool shared between the SSH objects
+        :param status_index: Optional StatusIndex shared between the machines
+            used to read the status before falling back to 'vagrant status'
         """
 
         self.box = box
@@ -23,13 +54,48 @@ class Machine(object):
         self.cwd = cwd
         self.shell = shell
         self.ssh_factory = ssh_factory
+        self.status_ttl = status_ttl
+        self.machine_data = machine_data
+        self.ssh_config_cache = ssh_config_cache
+        self.ssh_pool = ssh_pool
+        self.status_index = status_index
+
+        self._status = None
+        self._status_time = None
+        self._ssh_config = None
+
+        # Stored next to the Vagrantfile, so the manifests outlive the SSH
+        # objects of the machine
+        self.sync_manifests = sync.ManifestCache(
+            path=os.path.join(cwd, "sync_manifests.json")
+        )
 
     @property
     def status(self):
-        """Return the status of the Vagrant machine."""
-        output = self.shell.run(cmd="vagrant status --machine-readable", cwd=self.cwd)
+        """Return the status of the Vagrant machine.
+
+        The status is cached, see refresh() for invalidating it.
+        """
+        status = self._cached_status()
+
+        if status is None:
+            output = self.shell.run(
+                cmd="vagrant status --machine-readable", cwd=self.cwd
+            )
+            status = self._store_status(parse.to_status(output=output))
+
+        return status
 
-        return parse.to_status(output=output)
+    def refresh(self):
+        """Invalidate the cached state of the machine.
+
+        The next access to status will query Vagrant again.
+        """
+        self._status = None
+        self._status_time = None
+
+        if self.status_index is not None:
+            self.status_index.invalidate()
 
     def snapshot_list(self):
         """Return a list of snapshots for the Vagrant machine."""
@@ -42,20 +108,115 @@ class Machine(object):
 
         return parse.to_snapshot_list(output=output)
 
+    @timed("machine snapshot save")
     def snapshot_save(self, snapshot):
         """Save a snapshot of the virtual machine"""
         if not self.status.running:
             raise RuntimeError("Vagrant machine not running")
 
-        self.shell.run(cmd="vagrant snapshot save {}".format(snapshot), cwd=self.cwd)
+        try:
+            self.shell.run(
+                cmd="vagrant snapshot save {}".format(snapshot), cwd=self.cwd
+            )
+        finally:
+            self.refresh()
+
+        self.mark_clean(snapshot)
 
+    @timed("machine snapshot restore")
     def snapshot_restore(self, snapshot):
         """Restore the machine to a saved snapshot"""
         if not self.status.running:
             raise RuntimeError("Vagrant machine not running")
 
-        self.shell.run(cmd="vagrant snapshot restore {}".format(snapshot), cwd=self.cwd)
+        self.mark_dirty()
+
+        try:
+            self.shell.run(
+                cmd="vagrant snapshot restore {}".format(snapshot), cwd=self.cwd
+            )
+        finally:
+            self.refresh()
+            self._invalidate_ssh_config()
+
+        self.mark_clean(snapshot)
+
+    @timed("machine checkpoint")
+    def checkpoint(self, name, setup=None, base="reset"):
+        """Restore the machine to a named checkpoint, creating it if needed.
+
+        Checkpoints are snapshots layered on top of each other. The first
+        time a checkpoint is used the machine is restored to the base
+        checkpoint, setup(machine) is called and the result is saved as a
+        snapshot. After that the checkpoint is restored instead of running
+        setup again. Example:
+
+            machine.checkpoint("toolchain", setup=install_toolchain)
+            machine.checkpoint("dataset", setup=fetch_data, base="toolchain")
+
+        :param name: The name of the checkpoint
+        :param setup: Callable invoked with the machine to set up the
+            checkpoint
+        :param base: The checkpoint (snapshot) this one builds on, None to
+            build on the current state of the machine
+        :return: True if the checkpoint was created, False if restored
+        """
+        snapshots = self.snapshot_list()
 
+        if name in snapshots:
+            if self.clean_snapshot() != name:
+                self.snapshot_restore(name)
+            return False
+
+        if base is not None:
+            if base not in snapshots:
+                raise RuntimeError("Checkpoint base {} not found".format(base))
+
+            if self.clean_snapshot() != base:
+                self.snapshot_restore(base)
+
+        if setup is not None:
+            setup(self)
+
+        self.snapshot_save(name)
+        return True
+
+    def mark_dirty(self):
+        """Mark the machine as changed since the last snapshot restore.
+
+        Called automatically by the SSH objects of the machine, unless a
+        command is marked as read-only.
+        """
+        if os.path.isfile(self._clean_path()):
+            os.remove(self._clean_path())
+
+    def mark_clean(self, snapshot):
+        """Mark the machine as unchanged since the snapshot was saved or
+        restored.
+
+        :param snapshot: The name of the snapshot
+        """
+        with open(self._clean_path(), "w") as clean_file:
+            clean_file.write(snapshot)
+
+    def clean_snapshot(self):
+        """Return the snapshot the machine is known to be identical to or
+        None if the machine may have changed (is dirty).
+        """
+        try:
+            with open(self._clean_path()) as clean_file:
+                return clean_file.read().strip() or None
+        except (IOError, OSError):
+            return None
+
+    @property
+    def dirty(self):
+        """True if the machine may have changed since the last snapshot
+        restore
+        """
+        return self.clean_snapshot() is None
+
+    @timed("machine ssh-config")
     def ssh_config(self):
         """Return the ssh-config of the vagrant machine."""
         if self.status.not_created:
@@ -63,16 +224,153 @@ class Machine(object):
         if not self.status.running:
             raise RuntimeError("Vagrant machine not running")
 
-        output = self.shell.run("vagrant ssh-config", cwd=self.cwd)
-        return parse.to_ssh_config(output=output)
+        ssh_config = self._cached_ssh_config()
+
+        if ssh_config is None:
+            output = self.shell.run("vagrant ssh-config", cwd=self.cwd)
+            ssh_config = self._store_ssh_config(parse.to_ssh_config(output=output))
+
+        return ssh_config
 
     def ssh(self):
         """Provide ssh access to the Vagrant machine."""
         if not self.status.running:
             raise RuntimeError("Vagrant machine not running")
 
-        return self.ssh_factory(ssh_config=self.ssh_config())
+        return self._make_ssh(ssh_config=self.ssh_config())
+
+    @timed("machine up")
+    def up(self, progress_callback=None):
+        """Start the underlying vagrant machine.
+
+        :param progress_callback: Optional callable invoked with an Event
+            for each line of Vagrant's machine-readable output while the
+            machine boots, see machine_readable.Event
+        """
+        self.mark_dirty()
+        self._lifecycle(cmd="vagrant up", progress_callback=progress_callback)
+
+    @timed("machine resume")
+    def resume(self, progress_callback=None):
+        """Resume a suspended vagrant machine."""
+        # The machine continues from where it was suspended, so it is
+        # still clean if it was clean before
+        self._lifecycle(cmd="vagrant resume", progress_callback=progress_callback)
+
+    @timed("machine suspend")
+    def suspend(self):
+        """Suspend the underlying vagrant machine."""
+        self._lifecycle(cmd="vagrant suspend")
+
+    @timed("machine halt")
+    def halt(self):
+        """Shut down the underlying vagrant machine."""
+        self.mark_dirty()
+        self._lifecycle(cmd="vagrant halt")
+
+    @timed("machine destroy")
+    def destroy(self):
+        """Destroy the underlying vagrant machine including its snapshots."""
+        self.mark_dirty()
+        self._lifecycle(cmd="vagrant destroy --force")
+
+    def _lifecycle(self, cmd, progress_callback=None):
+        """Run a command changing the state of the machine"""
+        kwargs = {}
+
+        # Only passed when used, so shells without progress support work
+        if progress_callback is not None:
+            cmd += " --machine-readable"
+            kwargs["progress_callback"] = progress_callback
+
+        try:
+            self.shell.run(cmd=cmd, cwd=self.cwd, **kwargs)
+        finally:
+            self.refresh()
+            self._invalidate_ssh_config()
+
+    def _cached_status(self):
+        """Return the cached status or the status from the on-disk data or
+        the status index.
+
+        :return: A MachineStatus or None if Vagrant must be asked
+        """
+        if self._status is not None and not self._status_expired():
+            return self._status
+
+        status = None
+
+        if self.machine_data is not None:
+            status = self.machine_data.status()
+
+        if status is None and self.status_index is not None:
+            status = self.status_index.status(cwd=self.cwd)
+
+        if status is None:
+            return None
+
+        return self._store_status(status)
+
+    def _store_status(self, status):
+        self._status = status
+        self._status_time = time.monotonic()
+        return status
+
+    def _cached_ssh_config(self):
+        """Return the cached SSHConfig or None if Vagrant must be asked"""
+        if self._ssh_config is None and self.ssh_config_cache is not None:
+            self._ssh_config = self.ssh_config_cache.load()
+
+        return self._ssh_config
+
+    def _store_ssh_config(self, ssh_config):
+        self._ssh_config = ssh_config
+
+        if self.ssh_config_cache is not None:
+            self.ssh_config_cache.store(ssh_config)
+
+        return ssh_config
+
+    def _make_ssh(self, ssh_config):
+        kwargs = {}
+
+        # Only passed when used, so factories without pooling support work
+        if self.ssh_pool is not None:
+            kwargs["ssh_pool"] = self.ssh_pool
+
+        return self.ssh_factory(
+            ssh_config=ssh_config,
+            on_connect_error=self._invalidate_ssh_config,
+            on_change=self.mark_dirty,
+            sync_manifests=self.sync_manifests,
+            **kwargs
+        )
+
+    def _clean_path(self):
+        # The file is stored next to the Vagrantfile, so it is shared with
+        # other processes using the machine
+        return os.path.join(self.cwd, "clean_snapshot")
+
+    def _invalidate_ssh_config(self):
+        """Drop the cached ssh-config and pooled connections e.g. if we
+        failed to connect or the machine was restarted.
+        """
+        ssh_config = self._ssh_config
+
+        if ssh_config is None and self.ssh_config_cache is not None:
+            ssh_config = self.ssh_config_cache.load()
+
+        if ssh_config is not None and self.ssh_pool is not None:
+            self.ssh_pool.evict(ssh_config=ssh_config)
+
+        self._ssh_config = None
+
+        if self.ssh_config_cache is not None:
+            self.ssh_config_cache.invalidate()
+
+    def _status_expired(self):
+        """Return true if the cached status is older than status_ttl"""
+        if self.status_ttl is None:
+            return False
 
-    def up(self):
-        """Start the underlying vagrant machine."""
-        self.shell.run(cmd="vagrant up", cwd=self.cwd)
+        return time.monotonic() - self._status_time >= self.status_ttl
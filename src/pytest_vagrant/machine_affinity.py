@@ -0,0 +1,72 @@
+def group_by_machine(items, requirements, scope=None):
+    """Reorder tests so tests using the same machines run back to back.
+
+    The groups are ordered by their first test, within a group the tests
+    asking for a reset run first. A test asking for a reset only needs a
+    snapshot restore if another test used the machine since the last
+    restore, so the following tests not asking for a reset run on the
+    machine as it is.
+
+    The tests are only grouped within their scope e.g. their module or
+    class, the scopes keep their order. This way the fixtures of the scope
+    are set up once.
+
+    :param items: The tests
+    :param requirements: Callable returning the list of machine
+        requirements of a test, see fixtures.machine_requirements()
+    :param scope: Callable returning the scope of a test, None to group
+        all the tests together
+    :return: The reordered list of tests
+    """
+    scopes = {}
+    groups = {}
+    keys = []
+
+    for index, item in enumerate(items):
+        required = requirements(item)
+        machines = _machines(required)
+        item_scope = None if scope is None else scope(item)
+
+        if item_scope not in scopes:
+            scopes[item_scope] = len(scopes)
+
+        if machines not in groups:
+            groups[machines] = len(groups)
+
+        reset = any(requirement["reset"] for requirement in required)
+        keys.append((scopes[item_scope], groups[machines], not reset, index))
+
+    order = sorted(range(len(items)), key=lambda index: keys[index])
+    return [items[index] for index in order]
+
+
+def estimate(items, requirements):
+    """Estimate the snapshot restores of running the tests in this order.
+
+    A machine is counted as restored whenever a test asks for a reset after
+    another test used it. The boots are not estimated, a machine keeps
+    running once booted so it is booted once whatever the order.
+
+    :return: The number of snapshot restores
+    """
+    restores = 0
+    dirty = set()
+
+    for item in items:
+        for requirement in requirements(item):
+            machine = _machine(requirement)
+
+            if requirement["reset"] and machine in dirty:
+                restores += 1
+
+            dirty.add(machine)
+
+    return restores
+
+
+def _machine(requirement):
+    return (requirement["box"], requirement["name"], requirement["box_version"])
+
+
+def _machines(required):
+    return tuple(sorted({_machine(requirement) for requirement in required}, key=str))
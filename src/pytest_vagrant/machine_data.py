@@ -0,0 +1,113 @@
+import os
+
+from . import machine_status
+
+
+class MachineData(object):
+    """Read the state Vagrant stores in the .vagrant folder of a machine.
+
+    When a machine is created Vagrant writes the provider's machine id,
+    the index uuid and the generated private key to:
+
+        <cwd>/.vagrant/machines/<name>/<provider>/
+
+    Combined with the global MachineIndex this lets us answer the most
+    common questions without starting Vagrant. All methods return None
+    when the on-disk data is missing or ambiguous, in which case the
+    caller should fall back to the Vagrant command line.
+    """
+
+    def __init__(self, cwd, machine_index, name="default"):
+        """Create a new instance
+
+        :param cwd: The working directory of the machine i.e. where the
+            Vagrantfile is
+        :param machine_index: A MachineIndex object
+        :param name: The name of the machine in the Vagrantfile
+        """
+        self.cwd = cwd
+        self.machine_index = machine_index
+        self.name = name
+
+    def providers(self):
+        """Return the list of providers which have created the machine"""
+        machine_dir = os.path.join(self.cwd, ".vagrant", "machines", self.name)
+
+        if not os.path.isdir(machine_dir):
+            return []
+
+        return sorted(
+            provider
+            for provider in os.listdir(machine_dir)
+            if os.path.isfile(os.path.join(machine_dir, provider, "id"))
+        )
+
+    def provider(self):
+        """Return the provider of the machine or None if not unique"""
+        providers = self.providers()
+
+        if len(providers) != 1:
+            return None
+
+        return providers[0]
+
+    def id(self):
+        """Return the provider's id of the machine e.g. the VirtualBox uuid"""
+        return self._read("id")
+
+    def index_uuid(self):
+        """Return the uuid of the machine in the global machine index"""
+        return self._read("index_uuid")
+
+    def private_key(self):
+        """Return the path to the private key generated by Vagrant"""
+        path = self._path("private_key")
+
+        if path is None or not os.path.isfile(path):
+            return None
+
+        return path
+
+    def status(self):
+        """Return the MachineStatus or None if it cannot be determined."""
+        providers = self.providers()
+
+        if not providers:
+            # Vagrant has never created the machine in this directory
+            return machine_status.MachineStatus(
+                status=machine_status.MachineStatus.NOT_CREATED
+            )
+
+        if len(providers) > 1:
+            return None
+
+        uuid = self.index_uuid()
+        if uuid is None:
+            return None
+
+        entry = self.machine_index.lookup(uuid)
+        if entry is None or not entry.get("state"):
+            return None
+
+        return machine_status.MachineStatus(status=entry["state"])
+
+    def _path(self, filename):
+        provider = self.provider()
+
+        if provider is None:
+            return None
+
+        return os.path.join(
+            self.cwd, ".vagrant", "machines", self.name, provider, filename
+        )
+
+    def _read(self, filename):
+        path = self._path(filename)
+
+        if path is None or not os.path.isfile(path):
+            return None
+
+        with open(path) as data_file:
+            data = data_file.read().strip()
+
+        return data if data else None
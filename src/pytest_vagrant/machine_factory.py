@@ -2,23 +2,48 @@ import slugify
 import os
 
 from . import machine
+from . import machine_data
+from . import ssh_config_cache
 
 
 class MachineFactory(object):
     """Factory object for building Machine objects"""
 
-    def __init__(self, shell, machines_dir, ssh_factory):
+    def __init__(
+        self,
+        shell,
+        machines_dir,
+        ssh_factory,
+        status_ttl=None,
+        machine_index=None,
+        ssh_pool=None,
+        status_index=None,
+    ):
         """Instantiate a new object
 
         :param shell: A Shell object for running commands
         :param machines_dir: The directory where we store the Vagrantfiles and
             where Vagrant stores information about the created virtual machines
-        :param ssh_factory: Factory for building SSH objects
+        :param ssh_factory: Factory for building SSH objects, called with
+            the keyword arguments of SSH.__init__
+        :param status_ttl: Number of seconds a machine may cache its status,
+            None means until the next lifecycle call
+        :param machine_index: Optional MachineIndex object, if provided the
+            machines will read their state from Vagrant's on-disk data when
+            possible
+        :param ssh_pool: Optional SSHPool used to share SSH connections
+            between the SSH objects of a machine
+        :param status_index: Optional StatusIndex used by the machines to
+            look up their status with a single vagrant command
         """
 
         self.shell = shell
         self.machines_dir = machines_dir
         self.ssh_factory = ssh_factory
+        self.status_ttl = status_ttl
+        self.machine_index = machine_index
+        self.ssh_pool = ssh_pool
+        self.status_index = status_index
 
     def __call__(self, box, name, version):
         """Build a new Machine object.
@@ -35,6 +60,10 @@ class MachineFactory(object):
         slug = slugify.slugify(text=text, separator="_")
         cwd = os.path.join(self.machines_dir, slug)
 
+        data = None
+        if self.machine_index is not None:
+            data = machine_data.MachineData(cwd=cwd, machine_index=self.machine_index)
+
         return machine.Machine(
             name=name,
             box=box,
@@ -43,4 +72,9 @@ class MachineFactory(object):
             cwd=cwd,
             shell=self.shell,
             ssh_factory=self.ssh_factory,
+            status_ttl=self.status_ttl,
+            machine_data=data,
+            ssh_config_cache=ssh_config_cache.SSHConfigCache(cwd=cwd),
+            ssh_pool=self.ssh_pool,
+            status_index=self.status_index,
         )
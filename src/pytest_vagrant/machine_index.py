@@ -0,0 +1,67 @@
+import json
+import os
+
+
+def default_machine_index_path():
+    """Return the path of Vagrant's global machine index.
+
+    Vagrant keeps track of all machines in a JSON file in its home
+    directory. The home directory can be moved with VAGRANT_HOME.
+    """
+    vagrant_home = os.environ.get("VAGRANT_HOME")
+
+    if not vagrant_home:
+        vagrant_home = os.path.join(os.path.expanduser("~"), ".vagrant.d")
+
+    return os.path.join(vagrant_home, "data", "machine-index", "index")
+
+
+class MachineIndex(object):
+    """Read-only access to Vagrant's global machine index.
+
+    This is the file Vagrant uses for 'vagrant global-status'. Reading it
+    directly is much faster than starting Vagrant, but the states stored
+    are the ones Vagrant saw the last time it ran a command on the machine.
+    """
+
+    def __init__(self, path):
+        """Create a new instance
+
+        :param path: Path to the index file
+        """
+        self.path = path
+
+    def machines(self):
+        """Return a dict mapping the machine uuid to the index entry.
+
+        If the index does not exist (or cannot be read) an empty dict is
+        returned.
+        """
+        try:
+            with open(self.path) as index_file:
+                index = json.load(index_file)
+        except (IOError, OSError, ValueError):
+            return {}
+
+        return index.get("machines", {})
+
+    def lookup(self, uuid):
+        """Return the index entry for the uuid or None if not found"""
+        return self.machines().get(uuid, None)
+
+    def needs_prune(self):
+        """Return true if the index refers to machines that no longer exist
+        on disk i.e. 'vagrant global-status --prune' would remove them.
+        """
+        for entry in self.machines().values():
+
+            local_data_path = entry.get("local_data_path")
+            vagrantfile_path = entry.get("vagrantfile_path")
+
+            if not local_data_path or not os.path.isdir(local_data_path):
+                return True
+
+            if not vagrantfile_path or not os.path.isdir(vagrantfile_path):
+                return True
+
+        return False
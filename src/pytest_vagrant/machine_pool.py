@@ -0,0 +1,264 @@
+import concurrent.futures
+import contextlib
+import threading
+import time
+
+
+class MachinePool(object):
+    """A pool of pre-booted machines.
+
+    Tests lease a machine restored to its 'reset' snapshot. When the
+    machine is given back, it is restored in a background thread before it
+    is handed out again, so the test does not pay for the restore.
+
+    Example:
+
+        with pool.machine(box="hashicorp/bionic64") as machine:
+            with machine.ssh() as ssh:
+                ssh.run("ls")
+    """
+
+    def __init__(self, vagrant, name="pytest_vagrant_pool", size=1, idle_timeout=None):
+        """Create a new instance
+
+        :param vagrant: The Vagrant object used to create the machines
+        :param name: The name of the machines, a number is appended
+        :param size: Maximum number of machines per box
+        :param idle_timeout: Number of seconds after which an idle machine is
+            halted and removed from the pool, None keeps them running. The
+            idle machines are checked by a background thread.
+        """
+        self.vagrant = vagrant
+        self.name = name
+        self.size = size
+        self.idle_timeout = idle_timeout
+
+        # Seconds each lease waited for a machine
+        self.wait_times = []
+        # The exceptions of the failed background restores
+        self.restore_errors = []
+
+        self.condition = threading.Condition()
+        self.executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=size, thread_name_prefix="machine_pool"
+        )
+        # Prefilling leases machines, which may wait for the restores on the
+        # executor above, so it runs on its own threads
+        self.prefill_executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=size, thread_name_prefix="machine_pool_prefill"
+        )
+
+        # Per (box, box_version): list of (machine, idle since) tuples
+        self.idle = {}
+        # Per (box, box_version): set of the indices of the machines in use
+        self.indices = {}
+        # The index of each machine created by the pool
+        self.machine_indices = {}
+
+        self.closed = False
+        self.reaper = None
+
+        if idle_timeout is not None:
+            self.reaper = threading.Thread(
+                target=self._reaper, name="machine_pool_reaper", daemon=True
+            )
+            self.reaper.start()
+
+    def lease(self, box, box_version=None, timeout=None):
+        """Lease a machine restored to its 'reset' snapshot.
+
+        :param box: The Vagrant box to use
+        :param box_version: Optional version of the box
+        :param timeout: Maximum seconds to wait, None waits forever
+        :return: A Machine object, give it back with release()
+        """
+        start = time.monotonic()
+        machine = self._lease(box=box, box_version=box_version, timeout=timeout)
+
+        with self.condition:
+            self.wait_times.append(time.monotonic() - start)
+
+        return machine
+
+    def release(self, machine):
+        """Give a leased machine back to the pool.
+
+        The machine is restored to its 'reset' snapshot in the background.
+        """
+        key = (machine.box, machine.version)
+        self.executor.submit(self._restore, key, machine)
+
+    @contextlib.contextmanager
+    def machine(self, box, box_version=None, timeout=None):
+        """Lease a machine for the duration of a with statement"""
+        machine = self.lease(box=box, box_version=box_version, timeout=timeout)
+        try:
+            yield machine
+        finally:
+            self.release(machine)
+
+    def prefill(self, box, box_version=None):
+        """Boot the machines for a box in the background.
+
+        :return: List of futures completing when the machines are ready
+        """
+        return [
+            self.prefill_executor.submit(self._prefill, box, box_version)
+            for _ in range(self.size)
+        ]
+
+    def stats(self):
+        """Return a dict with statistics about the lease wait times and the
+        number of failed restores.
+        """
+        with self.condition:
+            wait_times = list(self.wait_times)
+            restore_failures = len(self.restore_errors)
+
+        if not wait_times:
+            return {
+                "leases": 0,
+                "total": 0.0,
+                "mean": 0.0,
+                "max": 0.0,
+                "restore_failures": restore_failures,
+            }
+
+        return {
+            "leases": len(wait_times),
+            "total": sum(wait_times),
+            "mean": sum(wait_times) / len(wait_times),
+            "max": max(wait_times),
+            "restore_failures": restore_failures,
+        }
+
+    def close(self):
+        """Wait for the background prefills and restores to finish"""
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+        if self.reaper is not None:
+            self.reaper.join()
+
+        self.prefill_executor.shutdown(wait=True)
+        self.executor.shutdown(wait=True)
+
+    def _lease(self, box, box_version, timeout):
+        key = (box, box_version)
+        start = time.monotonic()
+
+        with self.condition:
+            while True:
+                self._reap()
+
+                idle = self.idle.setdefault(key, [])
+                if idle:
+                    machine, _ = idle.pop()
+                    break
+
+                index = self._free_index(key)
+                if index is not None:
+                    self.indices[key].add(index)
+                    machine = None
+                    break
+
+                remaining = None
+                if timeout is not None:
+                    remaining = timeout - (time.monotonic() - start)
+                    if remaining <= 0:
+                        raise RuntimeError(
+                            "Timeout waiting for a {} machine".format(box)
+                        )
+
+                self.condition.wait(timeout=remaining)
+
+        if machine is None:
+            try:
+                machine = self.vagrant.from_box(
+                    box=box,
+                    name="{}_{}".format(self.name, index),
+                    box_version=box_version,
+                    reset=True,
+                )
+            except Exception:
+                with self.condition:
+                    self.indices[key].discard(index)
+                    self.condition.notify_all()
+                raise
+
+            with self.condition:
+                self.machine_indices[machine] = index
+
+        return machine
+
+    def _prefill(self, box, box_version):
+        # Not counted in the wait times, nobody waits for these leases
+        self.release(self._lease(box=box, box_version=box_version, timeout=None))
+
+    def _restore(self, key, machine):
+        try:
+            if machine.clean_snapshot() != "reset":
+                machine.snapshot_restore("reset")
+        except Exception as error:
+            # The machine is in an unknown state, drop it from the pool so
+            # it is set up again by the next lease. Nobody waits for the
+            # restore, so the error is kept for stats().
+            with self.condition:
+                self.restore_errors.append(error)
+
+            self._remove(key, machine)
+            return
+
+        with self.condition:
+            self.idle.setdefault(key, []).append((machine, time.monotonic()))
+            self.condition.notify_all()
+
+    def _free_index(self, key):
+        indices = self.indices.setdefault(key, set())
+
+        if len(indices) >= self.size:
+            return None
+
+        index = 0
+        while index in indices:
+            index += 1
+
+        return index
+
+    def _reaper(self):
+        """Reap the idle machines until the pool is closed"""
+        interval = max(self.idle_timeout / 2.0, 0.05)
+
+        with self.condition:
+            while not self.closed:
+                self._reap()
+                self.condition.wait(timeout=interval)
+
+    def _reap(self):
+        """Halt machines idle for longer than idle_timeout"""
+        if self.idle_timeout is None:
+            return
+
+        now = time.monotonic()
+
+        for key, idle in self.idle.items():
+            for machine, since in list(idle):
+                if now - since < self.idle_timeout:
+                    continue
+
+                idle.remove((machine, since))
+                self.executor.submit(self._halt, key, machine)
+
+    def _halt(self, key, machine):
+        try:
+            machine.halt()
+        finally:
+            self._remove(key, machine)
+
+    def _remove(self, key, machine):
+        """Remove the machine from the pool, freeing its index"""
+        with self.condition:
+            index = self.machine_indices.pop(machine)
+            self.indices[key].discard(index)
+            self.condition.notify_all()
@@ -0,0 +1,163 @@
+import codecs
+import re
+
+# Vagrant escapes these in the fields of its machine-readable output
+ESCAPES = [("%!(VAGRANT_COMMA)", ","), ("\\n", "\n"), ("\\r", "\r")]
+
+# Box downloads report e.g. "Progress: 45% (Rate: 12.1M/s, Estimated time
+# remaining: 0:00:10)"
+PROGRESS = re.compile(r"Progress: (\d+)%")
+
+# Machine-readable lines start with a timestamp
+MACHINE_READABLE = re.compile(r"^\d+,")
+
+
+class Event(object):
+    """A line of Vagrant's output.
+
+    Attributes:
+    :kind: One of the kinds below or the type of the line e.g.
+        "provider-name" or "machine-home"
+    :timestamp: The timestamp as a string, None for TEXT
+    :target: The machine the line is about, empty if it is about no
+        machine in particular
+    :type: The type of the line as written by Vagrant
+    :data: List with the decoded data fields
+    """
+
+    STATE = "state"
+    METADATA = "metadata"
+    UI = "ui"
+    ERROR_EXIT = "error-exit"
+    PROGRESS = "progress"
+    # A line which is not machine-readable e.g. the output of ssh-config
+    TEXT = "text"
+
+    def __init__(self, timestamp, target, type, data):
+        """Create a new instance"""
+        self.timestamp = timestamp
+        self.target = target
+        self.type = type
+        self.data = data
+        self.kind = type
+
+        if type == Event.UI and PROGRESS.search(self.message or ""):
+            self.kind = Event.PROGRESS
+
+    @property
+    def level(self):
+        """The level of ui events e.g. "info", "output" or "detail" """
+        if self.type != Event.UI or not self.data:
+            return None
+        return self.data[0]
+
+    @property
+    def message(self):
+        """The message of ui, error-exit and text events"""
+        if self.type in [Event.UI, Event.ERROR_EXIT] and len(self.data) > 1:
+            return self.data[1]
+        if self.type == Event.TEXT:
+            return self.data[0]
+        return None
+
+    @property
+    def percent(self):
+        """The percentage of progress events"""
+        if self.kind != Event.PROGRESS:
+            return None
+        return int(PROGRESS.search(self.message).group(1))
+
+    def __repr__(self):
+        return "Event({!r}, {!r}, {!r})".format(self.kind, self.target, self.data)
+
+
+class Parser(object):
+    """Incremental parser turning Vagrant's output into Events.
+
+    The output can be fed in chunks of any size while the command runs,
+    each complete line is turned into an Event. Example:
+
+        parser = Parser()
+        for chunk in chunks:
+            for event in parser.feed(chunk):
+                ...
+        events = parser.finish()
+    """
+
+    def __init__(self, encoding="utf-8"):
+        """Create a new instance
+
+        :param encoding: The encoding used for decoding bytes
+        """
+        self.decoder = codecs.getincrementaldecoder(encoding)(errors="replace")
+        self.buffer = ""
+
+    def feed(self, data):
+        """Parse a chunk of output.
+
+        :param data: The chunk as str or bytes
+        :return: List of the Events completed by the chunk
+        """
+        if isinstance(data, bytes):
+            # Incomplete multi-byte characters are kept until the next chunk
+            data = self.decoder.decode(data)
+
+        self.buffer += data
+
+        if "\n" not in self.buffer:
+            return []
+
+        *lines, self.buffer = self.buffer.split("\n")
+        return [event for event in map(to_event, lines) if event is not None]
+
+    def finish(self):
+        """Parse the last line if it was not terminated by a newline
+
+        :return: List of the remaining Events
+        """
+        line, self.buffer = self.buffer + self.decoder.decode(b"", final=True), ""
+        event = to_event(line)
+
+        return [] if event is None else [event]
+
+
+def parse(output):
+    """Return the list of Events in the output of a finished command"""
+    parser = Parser()
+    return parser.feed(output) + parser.finish()
+
+
+def to_event(line):
+    """Turn a line into an Event, None for empty lines"""
+    line = line.rstrip("\r")
+
+    if not line.strip():
+        return None
+
+    if not MACHINE_READABLE.match(line):
+        return Event(timestamp=None, target="", type=Event.TEXT, data=[line])
+
+    fields = line.split(",")
+
+    if len(fields) < 3:
+        return Event(timestamp=None, target="", type=Event.TEXT, data=[line])
+
+    timestamp, target, type = fields[:3]
+
+    return Event(
+        timestamp=timestamp,
+        target=target,
+        type=type,
+        data=[decode(field) for field in fields[3:]],
+    )
+
+
+def decode(field):
+    """Decode the escapes in a field of machine-readable output"""
+    if "%" not in field and "\\" not in field:
+        return field
+
+    for escape, character in ESCAPES:
+        field = field.replace(escape, character)
+
+    return field
@@ -0,0 +1,127 @@
+import codecs
+import io
+import tempfile
+
+
+class OutputBuffer(object):
+    """Collects the output of a command as it is produced.
+
+    The data is decoded incrementally and split into lines which are
+    passed to an optional callback. If a spill threshold is given, the
+    output is moved to a temporary file once it grows beyond the
+    threshold. From then on only the last spill_threshold characters are
+    kept in memory, the full output is in the file at path.
+    """
+
+    def __init__(self, callback=None, spill_threshold=None, encoding="utf-8"):
+        """Create a new instance
+
+        :param callback: Optional callable invoked with each complete line
+            of output (without the line ending)
+        :param spill_threshold: Size in characters after which the output
+            is stored in a temporary file, None keeps it in memory
+        :param encoding: The encoding of the output
+        """
+        self.callback = callback
+        self.decoder = codecs.getincrementaldecoder(encoding)(errors="replace")
+        self.spill_threshold = spill_threshold
+        self.encoding = encoding
+        self.partial = ""
+        self.size = 0
+
+        self.buffer = io.StringIO()
+        # The temporary file and the end of the output once spilled
+        self.file = None
+        self.tail = ""
+
+    def feed(self, data):
+        """Add raw output from the command
+
+        :param data: The output as bytes
+        """
+        self._write(self.decoder.decode(data))
+
+    def finish(self):
+        """Flush any partial line, called when the command has finished"""
+        self._write(self.decoder.decode(b"", final=True))
+
+        if self.partial:
+            self._emit(self.partial)
+            self.partial = ""
+
+        if self.file is not None:
+            self.file.flush()
+
+    @property
+    def spilled(self):
+        """True if the output has been moved to a temporary file"""
+        return self.file is not None
+
+    @property
+    def path(self):
+        """The path of the temporary file with the full output, None if the
+        output was not spilled. The file is not deleted by the buffer.
+        """
+        return None if self.file is None else self.file.name
+
+    def value(self):
+        """Return the collected output as a string, only the last
+        spill_threshold characters if the output was spilled.
+        """
+        if self.file is not None:
+            return self.tail
+
+        return self.buffer.getvalue()
+
+    def close(self):
+        """Release the memory used by the buffer and close the temporary
+        file, which stays on disk.
+        """
+        self.buffer.close()
+
+        if self.file is not None:
+            self.file.close()
+
+    def _write(self, text):
+        if not text:
+            return
+
+        self.size += len(text)
+
+        if self.file is not None:
+            self.file.write(text)
+            self.tail = (self.tail + text)[-self.spill_threshold :]
+        else:
+            self.buffer.write(text)
+
+            if self.spill_threshold is not None and self.size > self.spill_threshold:
+                self._spill()
+
+        if self.callback is None:
+            return
+
+        lines = (self.partial + text).split("\n")
+        self.partial = lines.pop()
+
+        for line in lines:
+            self._emit(line)
+
+    def _spill(self):
+        value = self.buffer.getvalue()
+
+        self.file = tempfile.NamedTemporaryFile(
+            mode="w",
+            encoding=self.encoding,
+            prefix="pytest_vagrant_",
+            suffix=".log",
+            delete=False,
+        )
+        self.file.write(value)
+        self.tail = value[-self.spill_threshold :]
+
+        self.buffer.close()
+        self.buffer = io.StringIO()
+
+    def _emit(self, line):
+        if self.callback is not None:
+            self.callback(line.rstrip("\r"))
@@ -1,52 +1,122 @@
-import csv
-import re
-
-from . import parse_format
+from . import machine_readable
 from . import machine_status
 from . import ssh_config
 
+Event = machine_readable.Event
+
 
 def to_status(output):
     """Parse the output of 'vagrant status --machine-readable'"""
 
-    for row in csv.reader(output.splitlines()):
+    for event in machine_readable.parse(output):
 
-        if row[parse_format.ParseFormat.TYPE] != "state":
+        if event.kind != Event.STATE:
             continue
 
-        status = row[parse_format.ParseFormat.DATA]
-        return machine_status.MachineStatus(status=status)
+        return machine_status.MachineStatus(status=event.data[0])
 
     raise RuntimeError("Parsing state failed")
 
 
+def to_global_status(output):
+    """Parse the output of 'vagrant global-status --machine-readable'
+
+    Each machine is described by consecutive machine-id, provider-name,
+    machine-home and state lines.
+
+    :return: A dict mapping the machine-home directories to MachineStatus
+        objects
+    """
+    statuses = {}
+    home = None
+
+    for event in machine_readable.parse(output):
+
+        if not event.data:
+            continue
+
+        if event.kind == "machine-id":
+            home = None
+        elif event.kind == "machine-home":
+            home = event.data[0]
+        elif event.kind == Event.STATE and home is not None:
+            statuses[home] = machine_status.MachineStatus(status=event.data[0])
+
+    return statuses
+
+
+def to_box_list(output):
+    """Parse the output of 'vagrant box list --machine-readable'
+
+    Each box is described by consecutive box-name, box-provider and
+    box-version lines.
+
+    :return: A list of (name, provider, version) tuples
+    """
+    boxes = []
+    box = {}
+
+    for event in machine_readable.parse(output):
+
+        if not event.data or not event.kind.startswith("box-"):
+            continue
+
+        if event.kind == "box-name":
+            box = {}
+
+        box[event.kind] = event.data[0]
+
+        if event.kind == "box-version":
+            boxes.append(
+                (box.get("box-name"), box.get("box-provider"), box["box-version"])
+            )
+
+    return boxes
+
+
 def to_snapshot_list(output):
     """Parse the output of 'vagrant snapshot list --machine-readable'"""
     snapshots = []
 
-    for row in csv.reader(output.splitlines()):
+    for event in machine_readable.parse(output):
 
-        if row[parse_format.ParseFormat.DATA] not in ["detail", "output"]:
+        if event.level not in ["detail", "output"]:
             continue
 
-        # if the is a space in the extra data we don't have a valid
-        # snapshot
-        if " " in row[parse_format.ParseFormat.EXTRA]:
+        # if the is a space in the message we don't have a valid snapshot
+        # e.g. "No snapshots have been taken yet!"
+        if event.message is None or " " in event.message:
             continue
 
-        snapshots.append(row[parse_format.ParseFormat.EXTRA])
+        snapshots.append(event.message)
 
     return snapshots
 
 
 def to_ssh_config(output):
-    """Parse the output of 'vagrant ssh-config'"""
+    """Parse the output of 'vagrant ssh-config'
 
-    hostname = re.search(r"HostName (.*)", output).group(1)
-    username = re.search(r"User (.*)", output).group(1)
-    port = int(re.search(r"Port (.*)", output).group(1))
-    identityfile = re.search(r"IdentityFile (.*)", output).group(1)
+    Both the plain output and the machine-readable output, where the
+    configuration is part of a ui message, are supported.
+    """
+    options = {}
+
+    for event in machine_readable.parse(output):
+
+        if event.kind not in [Event.TEXT, Event.UI] or event.message is None:
+            continue
 
-    return ssh_config.SSHConfig(
-        hostname=hostname, username=username, port=port, identityfile=identityfile
-    )
+        for line in event.message.splitlines():
+            key, _, value = line.strip().partition(" ")
+            # Paths with spaces are quoted
+            options.setdefault(key, value.strip().strip('"'))
+
+    try:
+        return ssh_config.SSHConfig(
+            hostname=options["HostName"],
+            username=options["User"],
+            port=int(options["Port"]),
+            identityfile=options["IdentityFile"],
+        )
+    except KeyError as error:
+        raise RuntimeError("Parsing ssh-config failed, {} missing".format(error))
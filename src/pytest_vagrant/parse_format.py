@@ -1,8 +0,0 @@
-class ParseFormat(object):
-    """Format of the machine readable output returned by Vagrant"""
-
-    TIMESTAMP = 0
-    TARGET = 1
-    TYPE = 2
-    DATA = 3
-    EXTRA = 4
@@ -0,0 +1,14 @@
+class PrunePolicy(object):
+    """Controls when 'vagrant global-status --prune' is run.
+
+    Pruning removes stale entries from Vagrant's global state. It is
+    fairly expensive and rarely finds anything new, so by default we only
+    do it once per Vagrant object (i.e. once per test session).
+    """
+
+    ALWAYS = "always"  # Prune before every from_box(...)
+    ONCE = "once"  # Prune before the first from_box(...)
+    ON_ERROR = "on_error"  # Only prune if a vagrant command fails
+    NEVER = "never"  # Never prune
+
+    POLICIES = [ALWAYS, ONCE, ON_ERROR, NEVER]
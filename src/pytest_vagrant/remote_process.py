@@ -0,0 +1,196 @@
+import collections
+import select
+
+from . import output_buffer
+from . import runresult
+from . import errors
+
+
+class RemoteProcess(object):
+    """A command running on the remote over an SSH exec channel.
+
+    The stdout and stderr of the command are read concurrently such that
+    the command never stalls on a full channel window.
+    """
+
+    # Number of bytes to read from the channel at a time
+    CHUNK_SIZE = 32768
+
+    def __init__(
+        self,
+        channel,
+        command,
+        cwd,
+        stdout_callback=None,
+        stderr_callback=None,
+        spill_threshold=None,
+        read_pid=False,
+    ):
+        """Create a new instance
+
+        :param channel: The paramiko.Channel where the command was started
+        :param command: The command executed
+        :param cwd: The working directory of the command
+        :param stdout_callback: Optional callable invoked with each line
+            written to stdout
+        :param stderr_callback: Optional callable invoked with each line
+            written to stderr
+        :param spill_threshold: Size in characters after which the output
+            is stored in a temporary file instead of memory, see result()
+        :param read_pid: If true the first line written to stdout is the
+            process id of the remote shell, this is needed for kill()
+        """
+        self.channel = channel
+        self.command = command
+        self.cwd = cwd
+        self.returncode = None
+        self.pid = None
+        self._result = None
+        self._pid_data = b"" if read_pid else None
+
+        self.stdout = output_buffer.OutputBuffer(
+            callback=stdout_callback, spill_threshold=spill_threshold
+        )
+        self.stderr = output_buffer.OutputBuffer(
+            callback=stderr_callback, spill_threshold=spill_threshold
+        )
+
+    def poll(self):
+        """Read the available output without blocking.
+
+        :return: The return code if the command finished otherwise None
+        """
+        if self.returncode is not None:
+            return self.returncode
+
+        while self.channel.recv_ready():
+            self._feed_stdout(self.channel.recv(self.CHUNK_SIZE))
+
+        while self.channel.recv_stderr_ready():
+            self.stderr.feed(self.channel.recv_stderr(self.CHUNK_SIZE))
+
+        if not self._finished():
+            return None
+
+        self.stdout.finish()
+        self.stderr.finish()
+        self.returncode = self.channel.recv_exit_status()
+
+        return self.returncode
+
+    def wait(self, check=True):
+        """Wait for the command to finish.
+
+        :param check: If true raise RunResultError on a non-zero return code
+        :return: The RunResult of the command
+        """
+        while self.poll() is None:
+            # The channel's fileno becomes readable when data or EOF
+            # arrives, the timeout covers the exit status
+            select.select([self.channel], [], [], 0.1)
+
+        result = self.result()
+
+        if check and result.returncode:
+            raise errors.RunResultError(runresult=result)
+
+        return result
+
+    def kill(self, signal="TERM"):
+        """Send a signal to the command and all its child processes.
+
+        :param signal: The name of the signal to send
+        """
+        if self._pid_data is None and self.pid is None:
+            raise RuntimeError("Process id not available")
+
+        while self.pid is None and self.poll() is None:
+            select.select([self.channel], [], [], 0.1)
+
+        if self.returncode is not None:
+            return
+
+        # The remote shell is the leader of its own process group, so we
+        # signal the whole group
+        channel = self.channel.get_transport().open_session()
+        try:
+            channel.exec_command("kill -{} -{}".format(signal, self.pid))
+            channel.recv_exit_status()
+        finally:
+            channel.close()
+
+    def result(self):
+        """Return the RunResult of a finished command.
+
+        If the output was spilled, the RunResult only holds its last
+        spill_threshold characters and stdout_path / stderr_path point to
+        the temporary files with the full output, so memory stays bounded.
+        The caller removes the files when done with them.
+        """
+        if self.returncode is None:
+            raise RuntimeError("Command has not finished")
+
+        if self._result is None:
+            self._result = runresult.RunResult(
+                command=self.command,
+                cwd=self.cwd,
+                stdout=self.stdout.value(),
+                stderr=self.stderr.value(),
+                returncode=self.returncode,
+                stdout_path=self.stdout.path,
+                stderr_path=self.stderr.path,
+            )
+
+            self.stdout.close()
+            self.stderr.close()
+
+        return self._result
+
+    def __iter__(self):
+        """Iterate over the output lines while the command runs.
+
+        Yields tuples of ("stdout" or "stderr", line). Any callbacks passed
+        to the constructor are replaced while iterating. Call wait() after
+        the iteration to get the RunResult.
+        """
+        lines = collections.deque()
+
+        self.stdout.callback = lambda line: lines.append(("stdout", line))
+        self.stderr.callback = lambda line: lines.append(("stderr", line))
+
+        while True:
+            finished = self.poll() is not None
+
+            while lines:
+                yield lines.popleft()
+
+            if finished:
+                break
+
+            select.select([self.channel], [], [], 0.1)
+
+    def _feed_stdout(self, data):
+        if self._pid_data is None:
+            self.stdout.feed(data)
+            return
+
+        self._pid_data += data
+
+        if b"\n" not in self._pid_data:
+            return
+
+        pid, data = self._pid_data.split(b"\n", 1)
+        self.pid = int(pid)
+        self._pid_data = None
+
+        if data:
+            self.stdout.feed(data)
+
+    def _finished(self):
+        if not self.channel.exit_status_ready():
+            return False
+
+        if not (self.channel.eof_received or self.channel.closed):
+            return False
+
+        return not (self.channel.recv_ready() or self.channel.recv_stderr_ready())
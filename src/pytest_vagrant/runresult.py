@@ -11,9 +11,22 @@ class RunResult(object):
     :stdout: The standard output stream generated by the command
     :stderr: The standard error stream generated by the command
     :returncode: The return code set after invoking the command
+    :stdout_path: Path of a file with the full stdout if it was spilled to
+        disk (see SSH.run's spill_threshold), stdout then only holds its
+        end. None if the full stdout is in memory.
+    :stderr_path: Like stdout_path for stderr
     """
 
-    def __init__(self, command, cwd, stdout, stderr, returncode):
+    def __init__(
+        self,
+        command,
+        cwd,
+        stdout,
+        stderr,
+        returncode,
+        stdout_path=None,
+        stderr_path=None,
+    ):
         """Create a new RunResult object"""
 
         self.command = command
@@ -21,6 +34,8 @@ class RunResult(object):
         self.stdout = stdout
         self.stderr = stderr
         self.returncode = returncode
+        self.stdout_path = stdout_path
+        self.stderr_path = stderr_path
 
     def match(self, stdout=None, stderr=None):
         """Matches the lines in the output with the pattern. The match
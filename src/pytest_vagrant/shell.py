@@ -1,14 +1,229 @@
+import concurrent.futures
+import os
+import shlex
+import signal
 import subprocess
+import threading
+
+from . import errors
+from . import machine_readable
+from . import runresult
+from . import timing
 
 
 class Shell(object):
-    """A shell object for running commands"""
+    """A shell object for running commands.
+
+    Commands are split into arguments and run without an intermediate
+    shell. The output is read while the command runs, so it can be
+    streamed to callbacks and a hung command can be killed after a timeout.
+    """
+
+    def __init__(self, timeout=None, workers=4):
+        """Create a new instance
+
+        :param timeout: Default timeout in seconds for the commands, None
+            waits forever
+        :param workers: Maximum number of commands running at the same time
+            on the background executor, see submit()
+        """
+        self.timeout = timeout
+        self.workers = workers
+
+        self.executor = None
+        self.executor_lock = threading.Lock()
 
-    def run(self, cmd, cwd):
+        # The commands currently running, see kill()
+        self.processes = set()
+        self.processes_lock = threading.Lock()
+
+    def run(
+        self,
+        cmd,
+        cwd,
+        timeout=None,
+        stdout_callback=None,
+        stderr_callback=None,
+        progress_callback=None,
+    ):
         """Run a command.
 
         :param cmd: The command to run
         :param cwd: The current working directory i.e. where the command will
             run
+        :param timeout: Timeout in seconds, defaults to the timeout passed
+            to the constructor. On timeout the command and all its child
+            processes are killed and subprocess.TimeoutExpired is raised.
+        :param stdout_callback: Optional callable invoked with each line
+            written to stdout while the command runs
+        :param stderr_callback: Optional callable invoked with each line
+            written to stderr while the command runs
+        :param progress_callback: Optional callable invoked with an Event
+            (see machine_readable.Event) for each line of '--machine-readable'
+            output while the command runs
+        :return: The stdout of the command
+        :raises ShellError: If the command returns a non-zero return code
+        """
+        result = self.execute(
+            cmd=cmd,
+            cwd=cwd,
+            timeout=timeout,
+            stdout_callback=stdout_callback,
+            stderr_callback=stderr_callback,
+            progress_callback=progress_callback,
+        )
+
+        if result.returncode:
+            raise errors.ShellError(runresult=result)
+
+        return result.stdout
+
+    def execute(
+        self,
+        cmd,
+        cwd,
+        timeout=None,
+        stdout_callback=None,
+        stderr_callback=None,
+        progress_callback=None,
+    ):
+        """Run a command without checking its return code.
+
+        See run() for the parameters.
+
+        :return: A RunResult with the stdout, stderr and return code
+        """
+        if timeout is None:
+            timeout = self.timeout
+
+        if progress_callback is not None:
+            stdout_callback = _progress(
+                progress_callback=progress_callback, stdout_callback=stdout_callback
+            )
+
+        with timing.measure(timing.shell_operation(cmd)):
+            process = subprocess.Popen(
+                shlex.split(cmd),
+                cwd=cwd,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                stdin=subprocess.DEVNULL,
+                text=True,
+                start_new_session=True,
+            )
+
+            with self.processes_lock:
+                self.processes.add(process)
+
+            stdout = []
+            stderr = []
+
+            readers = [
+                threading.Thread(
+                    target=_read, args=(process.stdout, stdout, stdout_callback)
+                ),
+                threading.Thread(
+                    target=_read, args=(process.stderr, stderr, stderr_callback)
+                ),
+            ]
+
+            for reader in readers:
+                reader.start()
+
+            try:
+                returncode = process.wait(timeout=timeout)
+            except BaseException:
+                kill_process(process)
+                process.wait()
+                raise
+            finally:
+                for reader in readers:
+                    reader.join()
+
+                with self.processes_lock:
+                    self.processes.discard(process)
+
+        return runresult.RunResult(
+            command=cmd,
+            cwd=cwd,
+            stdout="".join(stdout),
+            stderr="".join(stderr),
+            returncode=returncode,
+        )
+
+    def submit(self, cmd, cwd, **kwargs):
+        """Run a command on the background executor.
+
+        At most workers commands run at the same time, the others wait in
+        line. See run() for the parameters.
+
+        :return: A concurrent.futures.Future with the stdout of the command
         """
-        return subprocess.check_output(cmd, shell=True, cwd=cwd, text=True)
+        with self.executor_lock:
+            if self.executor is None:
+                self.executor = concurrent.futures.ThreadPoolExecutor(
+                    max_workers=self.workers, thread_name_prefix="shell"
+                )
+
+        return self.executor.submit(self.run, cmd=cmd, cwd=cwd, **kwargs)
+
+    def close(self):
+        """Wait for the commands on the background executor to finish"""
+        with self.executor_lock:
+            executor, self.executor = self.executor, None
+
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+    def kill(self):
+        """Kill the commands currently running e.g. because their result is
+        no longer needed. The killed commands fail with a ShellError.
+        """
+        with self.processes_lock:
+            processes = list(self.processes)
+
+        for process in processes:
+            kill_process(process)
+
+
+def kill_process(process):
+    """Kill a command started in its own session and its child processes.
+
+    :param process: A subprocess.Popen or asyncio.subprocess.Process
+    """
+    # The command runs in its own session, so we can kill it and
+    # everything it started e.g. vagrant's ruby process
+    if hasattr(os, "killpg"):
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+            return
+        except ProcessLookupError:
+            return
+
+    process.kill()
+
+
+def _read(stream, lines, callback):
+    """Read the lines of a stream until EOF"""
+    with stream:
+        for line in stream:
+            lines.append(line)
+
+            if callback is not None:
+                callback(line.rstrip("\n"))
+
+
+def _progress(progress_callback, stdout_callback):
+    """Return a stdout callback passing the Events parsed from each line to
+    progress_callback.
+    """
+    parser = machine_readable.Parser()
+
+    def callback(line):
+        if stdout_callback is not None:
+            stdout_callback(line)
+
+        for event in parser.feed(line + "\n"):
+            progress_callback(event)
+
+    return callback
@@ -1,48 +1,80 @@
 import re
 import os
+import posixpath
+import shlex
 import stat
-import paramiko
+import tarfile
 
 from . import ssh_connection
-from . import runresult
+from . import remote_process
+from . import tar_stream
+from . import sync
+from . import transfer
 from . import errors
+from .timing import timed
 
 
 class SSH(object):
     """An SSH Connection"""
 
-    def __init__(self, ssh_config):
+    def __init__(
+        self,
+        ssh_config,
+        on_connect_error=None,
+        ssh_pool=None,
+        on_change=None,
+        sync_manifests=None,
+    ):
+        """Create a new instance
+
+        :param ssh_config: The SSHConfig to use when connecting
+        :param on_connect_error: Optional callable invoked without arguments
+            if we fail to connect e.g. to invalidate a cached ssh_config
+        :param ssh_pool: Optional SSHPool, if provided the connection is
+            leased from the pool instead of opening a new one
+        :param on_change: Optional callable invoked without arguments before
+            anything which may change the machine e.g. running a command
+            not marked as read-only or uploading a file
+        :param sync_manifests: Optional sync.ManifestCache with the local
+            manifests from earlier calls to sync(...), used to avoid hashing
+            unchanged files again. Defaults to an in-memory cache.
+        """
         self.ssh_config = ssh_config
+        self.on_connect_error = on_connect_error
+        self.ssh_pool = ssh_pool
+        self.on_change = on_change
         self.connection = None
 
+        if sync_manifests is None:
+            sync_manifests = sync.ManifestCache()
+
+        self.sync_manifests = sync_manifests
+
+    @timed("ssh connect")
     def open(self):
         """Open the SSH connection."""
 
         assert self.connection is None
 
-        ssh_client = paramiko.SSHClient()
-        ssh_client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-        ssh_client.connect(
-            hostname=self.ssh_config.hostname,
-            port=self.ssh_config.port,
-            username=self.ssh_config.username,
-            key_filename=self.ssh_config.identityfile,
-        )
-
-        sftp = ssh_client.open_sftp()
-
-        # Get home dir
-        _, stdout, _ = ssh_client.exec_command("cd ~;pwd")
-        cwd = stdout.readline().strip()
-
-        self.connection = ssh_connection.SSHConnection(
-            ssh_client=ssh_client, sftp=sftp, cwd=cwd
-        )
+        try:
+            if self.ssh_pool is not None:
+                self.connection = self.ssh_pool.acquire(ssh_config=self.ssh_config)
+            else:
+                self.connection = ssh_connection.connect(ssh_config=self.ssh_config)
+        except Exception:
+            if self.on_connect_error is not None:
+                self.on_connect_error()
+            raise
 
     def close(self):
-        """Close the SSH connection."""
-        self.connection.sftp.close()
-        self.connection.ssh_client.close()
+        """Close the SSH connection.
+
+        If the connection was leased from a pool it stays open and is
+        handed out again by the pool.
+        """
+        if self.ssh_pool is None:
+            self.connection.sftp.close()
+            self.connection.ssh_client.close()
 
         self.connection = None
 
@@ -55,43 +87,142 @@ class SSH(object):
         """
         return self.connection.cwd
 
-    def run(self, command, cwd=None):
-        """Run command on remote."""
+    @timed("ssh run")
+    def run(
+        self,
+        command,
+        cwd=None,
+        stdout_callback=None,
+        stderr_callback=None,
+        spill_threshold=None,
+        read_only=False,
+    ):
+        """Run command on remote.
+
+        :param command: The command to run
+        :param cwd: The working directory, defaults to the current working
+            directory
+        :param stdout_callback: Optional callable invoked with each line
+            written to stdout while the command runs
+        :param stderr_callback: Optional callable invoked with each line
+            written to stderr while the command runs
+        :param spill_threshold: Size in characters after which the output
+            is kept in a temporary file, which keeps the memory used
+            bounded. The RunResult then holds the end of the output and
+            the path of the file with the full output, see
+            RemoteProcess.result()
+        :param read_only: Set to true for commands which do not change the
+            machine e.g. "uname -a", this avoids restoring the machine
+            when it is reset
+        :return: The RunResult of the command
+        """
+        process = self.start(
+            command=command,
+            cwd=cwd,
+            stdout_callback=stdout_callback,
+            stderr_callback=stderr_callback,
+            spill_threshold=spill_threshold,
+            read_only=read_only,
+        )
 
+        return process.wait()
+
+    def start(
+        self,
+        command,
+        cwd=None,
+        stdout_callback=None,
+        stderr_callback=None,
+        spill_threshold=None,
+        read_only=False,
+    ):
+        """Start a command on the remote without waiting for it.
+
+        Several commands can run at the same time over the same connection,
+        each on its own channel. The returned RemoteProcess can be polled,
+        waited on, killed or iterated to get the output lines as they are
+        produced. See run() for the parameters.
+
+        :return: A RemoteProcess object
+        """
         if cwd is None:
             cwd = self.connection.cwd
 
+        if not read_only:
+            self._changed()
+
         # Make sure we are in the right directory
         command = "cd " + cwd + ";" + command
 
-        _, stdout, stderr = self.connection.ssh_client.exec_command(command)
+        channel = self.connection.ssh_client.get_transport().open_session()
 
-        return_code = stdout.channel.recv_exit_status()
-        stdout = "".join(stdout.readlines())
-        stderr = "".join(stderr.readlines())
+        # The process id of the remote shell is written first so we are able
+        # to kill the command
+        channel.exec_command("echo $$;" + command)
 
-        result = runresult.RunResult(
+        return remote_process.RemoteProcess(
+            channel=channel,
             command=command,
             cwd=cwd,
-            stdout=stdout,
-            stderr=stderr,
-            returncode=return_code,
+            stdout_callback=stdout_callback,
+            stderr_callback=stderr_callback,
+            spill_threshold=spill_threshold,
+            read_pid=True,
         )
 
-        if result.returncode:
-            raise errors.RunResultError(runresult=result)
+    @timed("ssh run_many")
+    def run_many(self, commands, cwd=None, read_only=False):
+        """Run several commands concurrently on the remote.
+
+        :param commands: List of commands to run
+        :param cwd: The working directory, defaults to the current working
+            directory
+        :param read_only: Set to true if none of the commands change the
+            machine, see run()
+        :return: List of RunResult objects in the order of the commands
+        """
+        processes = []
+
+        try:
+            for command in commands:
+                processes.append(
+                    self.start(command=command, cwd=cwd, read_only=read_only)
+                )
+        except BaseException:
+            # Do not leave the commands already started running
+            for process in processes:
+                _abort(process)
+            raise
+
+        results = [process.wait(check=False) for process in processes]
+
+        for result in results:
+            if result.returncode:
+                raise errors.RunResultError(runresult=result)
 
-        return result
+        return results
 
     def chdir(self, path):
         """Change current working directory"""
 
         path = self._resolve_path(path)
 
-        self.connection.cwd = self.run(command="pwd", cwd=path).stdout.strip()
-
-    def put_file(self, local_file, rename_as=""):
-        """Transfer files from this machine to the remote."""
+        self.connection.cwd = self.run(
+            command="pwd", cwd=path, read_only=True
+        ).stdout.strip()
+
+    @timed("ssh put_file")
+    def put_file(self, local_file, rename_as="", channels=1, verify=False):
+        """Transfer files from this machine to the remote.
+
+        :param local_file: The file to transfer
+        :param rename_as: Optional name of the file on the remote
+        :param channels: Number of SFTP channels used to transfer ranges of
+            the file in parallel
+        :param verify: If true the sha256 of the files are compared after
+            the transfer
+        :return: A TransferStats object
+        """
         if not os.path.isfile(local_file):
             raise RuntimeError("Not a valid file {}".format(local_file))
 
@@ -101,15 +232,37 @@ class SSH(object):
             filename = os.path.basename(local_file)
             remote_file = os.path.join(self.connection.cwd, filename)
 
-        self.connection.sftp.put(
-            localpath=local_file, remotepath=remote_file, confirm=True
+        self._changed()
+
+        stats = transfer.put(
+            transport=self.connection.ssh_client.get_transport(),
+            local_file=local_file,
+            remote_file=remote_file,
+            channels=channels,
+            verify=verify,
+            sftp=self.connection.sftp,
         )
 
         statinfo = os.stat(local_file)
         self.connection.sftp.chmod(path=remote_file, mode=statinfo.st_mode)
 
-    def get_file(self, remote_file, local_directory, rename_as=""):
-        """Transfer files from the remote to this machine."""
+        return stats
+
+    @timed("ssh get_file")
+    def get_file(
+        self, remote_file, local_directory, rename_as="", channels=1, verify=False
+    ):
+        """Transfer files from the remote to this machine.
+
+        :param remote_file: The file to transfer
+        :param local_directory: The directory where the file is stored
+        :param rename_as: Optional name of the local file
+        :param channels: Number of SFTP channels used to transfer ranges of
+            the file in parallel
+        :param verify: If true the sha256 of the files are compared after
+            the transfer
+        :return: A TransferStats object
+        """
         if not os.path.isdir(local_directory):
             raise RuntimeError("Not a valid directory {}".format(local_directory))
 
@@ -121,11 +274,205 @@ class SSH(object):
             filename = os.path.basename(remote_file)
             local_file = os.path.join(local_directory, filename)
 
-        self.connection.sftp.get(remotepath=remote_file, localpath=local_file)
+        stats = transfer.get(
+            transport=self.connection.ssh_client.get_transport(),
+            remote_file=remote_file,
+            local_file=local_file,
+            channels=channels,
+            verify=verify,
+            sftp=self.connection.sftp,
+        )
 
         statinfo = self.connection.sftp.stat(remote_file)
         os.chmod(local_file, statinfo.st_mode)
 
+        return stats
+
+    @timed("ssh put_dir")
+    def put_dir(self, local_dir, rename_as="", compress=False):
+        """Transfer a directory from this machine to the remote.
+
+        The directory is streamed as a tar archive through a single
+        command, preserving the file modes.
+
+        :param local_dir: The directory to transfer
+        :param rename_as: Optional name of the directory on the remote,
+            relative paths are relative to the current working directory
+        :param compress: If true the archive is gzip compressed
+        """
+        if not os.path.isdir(local_dir):
+            raise RuntimeError("Not a valid directory {}".format(local_dir))
+
+        if not rename_as:
+            rename_as = os.path.basename(os.path.normpath(local_dir))
+
+        remote_dir = self._resolve_path(rename_as)
+
+        self._changed()
+
+        chunks = tar_stream.tar_chunks(local_dir=local_dir)
+        if compress:
+            chunks = tar_stream.gzip_chunks(chunks=chunks)
+
+        command = "mkdir -p {0} && tar -x{1}pf - -C {0}".format(
+            shlex.quote(remote_dir), "z" if compress else ""
+        )
+
+        channel = self.connection.ssh_client.get_transport().open_session()
+        channel.exec_command(command)
+
+        process = remote_process.RemoteProcess(
+            channel=channel, command=command, cwd=self.connection.cwd
+        )
+
+        for chunk in chunks:
+            channel.sendall(chunk)
+            # Keep draining the output so the remote never blocks on it
+            process.poll()
+
+        channel.shutdown_write()
+        process.wait()
+
+    @timed("ssh get_dir")
+    def get_dir(self, remote_dir, local_directory, compress=False):
+        """Transfer a directory from the remote to this machine.
+
+        The directory is streamed as a tar archive through a single
+        command, preserving the file modes.
+
+        :param remote_dir: The directory on the remote
+        :param local_directory: The local directory where remote_dir is
+            placed
+        :param compress: If true the archive is gzip compressed
+        """
+        if not os.path.isdir(local_directory):
+            raise RuntimeError("Not a valid directory {}".format(local_directory))
+
+        remote_dir = self._resolve_path(remote_dir)
+        name = os.path.basename(os.path.normpath(remote_dir))
+
+        command = "tar -c{}f - -C {} .".format(
+            "z" if compress else "", shlex.quote(remote_dir)
+        )
+
+        channel = self.connection.ssh_client.get_transport().open_session()
+        channel.exec_command(command)
+
+        def chunks():
+            while True:
+                data = channel.recv(tar_stream.CHUNK_SIZE)
+                if not data:
+                    break
+                yield data
+
+        process = remote_process.RemoteProcess(
+            channel=channel, command=command, cwd=self.connection.cwd
+        )
+
+        local_dir = os.path.join(local_directory, name)
+        if not os.path.isdir(local_dir):
+            os.makedirs(local_dir)
+
+        try:
+            tar_stream.extract_chunks(
+                chunks=chunks(), local_dir=local_dir, compress=compress
+            )
+        except tarfile.TarError:
+            # Report the error from the remote tar if it failed
+            process.wait()
+            raise
+
+        # Read the remaining output e.g. the stderr of tar
+        process.wait()
+
+    @timed("ssh sync")
+    def sync(self, local_dir, remote_dir, delete=False, workers=None):
+        """Synchronize a local directory to the remote.
+
+        Only new or changed files are transferred, which is decided by
+        comparing the sha256 of the local files (hashed in a thread pool)
+        with the remote files. On both sides the hashes of the last sync
+        are reused for the files whose size and modification time did not
+        change, so an unchanged tree is not hashed again. The machine is
+        only marked as changed if files are uploaded or deleted.
+
+        :param local_dir: The local directory to synchronize
+        :param remote_dir: The directory on the remote, relative paths are
+            relative to the current working directory
+        :param delete: If true remote files not in local_dir are deleted
+        :param workers: Maximum number of threads used for hashing
+        :return: A SyncResult object
+        """
+        if not os.path.isdir(local_dir):
+            raise RuntimeError("Not a valid directory {}".format(local_dir))
+
+        remote_dir = self._resolve_path(remote_dir)
+
+        local = sync.local_manifest(
+            local_dir=local_dir,
+            previous=self.sync_manifests.load(local_dir, remote_dir),
+            workers=workers,
+        )
+        self.sync_manifests.store(local_dir, remote_dir, local)
+
+        output = self.run(
+            command=sync.remote_stat_command(remote_dir), read_only=True
+        ).stdout
+        remote = sync.parse_remote_stat(output=output)
+
+        to_hash = sync.reuse_remote_hashes(
+            remote=remote,
+            previous=self.sync_manifests.load(
+                local_dir, remote_dir, side=sync.ManifestCache.REMOTE
+            ),
+        )
+
+        for command in sync.remote_hash_commands(remote_dir, to_hash):
+            output = self.run(command=command, read_only=True).stdout
+
+            for path, entry in sync.parse_remote_manifest(output=output).items():
+                remote[path]["sha256"] = entry["sha256"]
+
+        changed, removed, unchanged = sync.diff(local=local, remote=remote)
+        deleted = removed if delete else []
+
+        # The uploaded files get a new modification time, they are hashed
+        # again by the next sync
+        self.sync_manifests.store(
+            local_dir,
+            remote_dir,
+            {path: remote[path] for path in unchanged},
+            side=sync.ManifestCache.REMOTE,
+        )
+
+        if changed:
+            directories = sorted(
+                set(
+                    posixpath.join(remote_dir, posixpath.dirname(path))
+                    for path in changed
+                )
+            )
+            self.run(command="mkdir -p " + " ".join(sync.quote(d) for d in directories))
+
+        for path in changed:
+            local_file = os.path.join(local_dir, *path.split("/"))
+            remote_file = posixpath.join(remote_dir, path)
+
+            self.connection.sftp.put(
+                localpath=local_file, remotepath=remote_file, confirm=True
+            )
+
+            statinfo = os.stat(local_file)
+            self.connection.sftp.chmod(path=remote_file, mode=statinfo.st_mode)
+
+        if deleted:
+            self.run(
+                command="rm -f "
+                + " ".join(sync.quote(posixpath.join(remote_dir, p)) for p in deleted)
+            )
+
+        return sync.SyncResult(uploaded=changed, deleted=deleted, unchanged=unchanged)
+
     def is_dir(self, path):
         """Return true if path is a directory"""
 
@@ -157,6 +504,11 @@ class SSH(object):
         path = self._resolve_path(path)
         self.run(command="rm {}".format(path))
 
+    def _changed(self):
+        """Called before an operation which may change the machine"""
+        if self.on_change is not None:
+            self.on_change()
+
     def _resolve_path(self, path):
         # The path is can be absolute or relative to the current
         # working directory
@@ -173,3 +525,15 @@ class SSH(object):
     def __exit__(self, type, value, traceback):
         """Use SSH with the with statement."""
         self.close()
+
+
+def _abort(process):
+    """Kill a started command and close its channel, ignoring errors"""
+    try:
+        process.kill()
+    except Exception:
+        pass
+    finally:
+        process.channel.close()
+        process.stdout.close()
+        process.stderr.close()
@@ -13,3 +13,17 @@ class SSHConfig(object):
         self.username = username
         self.port = port
         self.identityfile = identityfile
+
+    def _key(self):
+        return (self.hostname, self.username, self.port, self.identityfile)
+
+    def __eq__(self, other):
+        if not isinstance(other, SSHConfig):
+            return NotImplemented
+        return self._key() == other._key()
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self._key())
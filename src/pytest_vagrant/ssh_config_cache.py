@@ -0,0 +1,94 @@
+import hashlib
+import json
+import os
+
+from . import machine_data
+from . import ssh_config
+
+
+class SSHConfigCache(object):
+    """Persistent cache of the ssh-config of a machine.
+
+    The cache is stored as JSON in the machine's working directory. It is
+    keyed by the provider's machine id and a hash of the Vagrantfile, so
+    if the machine is re-created or the Vagrantfile changes the cached
+    value is ignored.
+    """
+
+    def __init__(self, cwd):
+        """Create a new instance
+
+        :param cwd: The working directory of the machine
+        """
+        self.cwd = cwd
+        self.path = os.path.join(cwd, "ssh_config.json")
+        self.machine_data = machine_data.MachineData(cwd=cwd, machine_index=None)
+
+    def key(self):
+        """Return the key identifying the machine or None if the machine
+        has not been created.
+        """
+        machine_id = self.machine_data.id()
+        if machine_id is None:
+            return None
+
+        vagrantfile_path = os.path.join(self.cwd, "Vagrantfile")
+        if not os.path.isfile(vagrantfile_path):
+            return None
+
+        with open(vagrantfile_path, "rb") as vagrantfile:
+            digest = hashlib.sha1(vagrantfile.read()).hexdigest()
+
+        return "{}:{}".format(machine_id, digest)
+
+    def load(self):
+        """Return the cached SSHConfig or None if not available"""
+        key = self.key()
+        if key is None:
+            return None
+
+        try:
+            with open(self.path) as cache_file:
+                data = json.load(cache_file)
+        except (IOError, OSError, ValueError):
+            return None
+
+        if data.get("key") != key:
+            return None
+
+        return ssh_config.SSHConfig(
+            hostname=data["hostname"],
+            username=data["username"],
+            port=data["port"],
+            identityfile=data["identityfile"],
+        )
+
+    def store(self, config):
+        """Store the SSHConfig in the cache
+
+        :param config: The SSHConfig object
+        """
+        key = self.key()
+        if key is None:
+            return
+
+        data = {
+            "key": key,
+            "hostname": config.hostname,
+            "username": config.username,
+            "port": config.port,
+            "identityfile": config.identityfile,
+        }
+
+        # Write to a temporary file first such that readers never see a
+        # partially written cache
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as cache_file:
+            json.dump(data, cache_file)
+
+        os.replace(tmp_path, self.path)
+
+    def invalidate(self):
+        """Remove the cached value"""
+        if os.path.isfile(self.path):
+            os.remove(self.path)
@@ -1,3 +1,8 @@
+import socket
+
+import paramiko
+
+
 class SSHConnection(object):
     """An active SSH connection"""
 
@@ -12,3 +17,38 @@ class SSHConnection(object):
         self.ssh_client = ssh_client
         self.sftp = sftp
         self.cwd = cwd
+
+
+def connect(ssh_config):
+    """Open a new SSHConnection.
+
+    :param ssh_config: The SSHConfig to use when connecting
+    :return: An SSHConnection where cwd is the home directory of the user
+    """
+    ssh_client = paramiko.SSHClient()
+    ssh_client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+
+    try:
+        ssh_client.connect(
+            hostname=ssh_config.hostname,
+            port=ssh_config.port,
+            username=ssh_config.username,
+            key_filename=ssh_config.identityfile,
+        )
+
+        # Commands and SFTP requests are small packets waiting for a reply,
+        # without this each round trip may wait for a delayed ACK
+        ssh_client.get_transport().sock.setsockopt(
+            socket.IPPROTO_TCP, socket.TCP_NODELAY, 1
+        )
+
+        sftp = ssh_client.open_sftp()
+
+        # Get home dir
+        _, stdout, _ = ssh_client.exec_command("cd ~;pwd")
+        cwd = stdout.readline().strip()
+    except Exception:
+        ssh_client.close()
+        raise
+
+    return SSHConnection(ssh_client=ssh_client, sftp=sftp, cwd=cwd)
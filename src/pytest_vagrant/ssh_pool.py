@@ -0,0 +1,98 @@
+import threading
+
+from . import ssh_connection
+
+
+class SSHPool(object):
+    """A pool of authenticated SSH connections keyed by SSHConfig.
+
+    Opening an SSH connection requires a handshake, key authentication,
+    starting the SFTP subsystem and looking up the home directory. The pool
+    does this once per SSHConfig and hands out leases sharing the
+    underlying transport. Each lease has its own current working directory.
+    """
+
+    def __init__(self, keepalive=30, connect=ssh_connection.connect):
+        """Create a new instance
+
+        :param keepalive: Interval in seconds between keepalive packets
+            sent on idle transports, 0 disables keepalives
+        :param connect: Function opening a new SSHConnection from an
+            SSHConfig
+        """
+        self.keepalive = keepalive
+        self.connect = connect
+        self.connections = {}
+        self.lock = threading.Lock()
+
+    def acquire(self, ssh_config):
+        """Lease a connection for the SSHConfig.
+
+        :param ssh_config: The SSHConfig of the machine
+        :return: An SSHConnection with its cwd set to the home directory
+        """
+        with self.lock:
+            connection = self.connections.get(ssh_config)
+
+            if connection is not None and not self._is_alive(connection):
+                self._close(connection)
+                connection = None
+
+            if connection is None:
+                connection = self.connect(ssh_config=ssh_config)
+
+                transport = connection.ssh_client.get_transport()
+                if transport is not None and self.keepalive:
+                    transport.set_keepalive(self.keepalive)
+
+                self.connections[ssh_config] = connection
+
+        return ssh_connection.SSHConnection(
+            ssh_client=connection.ssh_client,
+            sftp=connection.sftp,
+            cwd=connection.cwd,
+        )
+
+    def evict(self, ssh_config):
+        """Close the pooled connection for the SSHConfig (if any).
+
+        Used when the machine's state changes e.g. after a snapshot
+        restore where the existing connections are no longer valid.
+        """
+        with self.lock:
+            connection = self.connections.pop(ssh_config, None)
+
+        if connection is not None:
+            self._close(connection)
+
+    def close(self):
+        """Close all pooled connections"""
+        with self.lock:
+            connections = list(self.connections.values())
+            self.connections.clear()
+
+        for connection in connections:
+            self._close(connection)
+
+    def __len__(self):
+        return len(self.connections)
+
+    def _is_alive(self, connection):
+        """Health check the transport of a pooled connection"""
+        transport = connection.ssh_client.get_transport()
+
+        if transport is None or not transport.is_active():
+            return False
+
+        try:
+            transport.send_ignore()
+        except Exception:
+            return False
+
+        return True
+
+    def _close(self, connection):
+        try:
+            connection.sftp.close()
+        finally:
+            connection.ssh_client.close()
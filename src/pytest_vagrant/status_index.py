@@ -0,0 +1,76 @@
+import os
+import threading
+import time
+
+from . import parse
+
+
+class StatusIndex(object):
+    """The status of all machines from a single vagrant command.
+
+    Running 'vagrant status' for every machine starts Vagrant once per
+    machine. The index runs 'vagrant global-status --machine-readable' once
+    and serves the status of every machine from its result. The states are
+    read from Vagrant's machine index, which Vagrant updates whenever it
+    runs a command for a machine.
+    """
+
+    def __init__(self, shell, ttl=None):
+        """Create a new instance
+
+        :param shell: A Shell object for running commands
+        :param ttl: Number of seconds the index is considered valid. If None
+            it is valid until invalidate() is called.
+        """
+        self.shell = shell
+        self.ttl = ttl
+
+        self.statuses = None
+        self.time = None
+        self.lock = threading.Lock()
+
+    def status(self, cwd):
+        """Return the status of the machine in cwd.
+
+        :param cwd: The working directory of the machine
+        :return: A MachineStatus or None if the machine is not in the index
+        """
+        with self.lock:
+            if self.statuses is None or self._expired():
+                self._refresh()
+
+            return self.statuses.get(_key(cwd))
+
+    def refresh(self):
+        """Run 'vagrant global-status' and rebuild the index"""
+        with self.lock:
+            self._refresh()
+
+    def invalidate(self):
+        """Drop the index, the next lookup rebuilds it e.g. after a machine
+        changed its state.
+        """
+        with self.lock:
+            self.statuses = None
+            self.time = None
+
+    def _refresh(self):
+        output = self.shell.run(
+            cmd="vagrant global-status --machine-readable", cwd=None
+        )
+
+        self.statuses = {
+            _key(home): status
+            for home, status in parse.to_global_status(output=output).items()
+        }
+        self.time = time.monotonic()
+
+    def _expired(self):
+        if self.ttl is None:
+            return False
+
+        return time.monotonic() - self.time >= self.ttl
+
+
+def _key(cwd):
+    return os.path.normcase(os.path.realpath(cwd))
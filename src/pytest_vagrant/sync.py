@@ -0,0 +1,278 @@
+import concurrent.futures
+import hashlib
+import json
+import os
+import re
+import shlex
+import threading
+
+# Number of bytes read at a time when hashing a file
+CHUNK_SIZE = 1024 * 1024
+
+# Maximum number of files hashed by one remote sha256sum command, keeps the
+# command line short
+HASH_BATCH = 500
+
+# The escapes sha256sum uses for file names containing these characters
+_ESCAPE = re.compile(r"\\(.)")
+_ESCAPES = {"\\": "\\", "n": "\n", "r": "\r"}
+
+
+class SyncResult(object):
+    """The outcome of SSH.sync(...)
+
+    Attributes:
+    :uploaded: Relative paths of the files that were transferred
+    :deleted: Relative paths of the files deleted on the remote
+    :unchanged: Relative paths of the files already up to date
+    """
+
+    def __init__(self, uploaded, deleted, unchanged):
+        """Create a new SyncResult object"""
+        self.uploaded = uploaded
+        self.deleted = deleted
+        self.unchanged = unchanged
+
+    def __str__(self):
+        return "SyncResult: {} uploaded, {} deleted, {} unchanged".format(
+            len(self.uploaded), len(self.deleted), len(self.unchanged)
+        )
+
+
+class ManifestCache(object):
+    """Cache of the manifests from earlier syncs.
+
+    The local and the remote manifest are kept per (local_dir, remote_dir)
+    pair. If a path is given they are stored as JSON e.g. in the machine's
+    working directory, so they survive the SSH object and are shared with
+    later sessions.
+    """
+
+    # The sides of a sync
+    LOCAL = "local"
+    REMOTE = "remote"
+
+    def __init__(self, path=None):
+        """Create a new instance
+
+        :param path: Optional path of the JSON file, None keeps the
+            manifests in memory only
+        """
+        self.path = path
+        self.manifests = None
+        self.lock = threading.Lock()
+
+    def load(self, local_dir, remote_dir, side=LOCAL):
+        """Return the manifest of a side from the last sync or None"""
+        with self.lock:
+            return self._manifests().get(_cache_key(local_dir, remote_dir, side))
+
+    def store(self, local_dir, remote_dir, manifest, side=LOCAL):
+        """Store the manifest of a side of a sync"""
+        with self.lock:
+            manifests = self._manifests()
+            manifests[_cache_key(local_dir, remote_dir, side)] = manifest
+
+            if self.path is None:
+                return
+
+            # Write to a temporary file first such that readers never see
+            # a partially written cache
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w") as cache_file:
+                json.dump(manifests, cache_file)
+
+            os.replace(tmp_path, self.path)
+
+    def _manifests(self):
+        if self.manifests is not None:
+            return self.manifests
+
+        self.manifests = {}
+
+        if self.path is not None:
+            try:
+                with open(self.path) as cache_file:
+                    self.manifests = json.load(cache_file)
+            except (IOError, OSError, ValueError):
+                pass
+
+        return self.manifests
+
+
+def _cache_key(local_dir, remote_dir, side):
+    return "\n".join([side, os.path.abspath(local_dir), remote_dir])
+
+
+def file_hash(path):
+    """Return the sha256 hex digest of a file"""
+    digest = hashlib.sha256()
+
+    with open(path, "rb") as hashed_file:
+        for chunk in iter(lambda: hashed_file.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+
+    return digest.hexdigest()
+
+
+def local_manifest(local_dir, previous=None, workers=None):
+    """Build the manifest of a local directory.
+
+    The manifest maps the relative path of every file to a dict with its
+    "size", "mtime" and "sha256". Files are hashed in a thread pool, the
+    hash is reused from the previous manifest if size and mtime match.
+
+    :param local_dir: The directory to scan
+    :param previous: Optional manifest from an earlier scan
+    :param workers: Maximum number of hashing threads
+    """
+    previous = previous or {}
+    manifest = {}
+    to_hash = []
+
+    for root, _, files in os.walk(local_dir):
+        for name in files:
+            path = os.path.join(root, name)
+            if not os.path.isfile(path):
+                continue
+
+            relpath = os.path.relpath(path, local_dir).replace(os.sep, "/")
+            statinfo = os.stat(path)
+
+            entry = {"size": statinfo.st_size, "mtime": statinfo.st_mtime}
+            old = previous.get(relpath)
+
+            if old and old["size"] == entry["size"] and old["mtime"] == entry["mtime"]:
+                entry["sha256"] = old["sha256"]
+            else:
+                to_hash.append((relpath, path))
+
+            manifest[relpath] = entry
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        hashes = executor.map(lambda item: file_hash(item[1]), to_hash)
+
+        for (relpath, _), digest in zip(to_hash, hashes):
+            manifest[relpath]["sha256"] = digest
+
+    return manifest
+
+
+def remote_stat_command(remote_dir):
+    """Return the command listing the size and modification time of all
+    files in remote_dir, see parse_remote_stat(...). Nothing is listed if
+    remote_dir does not exist.
+    """
+    return (
+        "if [ -d {0} ]; then cd {0} && find . -type f -printf '%s %T@ %P\\0'; fi"
+    ).format(shlex.quote(remote_dir))
+
+
+def parse_remote_stat(output):
+    """Parse the output of remote_stat_command(...)
+
+    :return: Dict mapping the relative path to a dict with the "size" and
+        "mtime", the latter as string to compare it exactly
+    """
+    manifest = {}
+
+    for record in output.split("\0"):
+        if not record:
+            continue
+
+        size, mtime, path = record.split(" ", 2)
+        manifest[path] = {"size": int(size), "mtime": mtime}
+
+    return manifest
+
+
+def reuse_remote_hashes(remote, previous=None):
+    """Copy the hashes of the files whose size and mtime did not change
+    since the previous remote manifest.
+
+    :return: Sorted list of the paths which must be hashed
+    """
+    previous = previous or {}
+    to_hash = []
+
+    for path, entry in sorted(remote.items()):
+        old = previous.get(path)
+
+        if old and old["size"] == entry["size"] and old["mtime"] == entry["mtime"]:
+            entry["sha256"] = old["sha256"]
+        else:
+            to_hash.append(path)
+
+    return to_hash
+
+
+def remote_hash_commands(remote_dir, paths):
+    """Return the commands hashing the files in remote_dir, HASH_BATCH
+    files at a time. See parse_remote_manifest(...) for the output.
+    """
+    return [
+        "cd {} && sha256sum -- {}".format(
+            shlex.quote(remote_dir),
+            " ".join(shlex.quote(path) for path in paths[index : index + HASH_BATCH]),
+        )
+        for index in range(0, len(paths), HASH_BATCH)
+    ]
+
+
+def parse_remote_manifest(output):
+    """Parse the output of sha256sum
+
+    sha256sum escapes backslashes and newlines in file names and marks such
+    lines with a leading backslash.
+
+    :return: Dict mapping the relative path to a dict with the "sha256"
+    """
+    manifest = {}
+
+    for line in output.splitlines():
+        if not line:
+            continue
+
+        escaped = line.startswith("\\")
+        if escaped:
+            line = line[1:]
+
+        # The digest is followed by a space and ' ' or '*' for binary mode
+        digest, path = line.split(" ", 1)
+        path = path[1:]
+
+        if escaped:
+            path = _ESCAPE.sub(
+                lambda match: _ESCAPES.get(match.group(1), match.group(0)), path
+            )
+
+        if path.startswith("./"):
+            path = path[2:]
+
+        manifest[path] = {"sha256": digest}
+
+    return manifest
+
+
+def diff(local, remote):
+    """Compare a local and a remote manifest
+
+    :return: Tuple (changed, removed, unchanged) of sorted relative paths
+    """
+    changed = []
+    unchanged = []
+
+    for path, entry in sorted(local.items()):
+        if path in remote and remote[path]["sha256"] == entry["sha256"]:
+            unchanged.append(path)
+        else:
+            changed.append(path)
+
+    removed = sorted(path for path in remote if path not in local)
+
+    return changed, removed, unchanged
+
+
+def quote(path):
+    """Quote a relative path for the remote shell"""
+    return shlex.quote(path)
@@ -0,0 +1,130 @@
+import io
+import os
+import stat
+import tarfile
+import zlib
+
+# Number of bytes read from files and channels at a time
+CHUNK_SIZE = 65536
+
+
+def tar_chunks(local_dir):
+    """Generate a tar archive of a directory as a stream of chunks.
+
+    The archive is produced one chunk at a time so it never has to exist
+    fully in memory or on disk. The paths in the archive are relative to
+    local_dir.
+
+    :param local_dir: The directory to archive
+    """
+    for root, dirs, files in os.walk(local_dir):
+        dirs.sort()
+
+        for name in dirs + sorted(files):
+            path = os.path.join(root, name)
+            arcname = os.path.relpath(path, local_dir)
+
+            for chunk in _member_chunks(path=path, arcname=arcname):
+                yield chunk
+
+    # The end of an archive is marked by two zero blocks, padded to a
+    # full record
+    yield tarfile.NUL * (tarfile.RECORDSIZE)
+
+
+def gzip_chunks(chunks, level=6):
+    """Compress a stream of chunks with gzip
+
+    :param chunks: Iterable of bytes
+    :param level: The compression level
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+
+    yield compressor.flush()
+
+
+def extract_chunks(chunks, local_dir, compress=False):
+    """Extract a tar archive given as a stream of chunks
+
+    :param chunks: Iterable of bytes
+    :param local_dir: The directory to extract to
+    :param compress: True if the archive is gzip compressed
+    """
+    mode = "r|gz" if compress else "r|"
+
+    with tarfile.open(fileobj=ChunkReader(chunks), mode=mode) as tar:
+        if hasattr(tarfile, "tar_filter"):
+            # Keep the file modes, but refuse absolute paths and links
+            # outside the destination
+            tar.extractall(path=local_dir, filter="tar")
+        else:
+            tar.extractall(path=local_dir)
+
+
+class ChunkReader(io.RawIOBase):
+    """File-like object reading from an iterable of bytes"""
+
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.pending = b""
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while not self.pending:
+            try:
+                self.pending = next(self.chunks)
+            except StopIteration:
+                return 0
+
+        size = min(len(buffer), len(self.pending))
+        buffer[:size] = self.pending[:size]
+        self.pending = self.pending[size:]
+
+        return size
+
+
+def _member_chunks(path, arcname):
+    statinfo = os.lstat(path)
+
+    info = tarfile.TarInfo(name=arcname.replace(os.sep, "/"))
+    info.mode = stat.S_IMODE(statinfo.st_mode)
+    info.mtime = statinfo.st_mtime
+
+    if stat.S_ISLNK(statinfo.st_mode):
+        info.type = tarfile.SYMTYPE
+        info.linkname = os.readlink(path)
+    elif stat.S_ISDIR(statinfo.st_mode):
+        info.type = tarfile.DIRTYPE
+    elif stat.S_ISREG(statinfo.st_mode):
+        info.type = tarfile.REGTYPE
+        info.size = statinfo.st_size
+    else:
+        # Skip sockets, fifos and devices
+        return
+
+    yield info.tobuf(format=tarfile.PAX_FORMAT)
+
+    if info.type != tarfile.REGTYPE:
+        return
+
+    remaining = info.size
+
+    with open(path, "rb") as member:
+        while remaining > 0:
+            data = member.read(min(CHUNK_SIZE, remaining))
+            if not data:
+                # The file shrank while reading, pad to the announced size
+                data = tarfile.NUL * remaining
+            remaining -= len(data)
+            yield data
+
+    blocks, padding = divmod(info.size, tarfile.BLOCKSIZE)
+    if padding:
+        yield tarfile.NUL * (tarfile.BLOCKSIZE - padding)
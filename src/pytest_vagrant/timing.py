@@ -0,0 +1,88 @@
+import contextlib
+import functools
+import threading
+import time
+
+# Callables invoked as listener(operation, seconds, depth) whenever an
+# operation finishes
+_listeners = []
+
+# Tracks how deeply operations are nested in each thread e.g. Machine.up()
+# running Shell.run("vagrant up")
+_state = threading.local()
+
+
+def add_listener(listener):
+    """Register a callable receiving the timing events.
+
+    The listener is invoked with the name of the operation, its duration in
+    seconds and its depth i.e. the number of timed operations it is nested
+    in. Summing the operations at depth 0 gives the total time spent.
+    """
+    _listeners.append(listener)
+
+
+def remove_listener(listener):
+    """Unregister a listener added with add_listener()"""
+    _listeners.remove(listener)
+
+
+@contextlib.contextmanager
+def measure(operation):
+    """Time the body of a with statement and report it to the listeners
+
+    :param operation: The name of the operation e.g. "vagrant up"
+    """
+    if not _listeners:
+        yield
+        return
+
+    depth = getattr(_state, "depth", 0)
+    _state.depth = depth + 1
+    start = time.perf_counter()
+
+    try:
+        yield
+    finally:
+        _state.depth = depth
+        record(operation, time.perf_counter() - start, depth)
+
+
+def record(operation, seconds, depth=0):
+    """Report an operation timed by the caller to the listeners.
+
+    Used where measure() does not fit e.g. in coroutines, which share the
+    thread and therefore the nesting depth with other tasks.
+    """
+    for listener in list(_listeners):
+        listener(operation, seconds, depth)
+
+
+def timed(operation):
+    """Decorator timing every call of a function, see measure()"""
+
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with measure(operation):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def shell_operation(cmd):
+    """Return the operation name of a shell command.
+
+    The name is the command without its options and arguments e.g.
+    "vagrant snapshot restore reset" becomes "vagrant snapshot restore".
+    """
+    words = []
+
+    for word in cmd.split()[:3]:
+        if word.startswith("-"):
+            break
+        words.append(word)
+
+    return " ".join(words)
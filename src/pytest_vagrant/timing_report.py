@@ -0,0 +1,205 @@
+import csv
+import json
+import threading
+
+
+class TimingReport(object):
+    """Collects timing events and aggregates them per test and operation.
+
+    An instance is registered as listener with timing.add_listener(). The
+    pytest plugin keeps test and when up to date.
+
+    Only the operations of the thread running the tests are attributed to
+    the running test. The operations of other threads e.g. the restores of
+    the MachinePool or the machines prepared by the BootScheduler are
+    background work, recorded with when set to "background".
+    """
+
+    # The phase of the operations run outside of the test thread
+    BACKGROUND = "background"
+
+    def __init__(self, thread=None):
+        """Create a new instance
+
+        :param thread: The thread running the tests, defaults to the
+            current thread
+        """
+        self.events = []
+        self.lock = threading.Lock()
+
+        if thread is None:
+            thread = threading.current_thread()
+
+        self.thread = thread
+
+        # The node id of the running test and the pytest phase (setup,
+        # call or teardown), None outside of tests
+        self.test = None
+        self.when = None
+
+    def __call__(self, operation, seconds, depth):
+        """Record a timing event, see timing.add_listener()"""
+        thread = threading.current_thread()
+
+        if thread is self.thread:
+            test, when = self.test, self.when
+        else:
+            test, when = None, TimingReport.BACKGROUND
+
+        with self.lock:
+            self.events.append(
+                {
+                    "test": test,
+                    "when": when,
+                    "thread": thread.name,
+                    "operation": operation,
+                    "seconds": seconds,
+                    "depth": depth,
+                }
+            )
+
+    def operations(self):
+        """Return a dict mapping each operation to its count, total, mean
+        and max duration.
+        """
+        with self.lock:
+            events = list(self.events)
+
+        operations = {}
+
+        for event in events:
+            stats = operations.setdefault(
+                event["operation"], {"count": 0, "total": 0.0, "max": 0.0}
+            )
+            stats["count"] += 1
+            stats["total"] += event["seconds"]
+            stats["max"] = max(stats["max"], event["seconds"])
+
+        for stats in operations.values():
+            stats["mean"] = stats["total"] / stats["count"]
+
+        return operations
+
+    def tests(self):
+        """Return a dict mapping each test (None for time outside tests) to
+        a dict with the total time per pytest phase.
+        """
+        with self.lock:
+            events = list(self.events)
+
+        tests = {}
+
+        for event in events:
+            # Nested operations are already included in their parent
+            if event["depth"] or event["when"] == TimingReport.BACKGROUND:
+                continue
+
+            phases = tests.setdefault(event["test"], {})
+            when = event["when"] or "session"
+            phases[when] = phases.get(when, 0.0) + event["seconds"]
+
+        return tests
+
+    def background(self):
+        """Return the total seconds of the operations run in background
+        threads, these are not included in tests().
+        """
+        with self.lock:
+            events = list(self.events)
+
+        return sum(
+            event["seconds"]
+            for event in events
+            if event["when"] == TimingReport.BACKGROUND and not event["depth"]
+        )
+
+    def summary(self, slowest=5):
+        """Return the lines of a summary table"""
+        lines = [
+            "{:<32} {:>7} {:>10} {:>9} {:>9}".format(
+                "operation", "count", "total [s]", "mean [s]", "max [s]"
+            )
+        ]
+
+        operations = sorted(
+            self.operations().items(), key=lambda item: -item[1]["total"]
+        )
+
+        for operation, stats in operations:
+            lines.append(
+                "{:<32} {:>7} {:>10.2f} {:>9.3f} {:>9.3f}".format(
+                    operation,
+                    stats["count"],
+                    stats["total"],
+                    stats["mean"],
+                    stats["max"],
+                )
+            )
+
+        tests = [
+            (sum(phases.values()), test, phases)
+            for test, phases in self.tests().items()
+            if test is not None
+        ]
+
+        if tests:
+            lines.append("")
+            lines.append("slowest tests (time spent in pytest-vagrant):")
+
+            for total, test, phases in sorted(tests, reverse=True)[:slowest]:
+                details = ", ".join(
+                    "{} {:.2f}".format(when, seconds)
+                    for when, seconds in sorted(phases.items())
+                )
+                lines.append("{:>8.2f} s {} ({})".format(total, test, details))
+
+        background = self.background()
+
+        if background:
+            lines.append("")
+            lines.append(
+                "background work (not included in the tests): {:.2f} s".format(
+                    background
+                )
+            )
+
+        return lines
+
+    def write(self, path):
+        """Write the events to a file.
+
+        The file is CSV if path ends with .csv otherwise JSON with the
+        events and the aggregated operations and tests.
+        """
+        with self.lock:
+            events = list(self.events)
+
+        if path.endswith(".csv"):
+            with open(path, "w", newline="") as report:
+                writer = csv.DictWriter(
+                    report,
+                    fieldnames=[
+                        "test",
+                        "when",
+                        "thread",
+                        "operation",
+                        "seconds",
+                        "depth",
+                    ],
+                )
+                writer.writeheader()
+                writer.writerows(events)
+            return
+
+        data = {
+            "events": events,
+            "operations": self.operations(),
+            "tests": {
+                str(test) if test is not None else "session": phases
+                for test, phases in self.tests().items()
+            },
+            "background": self.background(),
+        }
+
+        with open(path, "w") as report:
+            json.dump(data, report, indent=2)
@@ -0,0 +1,256 @@
+import contextlib
+import hashlib
+import os
+import shlex
+import threading
+import time
+
+import paramiko
+
+# Flow control window and packet size of the SFTP channels used for
+# transfers. Larger than paramiko's defaults to keep more data in flight.
+WINDOW_SIZE = 32 * 1024 * 1024
+MAX_PACKET_SIZE = 64 * 1024
+
+# Size of the reads and writes issued per SFTP channel
+CHUNK_SIZE = 1024 * 1024
+
+# Number of chunks requested at a time per SFTP channel when downloading,
+# bounds the memory used for data in flight
+READV_BATCH = 16
+
+
+class TransferStats(object):
+    """Statistics about a file transfer
+
+    Attributes:
+    :path: The path of the file on the remote
+    :size: Number of bytes transferred
+    :seconds: The duration of the transfer
+    :channels: Number of SFTP channels used
+    """
+
+    def __init__(self, path, size, seconds, channels):
+        """Create a new TransferStats object"""
+        self.path = path
+        self.size = size
+        self.seconds = seconds
+        self.channels = channels
+
+    @property
+    def throughput(self):
+        """Return the throughput in bytes per second"""
+        if self.seconds <= 0:
+            return float("inf")
+
+        return self.size / self.seconds
+
+    def __str__(self):
+        return "{}: {} bytes in {:.3f} s ({:.1f} MB/s, {} channel(s))".format(
+            self.path,
+            self.size,
+            self.seconds,
+            self.throughput / 1e6,
+            self.channels,
+        )
+
+
+def split_ranges(size, parts):
+    """Split a file of size bytes into at most parts (offset, length) ranges
+
+    :param size: The size of the file
+    :param parts: The maximum number of ranges
+    """
+    parts = max(1, min(parts, size // CHUNK_SIZE or 1))
+    length, remainder = divmod(size, parts)
+
+    ranges = []
+    offset = 0
+
+    for part in range(parts):
+        part_length = length + (1 if part < remainder else 0)
+        ranges.append((offset, part_length))
+        offset += part_length
+
+    return ranges
+
+
+def put(transport, local_file, remote_file, channels=1, verify=False, sftp=None):
+    """Upload a file using pipelined writes.
+
+    :param transport: The paramiko.Transport of the connection
+    :param local_file: Path to the local file
+    :param remote_file: Path to the remote file
+    :param channels: Number of SFTP channels transferring ranges of the file
+        in parallel
+    :param verify: If true compare the sha256 of both files afterwards
+    :param sftp: Optional paramiko.SFTPClient of the connection, used
+        instead of opening a new SFTP channel if a single channel is used
+    :return: A TransferStats object
+    """
+    size = os.path.getsize(local_file)
+    ranges = split_ranges(size=size, parts=channels)
+    shared = sftp if len(ranges) == 1 else None
+
+    start = time.monotonic()
+
+    # Create (or truncate) the remote file before the ranges are written
+    with _sftp_client(transport, sftp) as client:
+        with client.file(remote_file, "wb") as remote:
+            remote.truncate(size)
+
+    def put_range(offset, length):
+        with _sftp_client(transport, shared) as client:
+            with client.file(remote_file, "r+b") as remote:
+                remote.set_pipelined(True)
+                remote.seek(offset)
+
+                with open(local_file, "rb") as local:
+                    local.seek(offset)
+                    _copy(source=local, destination=remote, length=length)
+
+    _run_parallel(function=put_range, ranges=ranges)
+
+    stats = TransferStats(
+        path=remote_file,
+        size=size,
+        seconds=time.monotonic() - start,
+        channels=len(ranges),
+    )
+
+    if verify:
+        _verify(transport=transport, local_file=local_file, remote_file=remote_file)
+
+    return stats
+
+
+def get(transport, remote_file, local_file, channels=1, verify=False, sftp=None):
+    """Download a file using prefetched reads.
+
+    :param transport: The paramiko.Transport of the connection
+    :param remote_file: Path to the remote file
+    :param local_file: Path to the local file
+    :param channels: Number of SFTP channels transferring ranges of the file
+        in parallel
+    :param verify: If true compare the sha256 of both files afterwards
+    :param sftp: Optional paramiko.SFTPClient of the connection, used
+        instead of opening a new SFTP channel if a single channel is used
+    :return: A TransferStats object
+    """
+    start = time.monotonic()
+
+    with _sftp_client(transport, sftp) as client:
+        size = client.stat(remote_file).st_size
+
+    ranges = split_ranges(size=size, parts=channels)
+    shared = sftp if len(ranges) == 1 else None
+
+    # Create (or truncate) the local file before the ranges are written
+    with open(local_file, "wb") as local:
+        local.truncate(size)
+
+    def get_range(offset, length):
+        with _sftp_client(transport, shared) as client:
+            with client.file(remote_file, "rb") as remote:
+                requests = [
+                    (chunk_offset, min(CHUNK_SIZE, offset + length - chunk_offset))
+                    for chunk_offset in range(offset, offset + length, CHUNK_SIZE)
+                ]
+
+                with open(local_file, "r+b") as local:
+                    local.seek(offset)
+
+                    # readv(...) issues all the read requests of a batch up
+                    # front, the batches keep the data in flight bounded
+                    for index in range(0, len(requests), READV_BATCH):
+                        batch = requests[index : index + READV_BATCH]
+
+                        for data in remote.readv(batch):
+                            local.write(data)
+
+    _run_parallel(function=get_range, ranges=ranges)
+
+    stats = TransferStats(
+        path=remote_file,
+        size=size,
+        seconds=time.monotonic() - start,
+        channels=len(ranges),
+    )
+
+    if verify:
+        _verify(transport=transport, local_file=local_file, remote_file=remote_file)
+
+    return stats
+
+
+@contextlib.contextmanager
+def _sftp_client(transport, sftp=None):
+    """Yield sftp if given, otherwise a new SFTP channel with a large
+    window which is closed afterwards.
+    """
+    if sftp is not None:
+        yield sftp
+        return
+
+    with paramiko.SFTPClient.from_transport(
+        transport, window_size=WINDOW_SIZE, max_packet_size=MAX_PACKET_SIZE
+    ) as client:
+        yield client
+
+
+def _copy(source, destination, length):
+    while length > 0:
+        data = source.read(min(CHUNK_SIZE, length))
+        if not data:
+            raise RuntimeError("Unexpected end of file")
+        destination.write(data)
+        length -= len(data)
+
+
+def _run_parallel(function, ranges):
+    """Run function(offset, length) for each range, the first one in the
+    calling thread and the rest in worker threads.
+    """
+    errors = []
+
+    def worker(offset, length):
+        try:
+            function(offset, length)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=worker, args=range_) for range_ in ranges[1:]]
+
+    for thread in threads:
+        thread.start()
+
+    try:
+        if ranges:
+            function(*ranges[0])
+    finally:
+        for thread in threads:
+            thread.join()
+
+    if errors:
+        raise errors[0]
+
+
+def _verify(transport, local_file, remote_file):
+    digest = hashlib.sha256()
+
+    with open(local_file, "rb") as local:
+        for chunk in iter(lambda: local.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+
+    channel = transport.open_session()
+    try:
+        channel.exec_command("sha256sum " + shlex.quote(remote_file))
+        output = channel.makefile("rb").read().decode("utf-8", "replace")
+        returncode = channel.recv_exit_status()
+    finally:
+        channel.close()
+
+    if returncode != 0 or output.split()[:1] != [digest.hexdigest()]:
+        raise RuntimeError(
+            "Checksum mismatch between {} and {}".format(local_file, remote_file)
+        )
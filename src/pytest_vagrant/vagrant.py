@@ -1,4 +1,13 @@
+import concurrent.futures
 import os
+import subprocess
+import threading
+
+from .prune_policy import PrunePolicy
+from .lifecycle_policy import LifecyclePolicy
+from . import errors
+from . import file_lock
+from .timing import timed
 
 # Vagrant uses the Vagrantfile as configuration file. You can read more
 # about it here:
@@ -32,6 +41,16 @@ end
 """.strip()
 
 
+# Parts of the errors Vagrant reports when its global state is stale e.g.
+# the VM was deleted behind its back or a crashed process left a lock
+STALE_ERRORS = [
+    "could not find a registered machine",
+    "the machine index which stores",
+    "another process is already executing an action on the machine",
+    "vagrant can't use the requested machine because it is locked",
+]
+
+
 def default_machines_dir():
     """This is where we put the Vagrantfiles and run vagrant commands"""
     # https://stackoverflow.com/a/4028943
@@ -42,15 +61,61 @@ def default_machines_dir():
 class Vagrant(object):
     """Vagrant provides access to a virtual machine through vagrant."""
 
-    def __init__(self, machine_factory, shell):
+    def __init__(
+        self,
+        machine_factory,
+        shell,
+        machine_index=None,
+        prune_policy=PrunePolicy.ONCE,
+        lease_clones=False,
+        lifecycle_policy=LifecyclePolicy.KEEP,
+        status_index=None,
+        box_prefetcher=None,
+    ):
         """Creates a new Vagrant object
 
         :param machines_factory: Factory object to build Machine objects
         :param shell: A Shell object for running commands
+        :param machine_index: Optional MachineIndex object, if provided we
+            only prune Vagrant's global state when the index contains stale
+            entries
+        :param prune_policy: When to prune Vagrant's global state, see
+            PrunePolicy
+        :param lease_clones: If true every Vagrant object gets its own
+            numbered clone of a machine e.g. "pytest_vagrant_0" and
+            "pytest_vagrant_1" for two pytest-xdist workers. The clone is
+            leased until release() is called.
+        :param lifecycle_policy: What shutdown() does with the machines, see
+            LifecyclePolicy
+        :param status_index: Optional StatusIndex shared with the machines
+            (see MachineFactory), it is rebuilt after pruning
+        :param box_prefetcher: Optional BoxPrefetcher, from_box waits for
+            the download of its box to finish
         """
+        if prune_policy not in PrunePolicy.POLICIES:
+            raise ValueError("Unknown prune policy {}".format(prune_policy))
+
+        if lifecycle_policy not in LifecyclePolicy.POLICIES:
+            raise ValueError("Unknown lifecycle policy {}".format(lifecycle_policy))
+
         self.machine_factory = machine_factory
         self.shell = shell
+        self.machine_index = machine_index
+        self.prune_policy = prune_policy
+        self.pruned = False
+        self.prune_lock = threading.Lock()
+        self.lease_clones = lease_clones
+        self.leases = {}
+        self.leases_lock = threading.Lock()
+        self.lifecycle_policy = lifecycle_policy
+        self.status_index = status_index
+        self.box_prefetcher = box_prefetcher
+
+        # The machines returned by from_box(...) keyed by their cwd
+        self.machines = {}
+        self.machines_lock = threading.Lock()
 
+    @timed("vagrant from_box")
     def from_box(self, box, name, box_version=None, reset=False):
         """Create a machine from the specified box.
 
@@ -60,17 +125,235 @@ class Vagrant(object):
         :param reset: If true we first restore to the 'reset' snapshot
         """
 
-        # Prune Vagrant's state to ensure we have no stale info
-        self.shell.run(cmd="vagrant global-status --prune", cwd=None)
+        if self.lease_clones:
+            name = self._lease(box=box, name=name, box_version=box_version)
 
-        machine = self.machine_factory(box=box, name=name, version=box_version)
-        if not os.path.isdir(machine.cwd):
-            os.makedirs(machine.cwd)
-            self._write_vagrantfile(machine)
+        if self.box_prefetcher is not None:
+            self.box_prefetcher.wait(box=box, version=box_version)
+
+        if self._should_prune():
+            self.prune()
+
+        try:
+            return self._from_box(
+                box=box, name=name, box_version=box_version, reset=reset
+            )
+        except subprocess.CalledProcessError as error:
+            if not self._retry_on_error(error):
+                raise
+
+            # Vagrant may have failed because of stale info, so we prune
+            # and try again
+            self.prune()
+
+            return self._from_box(
+                box=box, name=name, box_version=box_version, reset=reset
+            )
+
+    def from_boxes(self, boxes, workers=None):
+        """Create several machines concurrently.
+
+        Example:
+
+            server, client = vagrant.from_boxes([
+                {"box": "hashicorp/bionic64", "name": "server"},
+                {"box": "hashicorp/bionic64", "name": "client", "reset": True},
+            ])
+
+        If a machine fails the others are still brought up, after which a
+        FromBoxesError is raised holding the machines that were created.
+
+        :param boxes: List of dicts with the keyword arguments for
+            from_box(...) for each machine. The machines must have distinct
+            name, box and box_version combinations.
+        :param workers: Maximum number of machines created at the same time,
+            None means all at once
+        :return: List of Machine objects in the order of boxes
+        """
+        if not boxes:
+            return []
+
+        # Prune up front rather than from each of the workers
+        if self._should_prune():
+            self.prune()
+
+        workers = workers or len(boxes)
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(self.from_box, **box) for box in boxes]
+            concurrent.futures.wait(futures)
+
+        machines = []
+        failures = []
+
+        for index, future in enumerate(futures):
+            error = future.exception()
+
+            if error is None:
+                machines.append(future.result())
+            else:
+                machines.append(None)
+                failures.append((index, error))
+
+        if failures:
+            raise errors.FromBoxesError(machines=machines, failures=failures)
+
+        return machines
+
+    def handed_out(self, box, name, box_version=None):
+        """Return the machine returned by from_box for these arguments.
+
+        See from_box for the parameters.
+
+        :return: The Machine object or None if from_box has not returned
+            the machine yet
+        """
+        if self.lease_clones:
+            with self.leases_lock:
+                lease = self.leases.get((box, name, box_version))
+
+            if lease is None:
+                return None
+
+            name = lease[0]
+
+        with self.machines_lock:
+            for machine in self.machines.values():
+                if (machine.box, machine.name, machine.version) == (
+                    box,
+                    name,
+                    box_version,
+                ):
+                    return machine
+
+        return None
+
+    def shutdown(self):
+        """Apply the lifecycle policy to the machines created by this object.
+
+        Called at the end of a session. All machines are processed even if
+        one fails, after which the first error is raised.
+        """
+        with self.machines_lock:
+            machines = list(self.machines.values())
+            self.machines.clear()
+
+        if self.lifecycle_policy == LifecyclePolicy.KEEP:
+            return
+
+        failures = []
+
+        for machine in machines:
+            try:
+                with self._lock(machine):
+                    self._apply_lifecycle_policy(machine)
+            except Exception as e:
+                failures.append(e)
+
+        if failures:
+            raise failures[0]
 
-        if machine.status.not_created or machine.status.poweroff:
+    def release(self):
+        """Release the machine clones leased by this object"""
+        with self.leases_lock:
+            for _, lock in self.leases.values():
+                lock.release()
+
+            self.leases.clear()
+
+    def prune(self):
+        """Prune Vagrant's global state to ensure we have no stale info"""
+        with self.prune_lock:
+            self.shell.run(cmd="vagrant global-status --prune", cwd=None)
+            self.pruned = True
+
+        if self.status_index is not None:
+            self.status_index.invalidate()
+
+    def _should_prune(self):
+        """Return true if the prune policy requires us to prune now"""
+        if self.prune_policy == PrunePolicy.ONCE and self.pruned:
+            return False
+
+        if self.prune_policy not in [PrunePolicy.ALWAYS, PrunePolicy.ONCE]:
+            return False
+
+        if self.machine_index is not None:
+            return self.machine_index.needs_prune()
+
+        return True
+
+    def _start(self, machine):
+        """Bring the machine to the running state from any other state"""
+        status = machine.status
+
+        if status.running:
+            return
+
+        if status.saved or status.frozen:
+            # Resuming continues from the suspended state, which is much
+            # faster than booting
+            machine.resume()
+        else:
+            # not_created, poweroff, aborted, shutoff, stopped etc.
             machine.up()
 
+    def _apply_lifecycle_policy(self, machine):
+        machine.refresh()
+        status = machine.status
+
+        if status.not_created:
+            return
+
+        if self.lifecycle_policy == LifecyclePolicy.SUSPEND:
+            if status.running:
+                machine.suspend()
+        elif self.lifecycle_policy == LifecyclePolicy.HALT:
+            if status.running or status.saved or status.frozen:
+                machine.halt()
+        elif self.lifecycle_policy == LifecyclePolicy.DESTROY:
+            machine.destroy()
+
+    def _retry_on_error(self, error):
+        """Return true if we should prune and retry after a vagrant command
+        failed.
+
+        Only errors caused by stale state are retried, others e.g. a
+        failing provisioner or an unknown box are reported right away.
+
+        :param error: The subprocess.CalledProcessError of the command
+        """
+        if self.prune_policy in [PrunePolicy.ALWAYS, PrunePolicy.NEVER]:
+            return False
+
+        if self.machine_index is not None and self.machine_index.needs_prune():
+            return True
+
+        output = "{}\n{}".format(error.stderr or "", error.output or "").lower()
+        return any(stale in output for stale in STALE_ERRORS)
+
+    def _from_box(self, box, name, box_version, reset):
+        """Helper function for creating the machine"""
+
+        machine = self.machine_factory(box=box, name=name, version=box_version)
+
+        # Other processes e.g. pytest-xdist workers may be setting up the same
+        # machine, the first one to get the lock creates it and the others
+        # reuse it
+        with self._lock(machine):
+            self._setup_machine(machine=machine, reset=reset)
+
+        with self.machines_lock:
+            self.machines[machine.cwd] = machine
+
+        return machine
+
+    def _setup_machine(self, machine, reset):
+        """Helper function for bringing up the machine"""
+
+        self._create_machine_dir(machine)
+        self._start(machine)
+
         # Is this the first time we boot the machine
         snapshots = machine.snapshot_list()
 
@@ -81,10 +364,53 @@ class Vagrant(object):
             if "reset" not in snapshots:
                 raise RuntimeError("Trying to reset without snapshot!")
 
-            machine.snapshot_restore("reset")
+            # Nothing to do if the machine has not changed since the last
+            # restore
+            if machine.clean_snapshot() != "reset":
+                machine.snapshot_restore("reset")
 
         return machine
 
+    def _lease(self, box, name, box_version):
+        """Lease the first free numbered clone of a machine.
+
+        :return: The name of the leased clone
+        """
+        key = (box, name, box_version)
+
+        with self.leases_lock:
+            if key in self.leases:
+                return self.leases[key][0]
+
+            index = 0
+            while True:
+                clone_name = "{}_{}".format(name, index)
+                machine = self.machine_factory(
+                    box=box, name=clone_name, version=box_version
+                )
+
+                lock = self._lock(machine, suffix=".lease")
+                if lock.acquire(blocking=False):
+                    self.leases[key] = (clone_name, lock)
+                    return clone_name
+
+                index += 1
+
+    def _lock(self, machine, suffix=".lock"):
+        """Return a FileLock for the machine, stored next to its cwd"""
+        machines_dir = os.path.dirname(machine.cwd)
+
+        if not os.path.isdir(machines_dir):
+            os.makedirs(machines_dir, exist_ok=True)
+
+        return file_lock.FileLock(path=machine.cwd + suffix)
+
+    def _create_machine_dir(self, machine):
+        """Create the working directory and Vagrantfile if needed"""
+        if not os.path.isdir(machine.cwd):
+            os.makedirs(machine.cwd)
+            self._write_vagrantfile(machine)
+
     def _write_vagrantfile(self, machine):
         """Helper function for writing a Vagrantfile"""
 
@@ -0,0 +1,72 @@
+import mock
+import pytest
+
+import pytest_vagrant
+import stub_vagrant
+
+
+def pytest_addoption(parser):
+    parser.addoption(
+        "--run-benchmarks",
+        action="store_true",
+        default=False,
+        help="Run the tests marked with @pytest.mark.benchmark",
+    )
+
+
+def pytest_configure(config):
+    config.addinivalue_line(
+        "markers", "benchmark: wall clock benchmark, run with --run-benchmarks"
+    )
+
+
+def pytest_collection_modifyitems(config, items):
+    if config.getoption("run_benchmarks"):
+        return
+
+    # The timings depend on the machine running the tests
+    skip = pytest.mark.skip(reason="benchmark, use --run-benchmarks to run it")
+
+    for item in items:
+        if "benchmark" in item.keywords:
+            item.add_marker(skip)
+
+
+class FakeShell(object):
+    """Pretends to be a running machine keeping track of its snapshots"""
+
+    def __init__(self):
+        self.snapshots = ["reset"]
+        self.commands = []
+
+    def run(self, cmd, cwd):
+        self.commands.append(cmd)
+
+        if cmd.startswith("vagrant snapshot save "):
+            self.snapshots.append(cmd.split()[-1])
+
+        if cmd.startswith("vagrant snapshot list"):
+            return "\n".join(
+                "1583406926,default,ui,detail,{}".format(snapshot)
+                for snapshot in self.snapshots
+            )
+
+        return stub_vagrant.STATUS
+
+
+@pytest.fixture(scope="session")
+def fake_machine():
+    """Return a function creating a running Machine on top of a FakeShell"""
+
+    def fake_machine(cwd):
+        return pytest_vagrant.Machine(
+            box="hashicorp/bionic64",
+            name="pytest_vagrant",
+            version=None,
+            slug="slug",
+            cwd=cwd,
+            shell=FakeShell(),
+            ssh_factory=mock.Mock(),
+        )
+
+    return fake_machine
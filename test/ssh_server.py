@@ -0,0 +1,232 @@
+"""An in-process SSH server used by the benchmarks.
+
+Commands run with /bin/sh on the local machine with HOME set to the
+server's root directory and SFTP serves the local file system, so the
+SSH objects can be exercised without a virtual machine.
+"""
+
+import os
+import socket
+import subprocess
+import threading
+
+import paramiko
+
+
+class SSHServer(object):
+    """Accept SSH connections on 127.0.0.1 until closed"""
+
+    def __init__(self, root):
+        """Create a new instance and start listening
+
+        :param root: The directory used as home directory of the user
+        """
+        self.root = root
+        self.host_key = paramiko.RSAKey.generate(bits=2048)
+
+        # Any key is accepted, but paramiko needs one to authenticate with
+        self.identityfile = os.path.join(root, ".ssh_server_key")
+        paramiko.RSAKey.generate(bits=2048).write_private_key_file(self.identityfile)
+
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.socket.bind(("127.0.0.1", 0))
+        self.socket.listen(16)
+        self.port = self.socket.getsockname()[1]
+
+        self.transports = []
+        self.thread = threading.Thread(target=self._accept, daemon=True)
+        self.thread.start()
+
+    def close(self):
+        self.socket.close()
+
+        for transport in self.transports:
+            transport.close()
+
+    def _accept(self):
+        while True:
+            try:
+                client, _ = self.socket.accept()
+            except OSError:
+                return
+
+            # Avoid waiting for delayed ACKs on the small SSH packets
+            client.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+            transport = paramiko.Transport(client)
+            transport.add_server_key(self.host_key)
+            transport.set_subsystem_handler("sftp", paramiko.SFTPServer, _SFTPServer)
+            transport.start_server(server=_Server(root=self.root))
+            self.transports.append(transport)
+
+
+class _Server(paramiko.ServerInterface):
+    def __init__(self, root):
+        self.root = root
+
+    def get_allowed_auths(self, username):
+        return "publickey"
+
+    def check_auth_publickey(self, username, key):
+        return paramiko.AUTH_SUCCESSFUL
+
+    def check_channel_request(self, kind, chanid):
+        if kind == "session":
+            return paramiko.OPEN_SUCCEEDED
+        return paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+
+    def check_channel_exec_request(self, channel, command):
+        threading.Thread(
+            target=_exec, args=(channel, command.decode(), self.root), daemon=True
+        ).start()
+        return True
+
+
+def _exec(channel, command, root):
+    process = subprocess.Popen(
+        ["/bin/sh", "-c", command],
+        cwd=root,
+        env=dict(os.environ, HOME=root),
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        start_new_session=True,
+    )
+
+    def pump_stdin():
+        try:
+            while True:
+                data = channel.recv(32768)
+                if not data:
+                    break
+                process.stdin.write(data)
+            process.stdin.close()
+        except (OSError, EOFError):
+            pass
+
+    def pump(stream, send):
+        try:
+            while True:
+                data = stream.read1(32768)
+                if not data:
+                    break
+                send(data)
+        except (OSError, EOFError):
+            pass
+
+    threads = [
+        threading.Thread(target=pump_stdin, daemon=True),
+        threading.Thread(target=pump, args=(process.stdout, channel.sendall)),
+        threading.Thread(target=pump, args=(process.stderr, channel.sendall_stderr)),
+    ]
+
+    for thread in threads:
+        thread.start()
+
+    # stdin is left alone, the client may never close it
+    for thread in threads[1:]:
+        thread.join()
+
+    returncode = process.wait()
+
+    # Like a shell, report a command killed by a signal as 128 + signal
+    if returncode < 0:
+        returncode = 128 - returncode
+
+    # The client may have disconnected already
+    try:
+        channel.send_exit_status(returncode)
+        channel.close()
+    except (OSError, EOFError):
+        pass
+
+
+class _SFTPHandle(paramiko.SFTPHandle):
+    def stat(self):
+        try:
+            return paramiko.SFTPAttributes.from_stat(os.fstat(self.readfile.fileno()))
+        except OSError as error:
+            return paramiko.SFTPServer.convert_errno(error.errno)
+
+    def chattr(self, attr):
+        try:
+            paramiko.SFTPServer.set_file_attr(self.filename, attr)
+            return paramiko.SFTP_OK
+        except OSError as error:
+            return paramiko.SFTPServer.convert_errno(error.errno)
+
+
+class _SFTPServer(paramiko.SFTPServerInterface):
+    """Serves the local file system, paths are used as they are"""
+
+    def canonicalize(self, path):
+        return os.path.normpath(path)
+
+    def list_folder(self, path):
+        try:
+            return [
+                paramiko.SFTPAttributes.from_stat(
+                    os.lstat(os.path.join(path, name)), filename=name
+                )
+                for name in os.listdir(path)
+            ]
+        except OSError as error:
+            return paramiko.SFTPServer.convert_errno(error.errno)
+
+    def stat(self, path):
+        try:
+            return paramiko.SFTPAttributes.from_stat(os.stat(path))
+        except OSError as error:
+            return paramiko.SFTPServer.convert_errno(error.errno)
+
+    def lstat(self, path):
+        try:
+            return paramiko.SFTPAttributes.from_stat(os.lstat(path))
+        except OSError as error:
+            return paramiko.SFTPServer.convert_errno(error.errno)
+
+    def open(self, path, flags, attr):
+        mode = getattr(attr, "st_mode", None) or 0o666
+
+        try:
+            fd = os.open(path, flags | getattr(os, "O_BINARY", 0), mode)
+        except OSError as error:
+            return paramiko.SFTPServer.convert_errno(error.errno)
+
+        if flags & os.O_WRONLY:
+            fmode = "ab" if flags & os.O_APPEND else "wb"
+        elif flags & os.O_RDWR:
+            fmode = "a+b" if flags & os.O_APPEND else "r+b"
+        else:
+            fmode = "rb"
+
+        handle = _SFTPHandle(flags)
+        handle.filename = path
+        handle.readfile = handle.writefile = os.fdopen(fd, fmode)
+        return handle
+
+    def remove(self, path):
+        return self._call(os.remove, path)
+
+    def rename(self, oldpath, newpath):
+        return self._call(os.rename, oldpath, newpath)
+
+    def posix_rename(self, oldpath, newpath):
+        return self._call(os.replace, oldpath, newpath)
+
+    def mkdir(self, path, attr):
+        return self._call(os.mkdir, path)
+
+    def rmdir(self, path):
+        return self._call(os.rmdir, path)
+
+    def chattr(self, path, attr):
+        return self._call(paramiko.SFTPServer.set_file_attr, path, attr)
+
+    def _call(self, function, *args):
+        try:
+            function(*args)
+        except OSError as error:
+            return paramiko.SFTPServer.convert_errno(error.errno)
+        return paramiko.SFTP_OK
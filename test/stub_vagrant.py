@@ -0,0 +1,273 @@
+"""A stand-in for the vagrant command line used by the benchmarks.
+
+install() writes a 'vagrant' executable running main() to a directory,
+which is then put first on PATH. The machine state and snapshots are
+stored in the working directory, so the stub behaves like a single
+machine per Vagrantfile. The stub is configured through environment
+variables:
+
+    STUB_VAGRANT_LATENCY: Seconds each command sleeps (default 0)
+    STUB_VAGRANT_SSH_PORT: Port reported by 'vagrant ssh-config'
+    STUB_VAGRANT_IDENTITY_FILE: Key reported by 'vagrant ssh-config'
+    STUB_VAGRANT_LOG: File where each command line is appended
+    STUB_VAGRANT_INDEX: File where the state of every machine is kept for
+        'vagrant global-status' (default: no machines are listed)
+    STUB_VAGRANT_BOXES: File with the installed boxes for 'vagrant box
+        list' and 'vagrant box add' (default: no boxes are installed)
+    STUB_VAGRANT_BOX_LATENCY: Seconds 'vagrant box add' sleeps to simulate
+        the download (default 0)
+"""
+
+import json
+import os
+import sys
+import time
+
+TIMESTAMP = "1583406926"
+
+STATE_HUMAN_LONG = {
+    "not_created": "The environment has not yet been created. Run `vagrant "
+    "up` to\\ncreate the environment.",
+    "running": "The VM is running. To stop this VM%!(VAGRANT_COMMA) you can "
+    "run `vagrant halt` to\\nshut it down forcefully%!(VAGRANT_COMMA) or you "
+    "can run `vagrant suspend` to simply\\nsuspend the virtual machine.",
+    "poweroff": "The VM is powered off. To restart the VM%!(VAGRANT_COMMA) "
+    "simply run `vagrant up`",
+    "saved": "To resume this VM%!(VAGRANT_COMMA) simply run `vagrant up`.",
+}
+
+# Output of 'vagrant status --machine-readable' for a running machine, used
+# by the tests faking the vagrant command line
+STATUS = r"""
+1583408799,default,metadata,provider,virtualbox
+1583408799,default,provider-name,virtualbox
+1583408799,default,state,running
+1583408799,default,state-human-short,running
+1583408799,default,state-human-long,The VM is running. To stop this VM%!(VAGRANT_COMMA) you can run `vagrant halt` to\nshut it down forcefully%!(VAGRANT_COMMA) or you can run `vagrant suspend` to simply\nsuspend the virtual machine. In either case%!(VAGRANT_COMMA) to restart it again%!(VAGRANT_COMMA)\nsimply run `vagrant up`.
+1583408799,,ui,info,Current machine states:\n\ndefault                   running (virtualbox)\n\nThe VM is running. To stop this VM%!(VAGRANT_COMMA) you can run `vagrant halt` to\nshut it down forcefully%!(VAGRANT_COMMA) or you can run `vagrant suspend` to simply\nsuspend the virtual machine. In either case%!(VAGRANT_COMMA) to restart it again%!(VAGRANT_COMMA)\nsimply run `vagrant up`.
+""".strip()
+
+
+def install(directory):
+    """Write the vagrant executable to directory.
+
+    :return: The path to the executable
+    """
+    path = os.path.join(directory, "vagrant")
+
+    with open(path, "w") as executable:
+        executable.write(
+            "#!{}\n"
+            "import sys\n"
+            "sys.path.insert(0, {!r})\n"
+            "import stub_vagrant\n"
+            "sys.exit(stub_vagrant.main(sys.argv[1:]))\n".format(
+                sys.executable, os.path.dirname(os.path.abspath(__file__))
+            )
+        )
+
+    os.chmod(path, 0o755)
+    return path
+
+
+def main(args):
+    log = os.environ.get("STUB_VAGRANT_LOG")
+    if log:
+        with open(log, "a") as log_file:
+            log_file.write(" ".join(["vagrant"] + args) + "\n")
+
+    time.sleep(float(os.environ.get("STUB_VAGRANT_LATENCY", "0")))
+
+    args = [arg for arg in args if arg != "--machine-readable"]
+    command = " ".join(args[:2]) if args[:1] in [["snapshot"], ["box"]] else args[0]
+
+    if command == "global-status":
+        _global_status()
+        return 0
+
+    if command == "box list":
+        _box_list()
+        return 0
+
+    if command == "box add":
+        return _box_add(args[2:])
+
+    machine = _load()
+
+    if command == "status":
+        _status(machine["state"])
+        return 0
+
+    if command in ["up", "resume"]:
+        _ui("==> default: Booting VM...")
+        _ui("==> default: Machine booted and ready!")
+        machine["state"] = "running"
+        _write_id("stub-machine-id")
+    elif command == "halt":
+        machine["state"] = "poweroff"
+    elif command == "suspend":
+        machine["state"] = "saved"
+    elif command == "destroy":
+        machine = {"state": "not_created", "snapshots": []}
+        _write_id(None)
+    elif command == "ssh-config":
+        _ssh_config()
+    elif command == "snapshot list":
+        _snapshot_list(machine["snapshots"])
+    elif command == "snapshot save":
+        machine["snapshots"].append(args[2])
+    elif command == "snapshot restore":
+        if args[2] not in machine["snapshots"]:
+            _error("The snapshot name `{}` was not found".format(args[2]))
+            return 1
+        machine["state"] = "running"
+    else:
+        _error("Unknown command '{}'".format(command))
+        return 1
+
+    _store(machine)
+    return 0
+
+
+def _load():
+    try:
+        with open("stub_vagrant.json") as state_file:
+            return json.load(state_file)
+    except (IOError, OSError):
+        return {"state": "not_created", "snapshots": []}
+
+
+def _store(machine):
+    with open("stub_vagrant.json", "w") as state_file:
+        json.dump(machine, state_file)
+
+    index_path = os.environ.get("STUB_VAGRANT_INDEX")
+    if not index_path:
+        return
+
+    index = _load_index(index_path)
+    index[os.getcwd()] = machine["state"]
+
+    with open(index_path, "w") as index_file:
+        json.dump(index, index_file)
+
+
+def _load_index(index_path):
+    try:
+        with open(index_path) as index_file:
+            return json.load(index_file)
+    except (IOError, OSError):
+        return {}
+
+
+def _write_id(machine_id):
+    provider_dir = os.path.join(".vagrant", "machines", "default", "virtualbox")
+    id_path = os.path.join(provider_dir, "id")
+
+    if machine_id is None:
+        if os.path.isfile(id_path):
+            os.remove(id_path)
+        return
+
+    os.makedirs(provider_dir, exist_ok=True)
+    with open(id_path, "w") as id_file:
+        id_file.write(machine_id)
+
+
+def _line(target, kind, *data):
+    print(",".join([TIMESTAMP, target, kind] + list(data)))
+
+
+def _ui(message):
+    _line("default", "ui", "info", message.replace(",", "%!(VAGRANT_COMMA)"))
+
+
+def _error(message):
+    _line("", "error-exit", "Vagrant::Errors::VagrantError", message)
+
+
+def _status(state):
+    _line("default", "metadata", "provider", "virtualbox")
+    _line("default", "provider-name", "virtualbox")
+    _line("default", "state", state)
+    _line("default", "state-human-short", state.replace("_", " "))
+    _line("default", "state-human-long", STATE_HUMAN_LONG[state])
+    _line("", "ui", "info", "Current machine states:\\n\\ndefault")
+
+
+def _global_status():
+    index_path = os.environ.get("STUB_VAGRANT_INDEX")
+    index = _load_index(index_path) if index_path else {}
+
+    _line("", "metadata", "machine-count", str(len(index)))
+
+    for number, (home, state) in enumerate(sorted(index.items())):
+        _line("", "machine-id", "{:07x}".format(number))
+        _line("", "provider-name", "virtualbox")
+        _line("", "machine-home", home)
+        _line("", "state", state)
+
+
+def _load_boxes():
+    boxes_path = os.environ.get("STUB_VAGRANT_BOXES")
+    if not boxes_path:
+        return []
+
+    try:
+        with open(boxes_path) as boxes_file:
+            return json.load(boxes_file)
+    except (IOError, OSError):
+        return []
+
+
+def _box_list():
+    for name, provider, version in _load_boxes():
+        _line("", "box-name", name)
+        _line("", "box-provider", provider)
+        _line("", "box-version", version)
+
+
+def _box_add(args):
+    name = args[0]
+    provider = args[args.index("--provider") + 1] if "--provider" in args else None
+    version = args[args.index("--box-version") + 1] if "--box-version" in args else "0"
+
+    time.sleep(float(os.environ.get("STUB_VAGRANT_BOX_LATENCY", "0")))
+
+    boxes = _load_boxes()
+
+    if [name, provider or "virtualbox", version] in boxes:
+        _error("The box you're attempting to add already exists.")
+        return 1
+
+    _ui("==> box: Successfully added box '{}' (v{})".format(name, version))
+    boxes.append([name, provider or "virtualbox", version])
+
+    with open(os.environ["STUB_VAGRANT_BOXES"], "w") as boxes_file:
+        json.dump(boxes, boxes_file)
+
+    return 0
+
+
+def _snapshot_list(snapshots):
+    _line("default", "metadata", "provider", "virtualbox")
+
+    if not snapshots:
+        _line("default", "ui", "output", "No snapshots have been taken yet!")
+        return
+
+    for snapshot in snapshots:
+        _line("default", "ui", "detail", snapshot)
+
+
+def _ssh_config():
+    print("Host default")
+    print("  HostName 127.0.0.1")
+    print("  User vagrant")
+    print("  Port {}".format(os.environ.get("STUB_VAGRANT_SSH_PORT", "2222")))
+    print("  UserKnownHostsFile /dev/null")
+    print("  StrictHostKeyChecking no")
+    print("  PasswordAuthentication no")
+    print("  IdentityFile {}".format(os.environ.get("STUB_VAGRANT_IDENTITY_FILE", "")))
+    print("  IdentitiesOnly yes")
+    print("  LogLevel FATAL")
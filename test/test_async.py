@@ -0,0 +1,85 @@
+import asyncio
+import sys
+import time
+
+import mock
+import pytest
+
+import pytest_vagrant
+from stub_vagrant import STATUS
+
+
+def test_async_shell():
+    shell = pytest_vagrant.AsyncShell()
+
+    output = asyncio.run(shell.run(cmd="echo hello", cwd=None))
+    assert output == "hello\n"
+
+    # The arguments are passed without a shell
+    output = asyncio.run(shell.run(cmd="echo 'a  b' $HOME", cwd=None))
+    assert output == "a  b $HOME\n"
+
+    with pytest.raises(pytest_vagrant.errors.ShellError) as e:
+        cmd = '{} -c "import sys; sys.exit(3)"'.format(sys.executable)
+        asyncio.run(shell.run(cmd=cmd, cwd=None))
+
+    assert e.value.runresult.returncode == 3
+
+    start = time.monotonic()
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(shell.run(cmd="sleep 10", cwd=None, timeout=0.2))
+
+    # The command was killed rather than waited for
+    assert time.monotonic() - start < 5
+
+
+def test_async_machine_status():
+    events = []
+
+    class FakeAsyncShell(object):
+        async def run(self, cmd, cwd, timeout=None):
+            events.append(("start", cwd))
+            await asyncio.sleep(0.5)
+            events.append(("end", cwd))
+            return STATUS
+
+    def machine(name):
+        return pytest_vagrant.Machine(
+            box="hashicorp/bionic64",
+            name=name,
+            version=None,
+            slug=name,
+            cwd="/tmp/" + name,
+            shell=mock.Mock(),
+            ssh_factory=mock.Mock(),
+        )
+
+    one = machine("one")
+    two = machine("two")
+    shell = FakeAsyncShell()
+
+    async def statuses():
+        return await asyncio.gather(
+            pytest_vagrant.AsyncMachine(machine=one, shell=shell).status(),
+            pytest_vagrant.AsyncMachine(machine=two, shell=shell).status(),
+        )
+
+    start = time.monotonic()
+    assert all(status.running for status in asyncio.run(statuses()))
+
+    # The commands ran concurrently rather than one after the other
+    assert events == [
+        ("start", "/tmp/one"),
+        ("start", "/tmp/two"),
+        ("end", "/tmp/one"),
+        ("end", "/tmp/two"),
+    ]
+    assert time.monotonic() - start < 1.0
+
+    # The status is shared with the wrapped machine
+    assert one.status.running
+    assert not one.shell.run.called
+
+    # Once cached the status is returned without running the command
+    asyncio.run(pytest_vagrant.AsyncMachine(machine=one, shell=shell).status())
+    assert len(events) == 4
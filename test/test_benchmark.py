@@ -0,0 +1,241 @@
+import os
+import time
+
+import pytest
+
+import pytest_vagrant
+import ssh_server
+import stub_vagrant
+
+# Only run with --run-benchmarks, see conftest.py
+pytestmark = pytest.mark.benchmark
+
+# Regression thresholds for the benchmarks. The vagrant command line is
+# replaced by a stub and the machine by an in-process SSH server, so what is
+# measured is the overhead of pytest-vagrant itself. The command counts are
+# exact, the times are compared with a baseline measured in the same run or
+# are an order of magnitude below what we see, to stay stable on slow or
+# busy CI machines.
+THRESHOLDS = {
+    # Number of vagrant commands run by from_box for a new machine and for
+    # a machine which is already running and clean
+    "from_box_cold_commands": 6,
+    "from_box_warm_commands": 2,
+    # Number of vagrant commands for looking up the status of 5 machines
+    # with a StatusIndex
+    "status_index_commands": 1,
+    # Seconds for a warm from_box on top of the vagrant commands it runs
+    "from_box_warm_overhead": 0.5,
+    # Minimum speedup of an SSH.run() on a pooled connection over opening a
+    # new connection per run
+    "ssh_run_speedup": 2.0,
+    # Minimum put_file/get_file throughput in MB/s
+    "transfer": 5.0,
+    # Mean seconds for parsing a 'vagrant status' output
+    "parse_status": 0.005,
+    # Minimum lines per second parsed from a large machine-readable output
+    # fed in chunks
+    "parse_stream": 5000,
+}
+
+
+@pytest.fixture
+def ssh_server_root(testdirectory):
+    server = ssh_server.SSHServer(root=testdirectory.mkdir("home").path())
+    yield server
+    server.close()
+
+
+@pytest.fixture
+def stub_vagrant_path(testdirectory, ssh_server_root, monkeypatch):
+    bin_dir = testdirectory.mkdir("bin").path()
+    stub_vagrant.install(directory=bin_dir)
+
+    log = os.path.join(testdirectory.path(), "vagrant.log")
+
+    monkeypatch.setenv("PATH", bin_dir + os.pathsep + os.environ["PATH"])
+    monkeypatch.setenv("STUB_VAGRANT_LOG", log)
+    monkeypatch.setenv("STUB_VAGRANT_LATENCY", "0")
+    monkeypatch.setenv(
+        "STUB_VAGRANT_INDEX", os.path.join(testdirectory.path(), "index.json")
+    )
+    monkeypatch.setenv("STUB_VAGRANT_SSH_PORT", str(ssh_server_root.port))
+    monkeypatch.setenv("STUB_VAGRANT_IDENTITY_FILE", ssh_server_root.identityfile)
+
+    return log
+
+
+def _vagrant(testdirectory, ssh_pool=None, status_index=False):
+    shell = pytest_vagrant.Shell()
+
+    if status_index:
+        status_index = pytest_vagrant.StatusIndex(shell=shell)
+    else:
+        status_index = None
+
+    machine_factory = pytest_vagrant.MachineFactory(
+        shell=shell,
+        machines_dir=testdirectory.mkdir("machines").path(),
+        ssh_factory=pytest_vagrant.SSH,
+        ssh_pool=ssh_pool,
+        status_index=status_index,
+    )
+
+    return pytest_vagrant.Vagrant(
+        machine_factory=machine_factory, shell=shell, status_index=status_index
+    )
+
+
+def _commands(log):
+    with open(log) as log_file:
+        return log_file.read().splitlines()
+
+
+def test_benchmark_from_box(testdirectory, stub_vagrant_path, record_property):
+    vagrant = _vagrant(testdirectory)
+
+    start = time.perf_counter()
+    vagrant.from_box(box="hashicorp/bionic64", name="benchmark")
+    cold = time.perf_counter() - start
+    cold_commands = _commands(stub_vagrant_path)
+
+    os.remove(stub_vagrant_path)
+
+    start = time.perf_counter()
+    machine = vagrant.from_box(box="hashicorp/bionic64", name="benchmark", reset=True)
+    warm = time.perf_counter() - start
+    warm_commands = _commands(stub_vagrant_path)
+
+    # The time for running a single stub command, this is what a warm
+    # from_box must not exceed by much
+    start = time.perf_counter()
+    machine.shell.run("vagrant status --machine-readable", cwd=machine.cwd)
+    command = time.perf_counter() - start
+
+    record_property("from_box_cold", cold)
+    record_property("from_box_warm", warm)
+
+    assert len(cold_commands) <= THRESHOLDS["from_box_cold_commands"], cold_commands
+    assert len(warm_commands) <= THRESHOLDS["from_box_warm_commands"], warm_commands
+    assert warm - len(warm_commands) * command <= THRESHOLDS["from_box_warm_overhead"]
+
+
+def test_benchmark_status_index(testdirectory, stub_vagrant_path, record_property):
+    vagrant = _vagrant(testdirectory, status_index=True)
+
+    machines = [
+        vagrant.from_box(box="hashicorp/bionic64", name="benchmark_{}".format(index))
+        for index in range(5)
+    ]
+
+    for machine in machines:
+        machine.refresh()
+
+    os.remove(stub_vagrant_path)
+
+    start = time.perf_counter()
+    assert all(machine.status.running for machine in machines)
+    record_property("status_index", time.perf_counter() - start)
+
+    commands = _commands(stub_vagrant_path)
+    assert len(commands) <= THRESHOLDS["status_index_commands"], commands
+
+
+def test_benchmark_ssh_run(testdirectory, stub_vagrant_path, record_property):
+    ssh_pool = pytest_vagrant.SSHPool()
+    vagrant = _vagrant(testdirectory, ssh_pool=ssh_pool)
+    machine = vagrant.from_box(box="hashicorp/bionic64", name="benchmark")
+
+    rounds = 20
+
+    with machine.ssh() as ssh:
+        assert ssh.run("echo hello", read_only=True).stdout.strip() == "hello"
+
+        start = time.perf_counter()
+        for _ in range(rounds):
+            ssh.run("true", read_only=True)
+        pooled = (time.perf_counter() - start) / rounds
+
+    ssh_pool.close()
+
+    # The baseline opens a new connection for each run
+    ssh_config = machine.ssh_config()
+
+    start = time.perf_counter()
+    for _ in range(rounds):
+        with pytest_vagrant.SSH(ssh_config=ssh_config) as ssh:
+            ssh.run("true", read_only=True)
+    unpooled = (time.perf_counter() - start) / rounds
+
+    record_property("ssh_run", pooled)
+    record_property("ssh_run_unpooled", unpooled)
+    assert unpooled / pooled >= THRESHOLDS["ssh_run_speedup"]
+
+
+def test_benchmark_transfer(testdirectory, stub_vagrant_path, record_property):
+    vagrant = _vagrant(testdirectory)
+    machine = vagrant.from_box(box="hashicorp/bionic64", name="benchmark")
+
+    size = 8 * 1024 * 1024
+    local_file = os.path.join(testdirectory.path(), "data.bin")
+
+    with open(local_file, "wb") as data_file:
+        data_file.write(os.urandom(size))
+
+    download_dir = testdirectory.mkdir("download").path()
+
+    with machine.ssh() as ssh:
+        start = time.perf_counter()
+        ssh.put_file(local_file=local_file, rename_as="remote.bin")
+        put = size / (time.perf_counter() - start) / 1e6
+
+        start = time.perf_counter()
+        ssh.get_file(remote_file="remote.bin", local_directory=download_dir)
+        get = size / (time.perf_counter() - start) / 1e6
+
+    assert os.path.getsize(os.path.join(download_dir, "remote.bin")) == size
+
+    record_property("put_file_mb_s", put)
+    record_property("get_file_mb_s", get)
+
+    assert put >= THRESHOLDS["transfer"]
+    assert get >= THRESHOLDS["transfer"]
+
+
+def test_benchmark_parse(capsys, record_property):
+    stub_vagrant._status("running")
+    output = capsys.readouterr().out
+
+    rounds = 2000
+
+    start = time.perf_counter()
+    for _ in range(rounds):
+        status = pytest_vagrant.parse.to_status(output=output)
+    mean = (time.perf_counter() - start) / rounds
+
+    assert status.running
+
+    record_property("parse_status", mean)
+    assert mean <= THRESHOLDS["parse_status"]
+
+
+def test_benchmark_parse_stream(capsys, record_property):
+    for _ in range(2000):
+        stub_vagrant._status("running")
+    output = capsys.readouterr().out.encode("utf-8")
+    lines = output.count(b"\n")
+
+    chunk_size = 4096
+    parser = pytest_vagrant.machine_readable.Parser()
+    events = []
+
+    start = time.perf_counter()
+    for offset in range(0, len(output), chunk_size):
+        events += parser.feed(output[offset : offset + chunk_size])
+    events += parser.finish()
+    rate = lines / (time.perf_counter() - start)
+
+    assert len(events) == lines
+
+    record_property("parse_stream_lines_s", rate)
+    assert rate >= THRESHOLDS["parse_stream"]
@@ -0,0 +1,163 @@
+import os
+import time
+
+import mock
+import pytest
+
+import pytest_vagrant
+import stub_vagrant
+from pytest_vagrant import fixtures
+
+
+def test_boot_scheduler_budget():
+    vagrant = mock.Mock()
+    boot_scheduler = pytest_vagrant.BootScheduler(
+        vagrant=vagrant, max_memory=2048, max_cpus=4
+    )
+
+    boot_scheduler.use(box="a", name="pytest_vagrant", cpus=2)
+    boot_scheduler.prepare(box="b", name="pytest_vagrant", reset=True).result()
+
+    # The CPUs would fit, but not the memory
+    with pytest.warns(UserWarning, match="budget"):
+        assert boot_scheduler.prepare(box="c", name="pytest_vagrant") is None
+
+    # The machines counted already are prepared again
+    boot_scheduler.prepare(box="b", name="pytest_vagrant", reset=True).result()
+
+    boot_scheduler.close()
+
+    vagrant.from_box.assert_called_with(
+        box="b", name="pytest_vagrant", box_version=None, reset=True
+    )
+    assert vagrant.from_box.call_count == 2
+
+
+def test_boot_scheduler_release():
+    halted = mock.Mock()
+    halted.status.running = False
+
+    vagrant = mock.Mock()
+    vagrant.handed_out.return_value = None
+
+    boot_scheduler = pytest_vagrant.BootScheduler(vagrant=vagrant, max_cpus=1)
+    boot_scheduler.use(box="a", name="pytest_vagrant")
+
+    # Machine a has not been handed out yet, so it is still counted
+    with pytest.warns(UserWarning, match="budget"):
+        assert boot_scheduler.prepare(box="b", name="pytest_vagrant") is None
+
+    # Once halted e.g. by the vagrant_pool its CPUs are released
+    vagrant.handed_out.return_value = halted
+    boot_scheduler.prepare(box="b", name="pytest_vagrant").result()
+    boot_scheduler.close()
+
+    vagrant.handed_out.assert_called_with(
+        box="a", name="pytest_vagrant", box_version=None
+    )
+    assert list(boot_scheduler.machines) == [("b", "pytest_vagrant", None)]
+
+
+def test_boot_scheduler_error():
+    vagrant = mock.Mock()
+    vagrant.from_box.side_effect = RuntimeError("boot failed")
+
+    boot_scheduler = pytest_vagrant.BootScheduler(vagrant=vagrant)
+
+    # The error is left for the test's own from_box to report
+    preparing = boot_scheduler.prepare(box="a", name="pytest_vagrant")
+    assert preparing.result() is None
+    boot_scheduler.close()
+
+
+def _item(config, *markers):
+    item = mock.Mock()
+    item.config = config
+    item.iter_markers.return_value = [marker.mark for marker in markers]
+    return item
+
+
+def test_lookahead():
+    boot_scheduler = mock.Mock()
+    boot_scheduler.vagrant.handed_out.return_value = None
+
+    config = mock.Mock()
+    config.stash = {fixtures.BOOT_SCHEDULER: boot_scheduler}
+
+    item = _item(config, pytest.mark.vagrant(box="a"))
+    same = _item(config, pytest.mark.vagrant(box="a", reset=True))
+    other = _item(config, pytest.mark.vagrant(box="b", version="1.0", cpus=2))
+
+    # The machine is in use by the running test
+    fixtures._lookahead(item=item, nextitem=same)
+    assert not boot_scheduler.prepare.called
+
+    fixtures._lookahead(item=item, nextitem=other)
+    boot_scheduler.prepare.assert_called_once_with(
+        box="b",
+        name="pytest_vagrant",
+        box_version="1.0",
+        reset=False,
+        memory=1024,
+        cpus=2,
+    )
+    boot_scheduler.prepare.reset_mock()
+
+    # A test may use any machine handed out so far, also the marked ones
+    boot_scheduler.vagrant.handed_out.return_value = mock.Mock()
+
+    fixtures._lookahead(item=item, nextitem=other)
+    assert not boot_scheduler.prepare.called
+
+    fixtures._lookahead(item=_item(config), nextitem=other)
+    assert not boot_scheduler.prepare.called
+
+    boot_scheduler.vagrant.handed_out.assert_called_with(
+        box="b", name="pytest_vagrant", box_version="1.0"
+    )
+
+
+def test_boot_scheduler_prepares_machine(testdirectory, monkeypatch):
+    bin_dir = testdirectory.mkdir("bin").path()
+    stub_vagrant.install(directory=bin_dir)
+
+    log = os.path.join(testdirectory.path(), "vagrant.log")
+    monkeypatch.setenv("PATH", bin_dir + os.pathsep + os.environ["PATH"])
+    monkeypatch.setenv("STUB_VAGRANT_LOG", log)
+    monkeypatch.setenv("STUB_VAGRANT_LATENCY", "0.1")
+
+    shell = pytest_vagrant.Shell()
+    vagrant = pytest_vagrant.Vagrant(
+        machine_factory=pytest_vagrant.MachineFactory(
+            shell=shell,
+            machines_dir=testdirectory.mkdir("machines").path(),
+            ssh_factory=pytest_vagrant.SSH,
+        ),
+        shell=shell,
+    )
+
+    def commands():
+        if not os.path.isfile(log):
+            return []
+        with open(log) as log_file:
+            return log_file.read().splitlines()
+
+    boot_scheduler = pytest_vagrant.BootScheduler(vagrant=vagrant)
+    preparing = boot_scheduler.prepare(box="hashicorp/bionic64", name="pytest_vagrant")
+
+    # Wait until the background 'vagrant up' runs
+    while "vagrant up" not in commands():
+        time.sleep(0.01)
+
+    # Waits for the preparation and finds the machine running
+    machine = vagrant.from_box(box="hashicorp/bionic64", name="pytest_vagrant")
+    assert preparing.done()
+    boot_scheduler.close()
+
+    assert machine.status.running
+    assert commands().count("vagrant up") == 1
+
+    assert (
+        vagrant.handed_out(box="hashicorp/bionic64", name="pytest_vagrant") is machine
+    )
+    assert vagrant.handed_out(box="hashicorp/bionic64", name="other") is None
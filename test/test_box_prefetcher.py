@@ -0,0 +1,168 @@
+import json
+import os
+import threading
+import time
+
+import mock
+import pytest
+
+import pytest_vagrant
+import stub_vagrant
+from pytest_vagrant import fixtures
+
+BOX_LIST = """
+1583406926,,box-name,hashicorp/bionic64
+1583406926,,box-provider,virtualbox
+1583406926,,box-version,1.0.282
+1583406926,,box-name,ubuntu/focal64
+1583406926,,box-provider,libvirt
+1583406926,,box-version,20220419.0.0
+""".strip()
+
+
+@pytest.fixture
+def stub_boxes(testdirectory, monkeypatch):
+    bin_dir = testdirectory.mkdir("bin").path()
+    stub_vagrant.install(directory=bin_dir)
+
+    boxes = os.path.join(testdirectory.path(), "boxes.json")
+    with open(boxes, "w") as boxes_file:
+        json.dump([["hashicorp/bionic64", "virtualbox", "1.0.282"]], boxes_file)
+
+    monkeypatch.setenv("PATH", bin_dir + os.pathsep + os.environ["PATH"])
+    monkeypatch.setenv("STUB_VAGRANT_BOXES", boxes)
+    monkeypatch.setenv("STUB_VAGRANT_LOG", os.path.join(testdirectory.path(), "log"))
+
+    return boxes
+
+
+def test_parse_box_list():
+    assert pytest_vagrant.parse.to_box_list(output=BOX_LIST) == [
+        ("hashicorp/bionic64", "virtualbox", "1.0.282"),
+        ("ubuntu/focal64", "libvirt", "20220419.0.0"),
+    ]
+
+
+def test_marked_boxes():
+    item = mock.Mock()
+    item.iter_markers.return_value = [
+        pytest.mark.vagrant(box="ubuntu/focal64").mark,
+        pytest.mark.vagrant("hashicorp/bionic64", version="1.0.282").mark,
+    ]
+
+    assert fixtures.marked_boxes([item]) == {
+        ("ubuntu/focal64", None),
+        ("hashicorp/bionic64", "1.0.282"),
+    }
+
+
+def test_box_prefetcher(testdirectory, stub_boxes):
+    box_prefetcher = pytest_vagrant.BoxPrefetcher(
+        shell=pytest_vagrant.Shell(), lock_dir=testdirectory.path()
+    )
+
+    box_prefetcher.prefetch(
+        [
+            ("hashicorp/bionic64", None),
+            ("hashicorp/bionic64", "1.0.282"),
+            ("ubuntu/focal64", None),
+        ]
+    )
+
+    # Only the missing box is downloaded
+    assert list(box_prefetcher.downloads) == [("ubuntu/focal64", None)]
+
+    box_prefetcher.wait(box="ubuntu/focal64")
+    box_prefetcher.wait(box="hashicorp/bionic64")
+    box_prefetcher.close()
+
+    assert ("ubuntu/focal64", "0") in box_prefetcher.installed()
+
+
+def test_box_prefetcher_wait_own_box(testdirectory):
+    started = threading.Event()
+    release = threading.Event()
+
+    def run(cmd, cwd):
+        if cmd.startswith("vagrant box add slow/box"):
+            started.set()
+            release.wait()
+        return ""
+
+    shell = mock.Mock()
+    shell.run.side_effect = run
+
+    box_prefetcher = pytest_vagrant.BoxPrefetcher(
+        shell=shell, lock_dir=testdirectory.path()
+    )
+    box_prefetcher.prefetch([("slow/box", None), ("fast/box", None)])
+
+    started.wait()
+
+    # The fast box is done while the slow box is still downloading
+    box_prefetcher.wait(box="fast/box")
+    assert not box_prefetcher.downloads[("slow/box", None)].done()
+
+    release.set()
+    box_prefetcher.wait(box="slow/box")
+    box_prefetcher.close()
+
+
+def test_box_prefetcher_wait_any_version(testdirectory):
+    shell = mock.Mock()
+    shell.run.return_value = ""
+
+    box_prefetcher = pytest_vagrant.BoxPrefetcher(
+        shell=shell, lock_dir=testdirectory.path()
+    )
+    box_prefetcher.prefetch([("ubuntu/focal64", None)])
+
+    # A test asking for a version waits for the download of the box
+    download = box_prefetcher.downloads[("ubuntu/focal64", None)]
+    box_prefetcher.wait(box="ubuntu/focal64", version="20220419.0.0")
+    assert download.done()
+
+    box_prefetcher.close()
+
+
+def test_box_prefetcher_close(testdirectory, stub_boxes, monkeypatch):
+    monkeypatch.setenv("STUB_VAGRANT_BOX_LATENCY", "10")
+
+    box_prefetcher = pytest_vagrant.BoxPrefetcher(
+        shell=pytest_vagrant.Shell(), lock_dir=testdirectory.path()
+    )
+    box_prefetcher.prefetch([("ubuntu/focal64", None)])
+
+    download = box_prefetcher.downloads[("ubuntu/focal64", None)]
+
+    def adding():
+        processes = list(box_prefetcher.shell.processes)
+        return any("add" in process.args for process in processes)
+
+    # Wait for 'vagrant box add' to start
+    while not adding():
+        time.sleep(0.01)
+
+    # The download nobody waits for is killed rather than waited for
+    start = time.monotonic()
+    box_prefetcher.close()
+
+    with pytest.raises(pytest_vagrant.errors.ShellError):
+        download.result(timeout=5)
+
+    assert time.monotonic() - start < 5
+
+
+def test_vagrant_waits_for_box(testdirectory):
+    box_prefetcher = mock.Mock()
+
+    vagrant = pytest_vagrant.Vagrant(
+        machine_factory=mock.Mock(side_effect=RuntimeError("stop")),
+        shell=mock.Mock(),
+        box_prefetcher=box_prefetcher,
+    )
+
+    with pytest.raises(RuntimeError):
+        vagrant.from_box(box="ubuntu/focal64", name="pytest_vagrant")
+
+    box_prefetcher.wait.assert_called_once_with(box="ubuntu/focal64", version=None)
@@ -0,0 +1,47 @@
+import mock
+import pytest
+
+import pytest_vagrant
+
+
+def test_machine_checkpoint(testdirectory, fake_machine):
+    machine = fake_machine(cwd=testdirectory.path())
+    setup = mock.Mock()
+
+    assert machine.checkpoint("toolchain", setup=setup)
+    setup.assert_called_once_with(machine)
+    assert "vagrant snapshot restore reset" in machine.shell.commands
+    assert machine.clean_snapshot() == "toolchain"
+
+    # The checkpoint exists and the machine is clean, so nothing to do
+    machine.shell.commands = []
+    assert not machine.checkpoint("toolchain", setup=setup)
+    assert setup.call_count == 1
+    assert "vagrant snapshot restore toolchain" not in machine.shell.commands
+
+    machine.mark_dirty()
+    assert not machine.checkpoint("toolchain", setup=setup)
+    assert "vagrant snapshot restore toolchain" in machine.shell.commands
+
+    with pytest.raises(RuntimeError):
+        machine.checkpoint("data", base="missing")
+
+
+@pytest.fixture(scope="module")
+def machine(tmp_path_factory, fake_machine):
+    return fake_machine(cwd=str(tmp_path_factory.mktemp("machine")))
+
+
+def _install(machine):
+    machine.installed = True
+
+
+toolchain = pytest_vagrant.checkpoint_fixture(
+    "toolchain", setup=_install, scope="module"
+)
+
+
+def test_checkpoint_fixture(toolchain, machine):
+    assert toolchain is machine
+    assert toolchain.installed
+    assert toolchain.clean_snapshot() == "toolchain"
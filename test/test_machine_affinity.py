@@ -0,0 +1,59 @@
+import pytest_vagrant
+
+machine_affinity = pytest_vagrant.machine_affinity
+
+
+def _requirements(item):
+    name, box, reset = item
+    if box is None:
+        return []
+    return [{"box": box, "name": "pytest_vagrant", "box_version": None, "reset": reset}]
+
+
+ITEMS = [
+    ("test_1", "a", False),
+    ("test_2", "b", True),
+    ("test_3", "a", True),
+    ("test_4", None, False),
+    ("test_5", "b", False),
+    ("test_6", "a", True),
+]
+
+
+def test_group_by_machine():
+    items = machine_affinity.group_by_machine(ITEMS, requirements=_requirements)
+
+    assert [item[0] for item in items] == [
+        "test_3",
+        "test_6",
+        "test_1",
+        "test_2",
+        "test_5",
+        "test_4",
+    ]
+
+
+def test_group_by_machine_scope():
+    modules = {"test_1": "x", "test_2": "x", "test_3": "x"}
+
+    items = machine_affinity.group_by_machine(
+        ITEMS,
+        requirements=_requirements,
+        scope=lambda item: modules.get(item[0], "y"),
+    )
+
+    assert [item[0] for item in items] == [
+        "test_3",
+        "test_1",
+        "test_2",
+        "test_6",
+        "test_5",
+        "test_4",
+    ]
+
+
+def test_estimate():
+    assert machine_affinity.estimate(ITEMS, requirements=_requirements) == 2
+
+    items = machine_affinity.group_by_machine(ITEMS, requirements=_requirements)
+    assert machine_affinity.estimate(items, requirements=_requirements) == 1
@@ -0,0 +1,126 @@
+import time
+
+import mock
+import pytest
+
+import pytest_vagrant
+
+
+def _vagrant_mock():
+    def from_box(box, name, box_version, reset):
+        machine = mock.Mock()
+        machine.box = box
+        machine.version = box_version
+        machine.name = name
+        return machine
+
+    vagrant = mock.Mock()
+    vagrant.from_box.side_effect = from_box
+    return vagrant
+
+
+def test_machine_pool():
+    vagrant = _vagrant_mock()
+    pool = pytest_vagrant.MachinePool(vagrant=vagrant, size=2)
+
+    first = pool.lease(box="hashicorp/bionic64")
+    second = pool.lease(box="hashicorp/bionic64")
+    assert first.name == "pytest_vagrant_pool_0"
+    assert second.name == "pytest_vagrant_pool_1"
+
+    # The pool is exhausted
+    with pytest.raises(RuntimeError):
+        pool.lease(box="hashicorp/bionic64", timeout=0.1)
+
+    pool.release(first)
+
+    # We get the restored machine back rather than a new one
+    third = pool.lease(box="hashicorp/bionic64", timeout=5)
+    assert third is first
+    first.snapshot_restore.assert_called_once_with("reset")
+    assert vagrant.from_box.call_count == 2
+
+    stats = pool.stats()
+    assert stats["leases"] == 3
+
+    pool.close()
+
+
+def test_machine_pool_reap():
+    vagrant = _vagrant_mock()
+    pool = pytest_vagrant.MachinePool(vagrant=vagrant, size=1, idle_timeout=0)
+
+    with pool.machine(box="hashicorp/bionic64") as machine:
+        pass
+
+    # Wait for the restore, after which the idle machine is reaped
+    for _ in range(100):
+        if pool.idle.get(("hashicorp/bionic64", None)):
+            break
+        time.sleep(0.01)
+
+    second = pool.lease(box="hashicorp/bionic64", timeout=5)
+    pool.close()
+
+    machine.halt.assert_called_once_with()
+    assert second is not machine
+
+
+def test_machine_pool_reap_idle():
+    vagrant = _vagrant_mock()
+    pool = pytest_vagrant.MachinePool(vagrant=vagrant, size=1, idle_timeout=0.1)
+
+    with pool.machine(box="hashicorp/bionic64") as machine:
+        pass
+
+    # The idle machine is halted without another lease
+    for _ in range(500):
+        if machine.halt.called:
+            break
+        time.sleep(0.01)
+
+    pool.close()
+
+    machine.halt.assert_called_once_with()
+    assert not pool.idle[("hashicorp/bionic64", None)]
+    assert not pool.indices[("hashicorp/bionic64", None)]
+
+
+def test_machine_pool_restore_error():
+    vagrant = _vagrant_mock()
+    pool = pytest_vagrant.MachinePool(vagrant=vagrant, size=1)
+
+    machine = pool.lease(box="hashicorp/bionic64")
+    machine.snapshot_restore.side_effect = RuntimeError("restore failed")
+    pool.release(machine)
+
+    # The machine is dropped and set up again by the next lease
+    second = pool.lease(box="hashicorp/bionic64", timeout=5)
+    pool.close()
+
+    assert second is not machine
+    assert pool.stats()["restore_failures"] == 1
+
+
+def test_machine_pool_prefill():
+    vagrant = _vagrant_mock()
+    pool = pytest_vagrant.MachinePool(vagrant=vagrant, size=1)
+
+    # Prefilling twice leases the machine while the first restore is
+    # pending on the size-bounded restore executor
+    futures = pool.prefill(box="hashicorp/bionic64")
+    futures += pool.prefill(box="hashicorp/bionic64")
+
+    for future in futures:
+        future.result(timeout=5)
+
+    # The prefill leases are not counted as waits of the tests
+    assert pool.stats()["leases"] == 0
+
+    machine = pool.lease(box="hashicorp/bionic64", timeout=5)
+    assert machine.name == "pytest_vagrant_pool_0"
+    assert vagrant.from_box.call_count == 1
+    assert pool.stats()["leases"] == 1
+
+    pool.release(machine)
+    pool.close()
@@ -0,0 +1,73 @@
+import pytest_vagrant
+
+machine_readable = pytest_vagrant.machine_readable
+
+OUTPUT = (
+    "1583406926,default,metadata,provider,virtualbox\n"
+    "1583406926,default,ui,info,Booting VM%!(VAGRANT_COMMA) please wait\\nok\n"
+    "1583406926,default,ui,detail,Progress: 45% (Rate: 12M/s)\n"
+    "1583406926,default,state,running\n"
+    "1583406926,,error-exit,Vagrant::Errors::VagrantError,Failed ✓\n"
+)
+
+
+def test_parse_events():
+    events = machine_readable.parse(OUTPUT)
+
+    assert [event.kind for event in events] == [
+        "metadata",
+        "ui",
+        "progress",
+        "state",
+        "error-exit",
+    ]
+
+    assert events[0].data == ["provider", "virtualbox"]
+    assert events[1].level == "info"
+    assert events[1].message == "Booting VM, please wait\nok"
+    assert events[2].percent == 45
+    assert events[3].target == "default"
+    assert events[4].message == "Failed ✓"
+
+
+def test_parser_chunks():
+    data = OUTPUT.encode("utf-8")
+    parser = machine_readable.Parser()
+    events = []
+
+    # Feed one byte at a time, splitting the multi-byte character
+    for index in range(len(data)):
+        events += parser.feed(data[index : index + 1])
+
+    events += parser.finish()
+
+    assert [event.data for event in events] == [
+        event.data for event in machine_readable.parse(OUTPUT)
+    ]
+
+
+def test_parser_text():
+    parser = machine_readable.Parser()
+
+    events = parser.feed("Host default\n  HostName 127.0.0.1")
+    assert [event.message for event in events] == ["Host default"]
+
+    # The last line is only complete when the output ends
+    events = parser.finish()
+    assert events[0].kind == machine_readable.Event.TEXT
+    assert events[0].message == "  HostName 127.0.0.1"
+
+
+def test_parse_ssh_config_machine_readable():
+    output = (
+        "1583406926,default,metadata,provider,virtualbox\n"
+        "1583406926,default,ui,output,Host default\\n  HostName 127.0.0.1\\n"
+        "  User vagrant\\n  Port 2222\\n"
+        '  IdentityFile "/home/my user/private_key"\\n'
+    )
+
+    ssh_config = pytest_vagrant.parse.to_ssh_config(output=output)
+
+    assert ssh_config.hostname == "127.0.0.1"
+    assert ssh_config.port == 2222
+    assert ssh_config.identityfile == "/home/my user/private_key"
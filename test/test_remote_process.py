@@ -0,0 +1,113 @@
+import os
+
+import pytest
+
+import pytest_vagrant
+from pytest_vagrant.remote_process import RemoteProcess
+
+
+class FakeChannel(object):
+    """Replays stdout/stderr chunks like a paramiko.Channel"""
+
+    def __init__(self, stdout, stderr, exit_status):
+        self.stdout = list(stdout)
+        self.stderr = list(stderr)
+        self.exit_status = exit_status
+        self.closed = False
+        self.eof_received = False
+
+    def recv_ready(self):
+        return bool(self.stdout)
+
+    def recv(self, size):
+        return self.stdout.pop(0)
+
+    def recv_stderr_ready(self):
+        return bool(self.stderr)
+
+    def recv_stderr(self, size):
+        return self.stderr.pop(0)
+
+    def exit_status_ready(self):
+        self.eof_received = not self.stdout and not self.stderr
+        return self.eof_received
+
+    def recv_exit_status(self):
+        return self.exit_status
+
+    def fileno(self):
+        raise AssertionError("Should not block on a fake channel")
+
+
+def test_remote_process_callbacks():
+    channel = FakeChannel(
+        stdout=[b"hel", b"lo\nwor", b"ld\n", b"\xc3", b"\xa6"],
+        stderr=[b"warning\n"],
+        exit_status=0,
+    )
+
+    stdout_lines = []
+    stderr_lines = []
+
+    process = RemoteProcess(
+        channel=channel,
+        command="cmd",
+        cwd="/home/vagrant",
+        stdout_callback=stdout_lines.append,
+        stderr_callback=stderr_lines.append,
+    )
+
+    result = process.wait()
+
+    assert stdout_lines == ["hello", "world", "æ"]
+    assert stderr_lines == ["warning"]
+    assert result.stdout == "hello\nworld\næ"
+    assert result.stderr == "warning\n"
+    assert result.returncode == 0
+
+
+def test_remote_process_iterate_and_spill():
+    channel = FakeChannel(
+        stdout=[b"a" * 100 + b"\n", b"b\n"], stderr=[b"failed\n"], exit_status=1
+    )
+
+    process = RemoteProcess(
+        channel=channel, command="cmd", cwd="/home/vagrant", spill_threshold=10
+    )
+
+    lines = list(process)
+
+    assert ("stdout", "a" * 100) in lines
+    assert ("stdout", "b") in lines
+    assert ("stderr", "failed") in lines
+    assert process.stdout.spilled
+    assert not process.stderr.spilled
+
+    with pytest.raises(pytest_vagrant.RunResultError):
+        process.wait()
+
+    # Only the end of the spilled output is kept in memory, the full output
+    # is in the file
+    result = process.result()
+    assert result.stdout == "a" * 7 + "\nb\n"
+    assert result.stderr == "failed\n"
+    assert result.stderr_path is None
+
+    try:
+        with open(result.stdout_path) as stdout_file:
+            assert stdout_file.read() == "a" * 100 + "\nb\n"
+    finally:
+        os.remove(result.stdout_path)
+
+
+def test_remote_process_pid():
+    channel = FakeChannel(stdout=[b"12", b"34\nhello\n"], stderr=[], exit_status=0)
+
+    process = RemoteProcess(
+        channel=channel, command="cmd", cwd="/home/vagrant", read_pid=True
+    )
+
+    result = process.wait()
+
+    assert process.pid == 1234
+    assert result.stdout == "hello\n"
@@ -0,0 +1,76 @@
+import shlex
+import subprocess
+import sys
+import time
+
+import pytest
+
+import pytest_vagrant
+
+
+def _python(code):
+    return "{} -c {}".format(shlex.quote(sys.executable), shlex.quote(code))
+
+
+def test_shell_run():
+    shell = pytest_vagrant.Shell()
+    assert shell.run(cmd=_python("print('hello')"), cwd=None) == "hello\n"
+
+    cmd = _python("import sys; sys.stderr.write('boom'); sys.exit(3)")
+    with pytest.raises(subprocess.CalledProcessError) as error:
+        shell.run(cmd=cmd, cwd=None)
+
+    assert isinstance(error.value, pytest_vagrant.ShellError)
+    assert error.value.returncode == 3
+    assert error.value.stderr == "boom"
+
+    result = shell.execute(cmd=cmd, cwd=None)
+    assert result.returncode == 3
+    assert result.stderr == "boom"
+
+
+def test_shell_timeout():
+    shell = pytest_vagrant.Shell(timeout=0.2)
+
+    start = time.monotonic()
+    with pytest.raises(subprocess.TimeoutExpired):
+        shell.run(cmd=_python("import time; time.sleep(10)"), cwd=None)
+
+    assert time.monotonic() - start < 5
+
+
+def test_shell_progress_callback():
+    shell = pytest_vagrant.Shell()
+    events = []
+    lines = []
+
+    code = (
+        "print('1583406926,default,ui,info,Booting VM...'); "
+        "print('1583406926,default,state,running')"
+    )
+
+    shell.run(
+        cmd=_python(code),
+        cwd=None,
+        stdout_callback=lines.append,
+        progress_callback=events.append,
+    )
+
+    assert lines == [
+        "1583406926,default,ui,info,Booting VM...",
+        "1583406926,default,state,running",
+    ]
+    assert [event.kind for event in events] == ["ui", "state"]
+    assert events[1].data == ["running"]
+
+
+def test_shell_submit():
+    shell = pytest_vagrant.Shell(workers=2)
+
+    futures = [
+        shell.submit(cmd=_python("print({})".format(index)), cwd=None)
+        for index in range(4)
+    ]
+
+    assert [future.result() for future in futures] == ["0\n", "1\n", "2\n", "3\n"]
+    shell.close()
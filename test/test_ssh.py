@@ -0,0 +1,178 @@
+import mock
+import os
+import time
+
+import paramiko
+import pytest
+
+import pytest_vagrant
+from pytest_vagrant import sync
+import ssh_server
+
+
+@pytest.fixture
+def ssh_config(testdirectory):
+    server = ssh_server.SSHServer(root=testdirectory.mkdir("home").path())
+
+    yield pytest_vagrant.ssh_config.SSHConfig(
+        hostname="127.0.0.1",
+        username="vagrant",
+        port=server.port,
+        identityfile=server.identityfile,
+    )
+
+    server.close()
+
+
+def test_run_many_start_fails(ssh_config):
+    with pytest_vagrant.SSH(ssh_config=ssh_config) as ssh:
+        start = ssh.start
+        started = []
+
+        def fail_second(**kwargs):
+            if started:
+                raise paramiko.SSHException("Unable to open channel")
+            started.append(start(**kwargs))
+            return started[0]
+
+        with mock.patch.object(ssh, "start", side_effect=fail_second):
+            with pytest.raises(paramiko.SSHException):
+                ssh.run_many(["sleep 30", "true"], read_only=True)
+
+        # The command started first was killed and its channel closed
+        process = started[0]
+        assert process.channel.closed
+
+        deadline = time.monotonic() + 5
+        while _alive(process.pid):
+            assert time.monotonic() < deadline
+            time.sleep(0.05)
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+
+    # A zombie is dead, it only waits for the server to reap it
+    with open("/proc/{}/stat".format(pid)) as stat:
+        return stat.read().split(")")[-1].split()[0] != "Z"
+
+
+def test_put_get_dir_quoted(testdirectory, ssh_config):
+    source = testdirectory.mkdir("source")
+    source.write_text("hello.txt", data="hello", encoding="utf-8")
+
+    back = testdirectory.mkdir("back")
+
+    with pytest_vagrant.SSH(ssh_config=ssh_config) as ssh:
+        ssh.put_dir(local_dir=source.path(), rename_as="my dir; true")
+        assert ssh.is_file("my dir; true/hello.txt")
+
+        ssh.get_dir("my dir; true", back.path())
+
+    with open(os.path.join(back.path(), "my dir; true", "hello.txt")) as hello:
+        assert hello.read() == "hello"
+
+
+def test_sync_manifests_persist(testdirectory, ssh_config):
+    source = testdirectory.mkdir("source")
+    source.write_text("hello.txt", data="hello", encoding="utf-8")
+    source.mkdir("sub dir").write_text("a.txt", data="a", encoding="utf-8")
+
+    # File names sha256sum escapes
+    source.write_text("back\\slash.txt", data="b", encoding="utf-8")
+    source.write_text("new\nline.txt", data="n", encoding="utf-8")
+
+    files = sorted(["hello.txt", "sub dir/a.txt", "back\\slash.txt", "new\nline.txt"])
+    path = os.path.join(testdirectory.path(), "sync_manifests.json")
+    on_change = mock.Mock()
+
+    def ssh():
+        return pytest_vagrant.SSH(
+            ssh_config=ssh_config,
+            sync_manifests=sync.ManifestCache(path),
+            on_change=on_change,
+        )
+
+    with ssh() as first:
+        result = first.sync(local_dir=source.path(), remote_dir="my dir")
+        assert result.uploaded == files
+        assert on_change.called
+
+    # The uploaded files are hashed on the remote
+    with ssh() as second:
+        result = second.sync(local_dir=source.path(), remote_dir="my dir")
+        assert result.unchanged == files
+
+    on_change.reset_mock()
+
+    # A new SSH object reuses the hashes of the earlier syncs on both sides
+    # and does not mark the machine as changed
+    with ssh() as third:
+        with mock.patch.object(sync, "file_hash") as file_hash:
+            with mock.patch.object(third, "run", wraps=third.run) as run:
+                result = third.sync(local_dir=source.path(), remote_dir="my dir")
+
+        assert file_hash.call_count == 0
+        assert run.call_count == 1
+        assert result.unchanged == files
+        assert not on_change.called
+
+
+@pytest.mark.parametrize("channels", [1, 3])
+def test_put_get_file_verified(testdirectory, ssh_config, monkeypatch, channels):
+    # Download in several readv batches
+    monkeypatch.setattr(pytest_vagrant.transfer, "READV_BATCH", 2)
+
+    data = os.urandom(5 * pytest_vagrant.transfer.CHUNK_SIZE + 1)
+    local_file = os.path.join(testdirectory.path(), "data.bin")
+
+    with open(local_file, "wb") as data_file:
+        data_file.write(data)
+
+    download_dir = testdirectory.mkdir("download").path()
+
+    with pytest_vagrant.SSH(ssh_config=ssh_config) as ssh:
+        stats = ssh.put_file(
+            local_file=local_file,
+            rename_as="my data; true",
+            channels=channels,
+            verify=True,
+        )
+        assert stats.channels == channels
+
+        stats = ssh.get_file(
+            remote_file="my data; true",
+            local_directory=download_dir,
+            rename_as="data.bin",
+            channels=channels,
+            verify=True,
+        )
+        assert stats.channels == channels
+
+    with open(os.path.join(download_dir, "data.bin"), "rb") as data_file:
+        assert data_file.read() == data
+
+
+def test_put_file_reuses_sftp(testdirectory, ssh_config):
+    local_file = os.path.join(testdirectory.path(), "small.txt")
+
+    with open(local_file, "w") as small_file:
+        small_file.write("hello")
+
+    with pytest_vagrant.SSH(ssh_config=ssh_config) as ssh:
+        from_transport = paramiko.SFTPClient.from_transport
+
+        # A single channel transfer uses the connection's SFTP client
+        with mock.patch.object(
+            paramiko.SFTPClient, "from_transport", side_effect=from_transport
+        ) as opened:
+            ssh.put_file(local_file=local_file)
+            ssh.get_file(
+                remote_file="small.txt",
+                local_directory=testdirectory.mkdir("download").path(),
+            )
+
+        assert opened.call_count == 0
@@ -0,0 +1,61 @@
+import mock
+
+from pytest_vagrant import sync
+
+REMOTE_MANIFEST = """
+2cf24dba5fb0a30e26e83b2ac5b9e29e1b161e5c1fa7425e73043362938b9824  ./a.txt
+0000000000000000000000000000000000000000000000000000000000000000  ./sub/b.txt
+1111111111111111111111111111111111111111111111111111111111111111 *./old.txt
+""".strip()
+
+
+def test_sync_manifest(testdirectory):
+    testdirectory.write_text("a.txt", data="hello", encoding="utf-8")
+    testdirectory.mkdir("sub").write_text("b.txt", data="world", encoding="utf-8")
+
+    local = sync.local_manifest(local_dir=testdirectory.path())
+
+    assert sorted(local.keys()) == ["a.txt", "sub/b.txt"]
+    assert local["a.txt"]["size"] == 5
+    assert local["a.txt"]["sha256"] == (
+        "2cf24dba5fb0a30e26e83b2ac5b9e29e1b161e5c1fa7425e73043362938b9824"
+    )
+
+    # Unchanged files are not hashed again
+    with mock.patch.object(sync, "file_hash") as file_hash:
+        assert sync.local_manifest(testdirectory.path(), previous=local) == local
+        assert not file_hash.called
+
+    remote = sync.parse_remote_manifest(output=REMOTE_MANIFEST)
+    assert sorted(remote.keys()) == ["a.txt", "old.txt", "sub/b.txt"]
+
+    changed, removed, unchanged = sync.diff(local=local, remote=remote)
+    assert changed == ["sub/b.txt"]
+    assert removed == ["old.txt"]
+    assert unchanged == ["a.txt"]
+
+
+def test_sync_remote_manifest():
+    output = "5 1650000000.1234567890 a.txt\0" "3 1650000001.0000000000 new\nline\0"
+    remote = sync.parse_remote_stat(output=output)
+
+    assert remote == {
+        "a.txt": {"size": 5, "mtime": "1650000000.1234567890"},
+        "new\nline": {"size": 3, "mtime": "1650000001.0000000000"},
+    }
+
+    # Only the files whose metadata changed are hashed again
+    previous = {
+        "a.txt": {"size": 5, "mtime": "1650000000.1234567890", "sha256": "aa"},
+        "new\nline": {"size": 3, "mtime": "1650000000.0000000000", "sha256": "bb"},
+    }
+
+    assert sync.reuse_remote_hashes(remote=remote, previous=previous) == ["new\nline"]
+    assert remote["a.txt"]["sha256"] == "aa"
+
+    # sha256sum escapes backslashes and newlines in the names
+    output = "\\" + "c" * 64 + "  new\\nline\n" + "\\" + "d" * 64 + "  back\\\\slash\n"
+    assert sync.parse_remote_manifest(output=output) == {
+        "new\nline": {"sha256": "c" * 64},
+        "back\\slash": {"sha256": "d" * 64},
+    }
@@ -0,0 +1,39 @@
+import os
+import stat
+
+import pytest
+
+from pytest_vagrant import tar_stream
+
+
+def _make_tree(testdirectory):
+    source = testdirectory.mkdir("source")
+    source.write_text("a.txt", data="hello", encoding="utf-8")
+    script = source.mkdir("bin").write_text(
+        "run.sh", data="#!/bin/sh\n", encoding="utf-8"
+    )
+    os.chmod(script, 0o755)
+    source.mkdir("data").write_binary(
+        "big.bin", data=os.urandom(3 * tar_stream.CHUNK_SIZE + 7)
+    )
+    return source
+
+
+@pytest.mark.parametrize("compress", [False, True])
+def test_tar_stream_roundtrip(testdirectory, compress):
+    source = _make_tree(testdirectory)
+    target = testdirectory.mkdir("target")
+
+    chunks = tar_stream.tar_chunks(local_dir=source.path())
+    if compress:
+        chunks = tar_stream.gzip_chunks(chunks=chunks)
+
+    tar_stream.extract_chunks(chunks=chunks, local_dir=target.path(), compress=compress)
+
+    for path in ["a.txt", "bin/run.sh", "data/big.bin"]:
+        with open(os.path.join(source.path(), path), "rb") as expected:
+            with open(os.path.join(target.path(), path), "rb") as actual:
+                assert expected.read() == actual.read()
+
+    mode = os.stat(os.path.join(target.path(), "bin", "run.sh")).st_mode
+    assert stat.S_IMODE(mode) == 0o755
@@ -0,0 +1,120 @@
+import csv
+import json
+import os
+import threading
+
+import pytest_vagrant
+
+
+def test_shell_operation():
+    shell_operation = pytest_vagrant.timing.shell_operation
+
+    assert shell_operation("vagrant up") == "vagrant up"
+    assert shell_operation("vagrant status --machine-readable") == "vagrant status"
+    assert (
+        shell_operation("vagrant snapshot restore reset") == "vagrant snapshot restore"
+    )
+
+
+def test_timing_measure():
+    events = []
+
+    def listener(operation, seconds, depth):
+        events.append((operation, depth))
+
+    pytest_vagrant.timing.add_listener(listener)
+
+    try:
+        with pytest_vagrant.timing.measure("outer"):
+            with pytest_vagrant.timing.measure("inner"):
+                pass
+    finally:
+        pytest_vagrant.timing.remove_listener(listener)
+
+    assert events == [("inner", 1), ("outer", 0)]
+
+    # Without listeners nothing is recorded
+    with pytest_vagrant.timing.measure("outer"):
+        pass
+
+    assert len(events) == 2
+
+
+def test_timing_report(testdirectory, fake_machine):
+    report = pytest_vagrant.TimingReport()
+    machine = fake_machine(cwd=testdirectory.path())
+
+    pytest_vagrant.timing.add_listener(report)
+
+    try:
+        report.test = "test_a"
+        report.when = "setup"
+        machine.snapshot_restore("reset")
+        report.when = "call"
+        machine.halt()
+    finally:
+        pytest_vagrant.timing.remove_listener(report)
+
+    operations = report.operations()
+    assert operations["machine snapshot restore"]["count"] == 1
+    assert operations["machine halt"]["count"] == 1
+
+    # The vagrant commands run by the fake shell are not timed, so only the
+    # machine operations show up
+    tests = report.tests()
+    assert set(tests["test_a"]) == {"setup", "call"}
+
+    assert report.summary()[0].startswith("operation")
+
+    json_path = os.path.join(testdirectory.path(), "timings.json")
+    report.write(json_path)
+
+    with open(json_path) as json_file:
+        data = json.load(json_file)
+
+    assert len(data["events"]) == 2
+    assert "test_a" in data["tests"]
+
+    csv_path = os.path.join(testdirectory.path(), "timings.csv")
+    report.write(csv_path)
+
+    with open(csv_path, newline="") as csv_file:
+        rows = list(csv.DictReader(csv_file))
+
+    assert [row["operation"] for row in rows] == [
+        "machine snapshot restore",
+        "machine halt",
+    ]
+
+
+def test_timing_report_background():
+    report = pytest_vagrant.TimingReport()
+
+    pytest_vagrant.timing.add_listener(report)
+
+    def prepare():
+        with pytest_vagrant.timing.measure("vagrant from_box"):
+            pass
+
+    try:
+        report.test = "test_a"
+        report.when = "call"
+
+        with pytest_vagrant.timing.measure("ssh run"):
+            # E.g. the BootScheduler preparing the next test's machine
+            worker = threading.Thread(target=prepare)
+            worker.start()
+            worker.join()
+    finally:
+        pytest_vagrant.timing.remove_listener(report)
+
+    background, foreground = report.events
+    assert background["operation"] == "vagrant from_box"
+    assert background["when"] == "background"
+    assert background["test"] is None
+    assert background["depth"] == 0
+
+    # Only the test thread's operations are charged to the test
+    assert report.tests() == {"test_a": {"call": foreground["seconds"]}}
+    assert report.background() == background["seconds"]
+    assert report.summary()[-1].startswith("background work")
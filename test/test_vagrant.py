@@ -1,8 +1,10 @@
 import os
+import json
 import mock
 import pytest
 
 import pytest_vagrant
+from stub_vagrant import STATUS
 
 # Note: These tests sometimes fail if the boxes have become inaccessible
 # (check 'VBoxManage list vms' output, if you are running these tests as root
@@ -49,6 +51,210 @@ def _test_vagrant_from_box(testdirectory):
     print(str(machine.mock_calls))
 
 
+def _machine_factory_mock(testdirectory):
+    def build(box, name, version):
+        machine = mock.Mock()
+        machine.cwd = testdirectory.path()
+        machine.status.not_created = False
+        machine.status.poweroff = False
+        machine.snapshot_list.return_value = ["reset"]
+        return machine
+
+    return mock.Mock(side_effect=build)
+
+
+def test_vagrant_prune_policy(testdirectory):
+    prune = mock.call(cmd="vagrant global-status --prune", cwd=None)
+
+    shell = mock.Mock()
+    vagrant = pytest_vagrant.Vagrant(
+        machine_factory=_machine_factory_mock(testdirectory), shell=shell
+    )
+
+    vagrant.from_box(box="hashicorp/bionic64", name="pytest_vagrant")
+    vagrant.from_box(box="hashicorp/bionic64", name="pytest_vagrant")
+    assert shell.run.call_args_list == [prune]
+
+    shell = mock.Mock()
+    vagrant = pytest_vagrant.Vagrant(
+        machine_factory=_machine_factory_mock(testdirectory),
+        shell=shell,
+        prune_policy=pytest_vagrant.PrunePolicy.ALWAYS,
+    )
+
+    vagrant.from_box(box="hashicorp/bionic64", name="pytest_vagrant")
+    vagrant.from_box(box="hashicorp/bionic64", name="pytest_vagrant")
+    assert shell.run.call_args_list == [prune, prune]
+
+    # A vagrant command failing because of stale state triggers a prune and
+    # a retry
+    machine_factory = _machine_factory_mock(testdirectory)
+    failing_machine = _failing_machine(
+        testdirectory,
+        stderr="VBoxManage: error: Could not find a registered machine with UUID",
+    )
+    build = machine_factory.side_effect
+    machine_factory.side_effect = [failing_machine, build(None, None, None)]
+
+    shell = mock.Mock()
+    vagrant = pytest_vagrant.Vagrant(
+        machine_factory=machine_factory,
+        shell=shell,
+        prune_policy=pytest_vagrant.PrunePolicy.ON_ERROR,
+    )
+
+    vagrant.from_box(box="hashicorp/bionic64", name="pytest_vagrant")
+    assert shell.run.call_args_list == [prune]
+
+    with pytest.raises(ValueError):
+        pytest_vagrant.Vagrant(
+            machine_factory=machine_factory, shell=shell, prune_policy="sometimes"
+        )
+
+
+def _failing_machine(testdirectory, stderr):
+    machine = mock.Mock()
+    machine.cwd = testdirectory.path()
+    machine.status = pytest_vagrant.machine_status.MachineStatus(status="not_created")
+    machine.up.side_effect = pytest_vagrant.errors.ShellError(
+        runresult=pytest_vagrant.RunResult(
+            command="vagrant up",
+            cwd=machine.cwd,
+            stdout="",
+            stderr=stderr,
+            returncode=1,
+        )
+    )
+    return machine
+
+
+def test_vagrant_no_retry(testdirectory):
+    failing_machine = _failing_machine(
+        testdirectory, stderr="The SSH command responded with a non-zero exit status."
+    )
+
+    shell = mock.Mock()
+    vagrant = pytest_vagrant.Vagrant(
+        machine_factory=mock.Mock(return_value=failing_machine),
+        shell=shell,
+        prune_policy=pytest_vagrant.PrunePolicy.ON_ERROR,
+    )
+
+    # A provisioning error is reported without pruning and booting again
+    with pytest.raises(pytest_vagrant.errors.ShellError):
+        vagrant.from_box(box="hashicorp/bionic64", name="pytest_vagrant")
+
+    failing_machine.up.assert_called_once_with()
+    assert not shell.run.called
+
+
+def test_vagrant_lifecycle(testdirectory):
+    machine_factory = _machine_factory_mock(testdirectory)
+    build = machine_factory.side_effect
+
+    def build_saved(box, name, version):
+        machine = build(box, name, version)
+        machine.status = pytest_vagrant.machine_status.MachineStatus(status="saved")
+        return machine
+
+    machine_factory.side_effect = build_saved
+
+    vagrant = pytest_vagrant.Vagrant(
+        machine_factory=machine_factory,
+        shell=mock.Mock(),
+        lifecycle_policy=pytest_vagrant.LifecyclePolicy.SUSPEND,
+    )
+
+    machine = vagrant.from_box(box="hashicorp/bionic64", name="pytest_vagrant")
+    machine.resume.assert_called_once_with()
+    assert not machine.up.called
+
+    machine.status = pytest_vagrant.machine_status.MachineStatus(status="running")
+    vagrant.shutdown()
+    machine.suspend.assert_called_once_with()
+
+    # The machines are only shut down once
+    vagrant.shutdown()
+    assert machine.suspend.call_count == 1
+
+
+def test_vagrant_from_boxes(testdirectory):
+    machine_factory = _machine_factory_mock(testdirectory)
+    build = machine_factory.side_effect
+
+    def build_or_fail(box, name, version):
+        machine = build(box, name, version)
+        machine.name = name
+        if name == "broken":
+            machine.snapshot_list.side_effect = RuntimeError("broken box")
+        return machine
+
+    machine_factory.side_effect = build_or_fail
+
+    shell = mock.Mock()
+    vagrant = pytest_vagrant.Vagrant(machine_factory=machine_factory, shell=shell)
+
+    names = ["server", "client1", "client2"]
+    machines = vagrant.from_boxes(
+        [{"box": "hashicorp/bionic64", "name": name} for name in names], workers=2
+    )
+    assert [machine.name for machine in machines] == names
+
+    with pytest.raises(pytest_vagrant.FromBoxesError) as e:
+        vagrant.from_boxes(
+            [
+                {"box": "hashicorp/bionic64", "name": "server"},
+                {"box": "hashicorp/bionic64", "name": "broken"},
+            ]
+        )
+
+    assert e.value.machines[0].name == "server"
+    assert e.value.machines[1] is None
+    assert e.value.failures[0][0] == 1
+
+    # We only prune once per session
+    assert shell.run.call_count == 1
+
+
+def test_file_lock(testdirectory):
+    path = os.path.join(testdirectory.path(), "machine.lock")
+
+    first = pytest_vagrant.FileLock(path=path)
+    second = pytest_vagrant.FileLock(path=path)
+
+    with first:
+        assert first.locked
+        assert not second.acquire(blocking=False)
+
+    assert second.acquire(blocking=False)
+    second.release()
+
+
+def test_vagrant_lease_clones(testdirectory):
+    machine_factory = pytest_vagrant.MachineFactory(
+        shell=mock.Mock(), machines_dir=testdirectory.path(), ssh_factory=mock.Mock()
+    )
+
+    first = pytest_vagrant.Vagrant(
+        machine_factory=machine_factory, shell=mock.Mock(), lease_clones=True
+    )
+    second = pytest_vagrant.Vagrant(
+        machine_factory=machine_factory, shell=mock.Mock(), lease_clones=True
+    )
+
+    lease = dict(box="hashicorp/bionic64", name="pytest_vagrant", box_version=None)
+
+    assert first._lease(**lease) == "pytest_vagrant_0"
+    assert first._lease(**lease) == "pytest_vagrant_0"
+    assert second._lease(**lease) == "pytest_vagrant_1"
+
+    first.release()
+    second.release()
+
+    assert second._lease(**lease) == "pytest_vagrant_0"
+    second.release()
+
+
 SNAPSHOT_NOT_CREATED = r"""
 1583404006,default,metadata,provider,virtualbox
 1583404006,default,ui,info,==> default: VM not created. Moving on...
@@ -90,21 +296,174 @@ def test_machine_snapshot_list():
     assert result == ["reset"]
 
 
-STATUS = r"""
-1583408799,default,metadata,provider,virtualbox
-1583408799,default,provider-name,virtualbox
-1583408799,default,state,running
-1583408799,default,state-human-short,running
-1583408799,default,state-human-long,The VM is running. To stop this VM%!(VAGRANT_COMMA) you can run `vagrant halt` to\nshut it down forcefully%!(VAGRANT_COMMA) or you can run `vagrant suspend` to simply\nsuspend the virtual machine. In either case%!(VAGRANT_COMMA) to restart it again%!(VAGRANT_COMMA)\nsimply run `vagrant up`.
-1583408799,,ui,info,Current machine states:\n\ndefault                   running (virtualbox)\n\nThe VM is running. To stop this VM%!(VAGRANT_COMMA) you can run `vagrant halt` to\nshut it down forcefully%!(VAGRANT_COMMA) or you can run `vagrant suspend` to simply\nsuspend the virtual machine. In either case%!(VAGRANT_COMMA) to restart it again%!(VAGRANT_COMMA)\nsimply run `vagrant up`.
-""".strip()
-
-
 def test_parse_status():
     result = pytest_vagrant.parse.to_status(output=STATUS)
     assert result.status == "running"
 
 
+def test_machine_status_cache():
+
+    def run(cmd, cwd):
+        if cmd == "vagrant ssh-config":
+            return OUTPUT_SSHCONFIG
+        return STATUS
+
+    shell = mock.Mock()
+    shell.run.side_effect = run
+
+    machine = pytest_vagrant.Machine(
+        box="hashicorp/bionic64",
+        name="pytest_vagrant",
+        version=None,
+        slug="slug",
+        cwd="/tmp/slug",
+        shell=shell,
+        ssh_factory=mock.Mock(),
+    )
+
+    machine.ssh()
+    assert shell.run.call_count == 2
+    shell.run.assert_any_call(cmd="vagrant status --machine-readable", cwd="/tmp/slug")
+
+    machine.refresh()
+    assert machine.status.running
+    assert shell.run.call_count == 3
+
+    machine.up()
+    assert machine.status.running
+    assert shell.run.call_count == 5
+
+
+GLOBAL_STATUS = r"""
+1583408799,,metadata,machine-count,2
+1583408799,,machine-id,2a8f3c1
+1583408799,,provider-name,virtualbox
+1583408799,,machine-home,/tmp/slug_a
+1583408799,,state,running
+1583408799,,machine-id,7d1e9b0
+1583408799,,provider-name,virtualbox
+1583408799,,machine-home,/tmp/slug_b
+1583408799,,state,poweroff
+1583408799,,ui,info,id       name    provider   state    directory
+""".strip()
+
+
+def test_parse_global_status():
+    statuses = pytest_vagrant.parse.to_global_status(output=GLOBAL_STATUS)
+
+    assert statuses["/tmp/slug_a"].running
+    assert statuses["/tmp/slug_b"].poweroff
+
+
+def test_status_index():
+    shell = mock.Mock()
+    shell.run.return_value = GLOBAL_STATUS
+
+    status_index = pytest_vagrant.StatusIndex(shell=shell)
+
+    machines = [
+        pytest_vagrant.Machine(
+            box="hashicorp/bionic64",
+            name=name,
+            version=None,
+            slug=slug,
+            cwd=os.path.join("/tmp", slug),
+            shell=shell,
+            ssh_factory=mock.Mock(),
+            status_index=status_index,
+        )
+        for name, slug in [("a", "slug_a"), ("b", "slug_b")]
+    ]
+
+    assert machines[0].status.running
+    assert machines[1].status.poweroff
+    shell.run.assert_called_once_with(
+        cmd="vagrant global-status --machine-readable", cwd=None
+    )
+
+    # A lifecycle call rebuilds the index on the next lookup
+    machines[1].up()
+    assert machines[1].status.poweroff
+    assert machines[0].status.running
+    assert shell.run.call_count == 3
+
+    # Machines not in the index fall back to 'vagrant status'
+    shell.run.return_value = STATUS
+    missing = pytest_vagrant.Machine(
+        box="hashicorp/bionic64",
+        name="c",
+        version=None,
+        slug="slug_c",
+        cwd="/tmp/slug_c",
+        shell=shell,
+        ssh_factory=mock.Mock(),
+        status_index=status_index,
+    )
+    assert missing.status.running
+    shell.run.assert_called_with(
+        cmd="vagrant status --machine-readable", cwd="/tmp/slug_c"
+    )
+
+
+def test_machine_dirty(testdirectory):
+    def run(cmd, cwd):
+        if cmd == "vagrant ssh-config":
+            return OUTPUT_SSHCONFIG
+        return STATUS
+
+    shell = mock.Mock()
+    shell.run.side_effect = run
+
+    machine = pytest_vagrant.Machine(
+        box="hashicorp/bionic64",
+        name="pytest_vagrant",
+        version=None,
+        slug="slug",
+        cwd=testdirectory.path(),
+        shell=shell,
+        ssh_factory=pytest_vagrant.SSH,
+    )
+
+    # We do not know the state of an existing machine
+    assert machine.dirty
+
+    machine.snapshot_restore("reset")
+    assert machine.clean_snapshot() == "reset"
+
+    ssh = machine.ssh()
+    ssh.connection = mock.Mock()
+    ssh.connection.cwd = "/home/vagrant"
+
+    ssh.start("uname -a", read_only=True)
+    assert not machine.dirty
+
+    ssh.start("touch file")
+    assert machine.dirty
+
+
+def test_machine_ssh_factory(testdirectory):
+    shell = mock.Mock()
+    shell.run.side_effect = lambda cmd, cwd: (
+        OUTPUT_SSHCONFIG if cmd == "vagrant ssh-config" else STATUS
+    )
+
+    def ssh_factory(ssh_config, on_connect_error, on_change, sync_manifests):
+        return ssh_config
+
+    machine = pytest_vagrant.Machine(
+        box="hashicorp/bionic64",
+        name="pytest_vagrant",
+        version=None,
+        slug="slug",
+        cwd=testdirectory.path(),
+        shell=shell,
+        ssh_factory=ssh_factory,
+    )
+
+    # The ssh_pool is only passed when used
+    assert machine.ssh().hostname == "127.0.0.1"
+
+
 def test_run(vagrant, testdirectory):
     machine = vagrant.from_box(
         box="hashicorp/bionic64", name="pytest_vagrant", reset=False
@@ -141,8 +500,9 @@ def test_run(vagrant, testdirectory):
 
         file_path = testdirectory.write_text("test.txt", data="hello", encoding="utf-8")
 
-        ssh.put_file(local_file=file_path)
+        stats = ssh.put_file(local_file=file_path, verify=True)
         assert ssh.is_file("test.txt") == True
+        assert stats.size == 5
 
         ssh.run('echo " vagrant" >> test.txt')
 
@@ -153,6 +513,21 @@ def test_run(vagrant, testdirectory):
         assert ssh.is_file("test.txt") == False
 
 
+def test_split_ranges():
+    chunk = pytest_vagrant.transfer.CHUNK_SIZE
+
+    assert pytest_vagrant.transfer.split_ranges(size=0, parts=4) == [(0, 0)]
+    assert pytest_vagrant.transfer.split_ranges(size=10, parts=4) == [(0, 10)]
+
+    ranges = pytest_vagrant.transfer.split_ranges(size=10 * chunk + 1, parts=4)
+    assert len(ranges) == 4
+    assert ranges[0] == (0, 10 * chunk // 4 + 1)
+    assert sum(length for _, length in ranges) == 10 * chunk + 1
+
+    for (offset, length), (next_offset, _) in zip(ranges, ranges[1:]):
+        assert offset + length == next_offset
+
+
 def test_run_fail(vagrant):
     machine = vagrant.from_box(
         box="hashicorp/bionic64", name="pytest_vagrant", reset=False
@@ -163,6 +538,49 @@ def test_run_fail(vagrant):
             ssh.run("some_nonexisting_cmd")
 
 
+def test_run_many(vagrant):
+    machine = vagrant.from_box(
+        box="hashicorp/bionic64", name="pytest_vagrant", reset=False
+    )
+
+    with machine.ssh() as ssh:
+        results = ssh.run_many(["echo first", "sleep 1; echo second"])
+        results[0].match(stdout="first")
+        results[1].match(stdout="second")
+
+        server = ssh.start("sleep 60")
+        assert server.poll() is None
+        server.kill()
+        assert server.wait(check=False).returncode != 0
+
+
+def test_put_get_dir(vagrant, testdirectory):
+    machine = vagrant.from_box(
+        box="hashicorp/bionic64", name="pytest_vagrant", reset=False
+    )
+
+    source = testdirectory.mkdir("tree")
+    source.write_text("a.txt", data="hello", encoding="utf-8")
+    source.mkdir("sub").write_text("b.txt", data="world", encoding="utf-8")
+
+    with machine.ssh() as ssh:
+        ssh.put_dir(local_dir=source.path(), compress=True)
+        assert ssh.is_file("tree/sub/b.txt")
+
+        back = testdirectory.mkdir("back")
+        ssh.get_dir("tree", back.path())
+        assert back.contains_file("tree/sub/b.txt")
+
+        result = ssh.sync(local_dir=source.path(), remote_dir="tree")
+        assert result.unchanged == ["a.txt", "sub/b.txt"]
+
+        source.write_text("c.txt", data="new", encoding="utf-8")
+        result = ssh.sync(local_dir=source.path(), remote_dir="tree")
+        assert result.uploaded == ["c.txt"]
+
+        ssh.run("rm -rf tree")
+
+
 UBUNTU_TWEAK = """
 v.customize ["modifyvm", :id, "--uartmode1", "file", File::NULL]
 """.strip()
@@ -231,3 +649,129 @@ def test_box_version(vagrant):
     # Check that version is in Vagrantfile template
     with open(versioned_vagrantfile) as f:
         assert VERSION_SPECIFICATION in f.read()
+
+
+def test_machine_data(testdirectory):
+
+    machine_dir = testdirectory.mkdir("machine")
+    index_dir = testdirectory.mkdir("index")
+
+    machine_index = pytest_vagrant.MachineIndex(
+        path=os.path.join(index_dir.path(), "index")
+    )
+    machine_data = pytest_vagrant.MachineData(
+        cwd=machine_dir.path(), machine_index=machine_index
+    )
+
+    # Nothing on disk means Vagrant never created the machine
+    assert machine_data.status().not_created
+    assert machine_data.id() is None
+    assert not machine_index.needs_prune()
+
+    provider_dir = machine_dir.mkdir(".vagrant/machines/default/virtualbox")
+    provider_dir.write_text("id", data="vbox-id", encoding="utf-8")
+    provider_dir.write_text("index_uuid", data="abc", encoding="utf-8")
+    provider_dir.write_text("private_key", data="key", encoding="utf-8")
+
+    assert machine_data.provider() == "virtualbox"
+    assert machine_data.id() == "vbox-id"
+    assert machine_data.private_key() == os.path.join(
+        provider_dir.path(), "private_key"
+    )
+
+    # The machine is not in the index so we cannot tell the state
+    assert machine_data.status() is None
+
+    index = {
+        "version": 1,
+        "machines": {
+            "abc": {
+                "local_data_path": os.path.join(machine_dir.path(), ".vagrant"),
+                "vagrantfile_path": machine_dir.path(),
+                "name": "default",
+                "provider": "virtualbox",
+                "state": "running",
+            }
+        },
+    }
+    index_dir.write_text("index", data=json.dumps(index), encoding="utf-8")
+
+    assert machine_data.status().running
+    assert not machine_index.needs_prune()
+
+    index["machines"]["def"] = {
+        "local_data_path": "/does/not/exist/.vagrant",
+        "vagrantfile_path": "/does/not/exist",
+    }
+    index_dir.write_text("index", data=json.dumps(index), encoding="utf-8")
+
+    assert machine_index.needs_prune()
+
+
+def test_ssh_config_cache(testdirectory):
+
+    machine_dir = testdirectory.mkdir("machine")
+    cache = pytest_vagrant.SSHConfigCache(cwd=machine_dir.path())
+
+    ssh_config = pytest_vagrant.parse.to_ssh_config(output=OUTPUT_SSHCONFIG)
+
+    # We cannot cache anything before the machine has been created
+    cache.store(ssh_config)
+    assert cache.load() is None
+
+    machine_dir.write_text("Vagrantfile", data="vagrantfile", encoding="utf-8")
+    provider_dir = machine_dir.mkdir(".vagrant/machines/default/virtualbox")
+    provider_dir.write_text("id", data="vbox-id", encoding="utf-8")
+
+    cache.store(ssh_config)
+    result = cache.load()
+    assert result.hostname == "127.0.0.1"
+    assert result.port == 2222
+    assert result.identityfile == "/home/mvp/.pytest_vagrant/private_key"
+
+    # Changing the Vagrantfile invalidates the cache
+    machine_dir.write_text("Vagrantfile", data="changed", encoding="utf-8")
+    assert cache.load() is None
+
+    cache.store(ssh_config)
+    assert cache.load() is not None
+
+    cache.invalidate()
+    assert cache.load() is None
+
+
+def test_ssh_pool():
+
+    def connect(ssh_config):
+        connection = mock.Mock()
+        connection.cwd = "/home/vagrant"
+        connection.ssh_client.get_transport.return_value.is_active.return_value = True
+        return connection
+
+    connect = mock.Mock(side_effect=connect)
+    pool = pytest_vagrant.SSHPool(connect=connect)
+
+    ssh_config = pytest_vagrant.parse.to_ssh_config(output=OUTPUT_SSHCONFIG)
+
+    with pytest_vagrant.SSH(ssh_config=ssh_config, ssh_pool=pool) as ssh:
+        ssh.connection.cwd = "/tmp"
+
+    with pytest_vagrant.SSH(ssh_config=ssh_config, ssh_pool=pool) as ssh:
+        # Each lease gets its own working directory
+        assert ssh.getcwd() == "/home/vagrant"
+
+    # An equal SSHConfig maps to the same pooled connection
+    same_config = pytest_vagrant.parse.to_ssh_config(output=OUTPUT_SSHCONFIG)
+    pool.acquire(ssh_config=same_config)
+
+    assert connect.call_count == 1
+    assert len(pool) == 1
+
+    pool.evict(ssh_config=ssh_config)
+    assert len(pool) == 0
+
+    pool.acquire(ssh_config=ssh_config)
+    assert connect.call_count == 2
+
+    pool.close()
+    assert len(pool) == 0